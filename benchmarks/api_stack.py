@@ -0,0 +1,95 @@
+"""
+Per-request cost of the full middleware stack vs the lean API stack.
+
+    python -m benchmarks.api_stack
+    python -m benchmarks.api_stack --requests 2000
+
+Boots the app in-process like ``benchmarks.loadtest.server`` (fake Mongo
+collections, throwaway SQLite) and calls two WSGI applications directly with
+the same environ: Django's ``WSGIHandler`` (every route through the full
+``MIDDLEWARE``) and ``SplitStackWSGIHandler`` (API routes through
+``API_MIDDLEWARE``).  Reports the median wall time per request for a few
+cheap API routes, where middleware overhead is a visible share of the
+request, and one page as a control.
+"""
+
+import argparse
+import io
+import json
+import logging
+import statistics
+import time
+from wsgiref.util import setup_testing_defaults
+
+from benchmarks.loadtest.server import PASSWORD, setup_app, user_email
+
+
+def environ_for(path, headers=None, method="GET"):
+    environ = {"REQUEST_METHOD": method, "PATH_INFO": path, "wsgi.input": io.BytesIO(b"")}
+    environ.update({"HTTP_" + name.upper().replace("-", "_"): value for name, value in (headers or {}).items()})
+    setup_testing_defaults(environ)
+    return environ
+
+
+def call(app, environ):
+    status = []
+    body = b"".join(app(dict(environ, **{"wsgi.input": io.BytesIO(b"")}), lambda s, h, *a: status.append(s)))
+    return status[0], body
+
+
+def seconds_per_request(apps, environ, requests):
+    """Median seconds per request for each app; calls alternate between the apps so drift hits both alike."""
+    samples = [[] for _ in apps]
+    for _ in range(requests):
+        for app, times in zip(apps, samples):
+            start = time.perf_counter()
+            call(app, environ)
+            times.append(time.perf_counter() - start)
+    return [statistics.median(times) for times in samples]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500, help="Requests measured per route and stack.")
+    args = parser.parse_args()
+
+    setup_app(smtp_port=0, users=1)
+    from django.conf import settings
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test import Client
+    from loginapp.api_stack import SplitStackWSGIHandler
+
+    settings.ALLOWED_HOSTS = ["*"]
+    logging.getLogger("django.request").setLevel(logging.ERROR)   # every 401/403 would log a warning
+    access = Client().post(
+        "/login", {"email": user_email(0), "password": PASSWORD}, content_type="application/json"
+    ).json()["access"]
+    bearer = {"Authorization": f"Bearer {access}"}
+    routes = {
+        "GET /me": environ_for("/me", bearer),
+        "GET /me (no token)": environ_for("/me"),
+        "GET /metrics (no token)": environ_for("/metrics"),
+        "GET /login.html (page)": environ_for("/login.html"),
+    }
+    full, split = WSGIHandler(), SplitStackWSGIHandler()
+    for environ in routes.values():
+        assert call(full, environ)[0] == call(split, environ)[0]
+
+    rows = []
+    for name, environ in routes.items():
+        seconds_per_request((full, split), environ, 50)   # warm-up
+        before, after = seconds_per_request((full, split), environ, args.requests)
+        rows.append({
+            "route": name, "full_us": round(before * 1e6, 1), "lean_us": round(after * 1e6, 1),
+            "saved_us": round((before - after) * 1e6, 1), "saved_pct": round((before - after) / before * 100, 1),
+        })
+
+    print(f"{'route':<24} {'full':>10} {'lean':>10} {'saved':>10}")
+    for row in rows:
+        print(f"{row['route']:<24} {row['full_us']:>8}us {row['lean_us']:>8}us "
+              f"{row['saved_us']:>8}us ({row['saved_pct']}%)")
+    print(json.dumps({"api_middleware": settings.API_MIDDLEWARE, "routes": rows}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Leaderboard benchmark with synthetic users.
+
+    python -m benchmarks.leaderboard_bench --users 1000000
+
+Compares the Fenwick-tree leaderboard with sorting every user's score per
+request (what a naive ``/leaderboard`` would do).
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from loginapp.leaderboard import Leaderboard
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "p50_us": statistics.median(samples) * 1e6,
+        "p99_us": samples[int(len(samples) * 0.99) - 1] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--max-score", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    users = [f"user{i}@example.com" for i in range(args.users)]
+    # Skewed like real cohorts: most learners have low totals.
+    scores = {user: min(int(rng.expovariate(1 / 800)), args.max_score) for user in users}
+
+    board = Leaderboard(args.max_score)
+    start = time.perf_counter()
+    board.bulk_load(scores)
+    print(f"bulk_load      {args.users:>9,} users   {time.perf_counter() - start:8.2f} s")
+
+    picks = [rng.choice(users) for _ in range(args.queries)]
+    start = time.perf_counter()
+    for user in picks:
+        board.update(user, rng.randint(0, args.max_score))
+    elapsed = time.perf_counter() - start
+    print(f"update         {args.queries:>9,} ops     {elapsed / args.queries * 1e6:8.2f} us/op")
+
+    it = iter(picks * 2)
+    result = timed(lambda: board.rank(next(it)), args.queries)
+    print(f"rank           p50 {result['p50_us']:8.2f} us   p99 {result['p99_us']:8.2f} us")
+
+    result = timed(lambda: board.top(20), 1000)
+    print(f"top(20)        p50 {result['p50_us']:8.2f} us   p99 {result['p99_us']:8.2f} us")
+
+    offsets = iter([rng.randrange(args.users - 20) for _ in range(1000)])
+    result = timed(lambda: board.top(20, next(offsets)), 1000)
+    print(f"top(20, deep)  p50 {result['p50_us']:8.2f} us   p99 {result['p99_us']:8.2f} us")
+
+    # Most learners still at 0: deep pages land inside one huge tie.
+    tied = Leaderboard(args.max_score)
+    tied.bulk_load({user: score if i % 10 == 0 else 0 for i, (user, score) in enumerate(scores.items())})
+    offsets = iter([rng.randrange(args.users // 10, args.users - 20) for _ in range(1000)])
+    result = timed(lambda: tied.top(20, next(offsets)), 1000)
+    print(f"top(20, tie)   p50 {result['p50_us']:8.2f} us   p99 {result['p99_us']:8.2f} us")
+
+    current = dict(board._scores)
+    result = timed(lambda: sorted(current.items(), key=lambda kv: -kv[1])[:20], 5)
+    print(f"naive sort     p50 {result['p50_us'] / 1000:8.2f} ms   (per request, for comparison)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Load test for the auth API, fully offline.
+
+    python -m benchmarks.loadtest --rate 10 --duration 30 --output run.json
+    python -m benchmarks.loadtest --mix login=60,me=40 --rate 20
+    python -m benchmarks.loadtest --faults '{"mongo": {"latency_ms": {"p50": 50, "p99": 500}}, "smtp": {"timeout_rate": 0.2}}'
+
+Starts a local SMTP sink, boots the app in a child process against fake
+Mongo collections (``benchmarks.loadtest.server``), warms up, then offers a
+fixed arrival rate of /signup, /login, /me, /refresh, /send-otp,
+/reset-password and /logout requests.  Prints (and optionally writes) a JSON report with
+throughput, p50/p95/p99 latency and error rate per endpoint.  ``--faults``
+runs the app with fault injection enabled and those rules active, to
+measure tail latency under a slow or failing Mongo / SMTP.
+"""
+
+import argparse
+import asyncio
+import json
+import uuid
+
+from benchmarks.loadtest.generator import DEFAULT_MIX, Scenario, run_open_loop
+from benchmarks.loadtest.harness import running_app
+from loginapp.faults import validate
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r}; choose from {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def parse_faults(text):
+    try:
+        return validate(json.loads(text))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rate", type=float, default=10, help="Requests started per second.")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds.")
+    parser.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds before the run.")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. login=40,me=30,signup=5")
+    parser.add_argument("--users", type=int, default=2000, help="Users seeded into the fake collection.")
+    parser.add_argument("--threads", type=int, default=16, help="Server threads.")
+    parser.add_argument("--poisson", action="store_true", help="Poisson arrivals instead of evenly spaced.")
+    parser.add_argument("--max-inflight", type=int, default=2000)
+    parser.add_argument("--faults", type=parse_faults, help="Fault injection rules (JSON, see loginapp/faults.py).")
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+
+    env = {"FAULT_INJECTION_ENABLED": "1", "FAULT_INJECTION": json.dumps(args.faults)} if args.faults else None
+    with running_app(args.users, args.threads, env) as (port, sink):
+        scenario = Scenario(port, sink, args.users, uuid.uuid4().hex[:8])
+        if args.warmup:
+            asyncio.run(run_open_loop(scenario, args.rate, args.warmup, args.mix, args.max_inflight, args.poisson))
+        stats = asyncio.run(run_open_loop(scenario, args.rate, args.duration, args.mix, args.max_inflight, args.poisson))
+
+    report = {
+        "config": {"rate": args.rate, "duration_s": args.duration, "mix": args.mix, "users": args.users,
+                   "threads": args.threads, "poisson": args.poisson, "faults": args.faults},
+        **stats.report(args.duration),
+        "smtp_messages": sink.messages,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+In-process stand-in for the pymongo collections the auth API uses.
+
+Implements just what ``loginapp`` calls on ``LOGIN_COLLECTION``,
+``RESET_OTP_COLLECTION``, ``REFRESH_FAMILY_COLLECTION`` and
+``AUDIT_COLLECTION`` -- ``find_one`` (equality filters, ``sort``),
+``insert_one`` / ``insert_many``, and ``update_one`` / ``update_many`` /
+``find_one_and_update`` with ``$set`` -- with a hash index on ``email`` so
+lookups stay O(1) however many users are seeded.  ``PROGRESS_COLLECTION``
+gets ``FakeProgressCollection``, which knows the progress sync's update
+operators and the leaderboard's aggregation.  Both are capacity-testing
+fixtures, not a general Mongo emulator.
+"""
+
+import copy
+import threading
+
+import pymongo.errors
+from bson import ObjectId
+from bson.timestamp import Timestamp
+
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+
+
+class UpdateResult:
+    def __init__(self, matched):
+        self.matched_count = self.modified_count = matched
+
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+        self._docs = {}        # _id -> document
+        self._by_email = {}    # email -> [_id, ...] in insertion order
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _candidates(self, query):
+        email = query.get("email")
+        if isinstance(email, str):
+            return [self._docs[i] for i in self._by_email.get(email, ())]
+        if "_id" in query:
+            doc = self._docs.get(query["_id"])
+            return [doc] if doc is not None else []
+        return list(self._docs.values())
+
+    @staticmethod
+    def _matches(doc, query):
+        return all(doc.get(key) == value for key, value in query.items())
+
+    def find_one(self, query=None, sort=None, **kwargs):
+        query = query or {}
+        with self._lock:
+            found = [doc for doc in self._candidates(query) if self._matches(doc, query)]
+        for key, direction in reversed(sort or []):
+            found.sort(key=lambda doc: doc.get(key), reverse=direction < 0)
+        return copy.deepcopy(found[0]) if found else None
+
+    def insert_one(self, document):
+        document = copy.deepcopy(document)
+        document.setdefault("_id", ObjectId())
+        with self._lock:
+            self._docs[document["_id"]] = document
+            if "email" in document:
+                self._by_email.setdefault(document["email"], []).append(document["_id"])
+        return InsertOneResult(document["_id"])
+
+    def insert_many(self, documents, ordered=True):
+        for document in documents:
+            document.setdefault("_id", ObjectId())   # like pymongo, which sets _id on the caller's dicts
+        return InsertManyResult([self.insert_one(document).inserted_id for document in documents])
+
+    def update_one(self, query, update):
+        return UpdateResult(0 if self.find_one_and_update(query, update) is None else 1)
+
+    def update_many(self, query, update):
+        with self._lock:
+            matched = [doc for doc in self._candidates(query) if self._matches(doc, query)]
+            for doc in matched:
+                doc.update(copy.deepcopy(update.get("$set", {})))
+        return UpdateResult(len(matched))
+
+    def find_one_and_update(self, query, update, projection=None, return_document=False, **kwargs):
+        with self._lock:
+            for doc in self._candidates(query):
+                if self._matches(doc, query):
+                    before = copy.deepcopy(doc)
+                    doc.update(copy.deepcopy(update.get("$set", {})))
+                    return copy.deepcopy(doc) if return_document else before
+        return None
+
+
+class FakeProgressCollection:
+    """One progress document per user: the sync's clock guard, dotted $set/$max, $addToSet and $currentDate."""
+
+    name = "learner_progress"
+
+    def __init__(self):
+        self.docs = {}
+        self.ticks = 0
+        self._lock = threading.Lock()
+
+    def find_one(self, query, projection=None):
+        with self._lock:
+            return copy.deepcopy(self.docs.get(query["_id"]))
+
+    def find_one_and_update(self, query, update, upsert=False, return_document=False):
+        with self._lock:
+            return self._update(query, update)
+
+    def _update(self, query, update):
+        clock_path, condition = next((k, v) for k, v in query.items() if k != "_id")
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"]})
+        if self._get(doc, clock_path) is not None and self._get(doc, clock_path) >= condition["$not"]["$gte"]:
+            raise pymongo.errors.DuplicateKeyError("E11000 duplicate key")
+        for path, value in update.get("$set", {}).items():
+            self._put(doc, path, copy.deepcopy(value))
+        for path, value in update["$max"].items():
+            current = self._get(doc, path)
+            self._put(doc, path, value if current is None else max(current, value))
+        for field, values in update.get("$addToSet", {}).items():
+            target = doc.setdefault(field, [])
+            target.extend(value for value in values["$each"] if value not in target)
+        self.ticks += 1
+        for path in update["$currentDate"]:
+            self._put(doc, path, Timestamp(1_700_000_000, self.ticks))
+        return copy.deepcopy(doc)
+
+    def aggregate(self, pipeline):
+        """The leaderboard's totals; only its leading ``{$match: {version: {$gt: since}}}`` is interpreted."""
+        since = pipeline[0].get("$match", {}).get("version", {}).get("$gt")
+        with self._lock:
+            return [
+                {"_id": doc["_id"], "total": sum(doc.get("challenge_scores", {}).values()), "version": doc.get("version")}
+                for doc in self.docs.values() if since is None or doc.get("version", since) > since
+            ]
+
+    @staticmethod
+    def _get(doc, path):
+        for part in path.split("."):
+            doc = doc.get(part) if isinstance(doc, dict) else None
+        return doc
+
+    @staticmethod
+    def _put(doc, path, value):
+        *parents, last = path.split(".")
+        for part in parents:
+            doc = doc.setdefault(part, {})
+        doc[last] = value
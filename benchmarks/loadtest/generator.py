@@ -0,0 +1,204 @@
+"""
+Open-loop asyncio load generator for the auth API.
+
+Requests are started on a fixed schedule (``rate`` per second, evenly spaced
+or Poisson) whether or not earlier ones have finished, and latency is
+measured from each request's *scheduled* start, so a stalled server shows
+up as latency instead of silently lowering the offered load.
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, deque
+
+from benchmarks.loadtest.server import PASSWORD, user_email
+
+DEFAULT_MIX = {"login": 35, "me": 30, "refresh": 10, "logout": 8, "signup": 5, "send-otp": 6, "reset-password": 6}
+
+
+async def http(port, method, path, body=None, token=None, timeout=10.0):
+    """Minimal HTTP/1.1 client (one connection per request); returns ``(status, json_body)``."""
+    payload = json.dumps(body).encode() if body is not None else b""
+    head = [f"{method} /{path} HTTP/1.1", f"Host: 127.0.0.1:{port}", "Connection: close",
+            f"Content-Length: {len(payload)}"]
+    if body is not None:
+        head.append("Content-Type: application/json")
+    if token:
+        head.append(f"Authorization: Bearer {token}")
+
+    async def exchange():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + payload)
+            raw = await reader.read()
+        finally:
+            writer.close()
+        header, _, content = raw.partition(b"\r\n\r\n")
+        status = int(header.split(b" ", 2)[1])
+        try:
+            return status, json.loads(content) if content else None
+        except ValueError:
+            return status, None
+
+    return await asyncio.wait_for(exchange(), timeout)
+
+
+class Scenario:
+    """Client-side state that lets each endpoint be called with valid inputs."""
+
+    def __init__(self, port, sink, users, run_id):
+        self.port = port
+        self.sink = sink
+        self.passwords = {user_email(i): PASSWORD for i in range(users)}
+        self.emails = list(self.passwords)
+        self.tokens = deque(maxlen=5000)           # (access, refresh) from successful logins
+        self.busy = set()                          # emails in a send-otp -> reset flow
+        self.awaiting_otp = deque()
+        self.otp_sent_at = {}
+        self.new_users = itertools.count()
+        self.resets = itertools.count()
+        self.run_id = run_id
+
+    def _free_email(self):
+        for _ in range(5):
+            email = random.choice(self.emails)
+            if email not in self.busy:
+                return email
+        return None
+
+    async def access_token(self):
+        """A valid access token, logging a user in first if none has been issued yet."""
+        if not self.tokens:
+            await self.call("login")
+        return random.choice(self.tokens)[0] if self.tokens else None
+
+    async def call(self, endpoint):
+        """Run one ``endpoint`` request; returns ``(endpoint actually called, status)``."""
+        if endpoint == "me" and self.tokens:
+            status, _ = await http(self.port, "GET", "me", token=random.choice(self.tokens)[0])
+            return endpoint, status
+
+        if endpoint == "refresh" and self.tokens:
+            _, refresh = self.tokens.popleft()
+            status, body = await http(self.port, "POST", "refresh", {"refresh": refresh})
+            if status == 200:
+                self.tokens.append((body["access"], body["refresh"]))
+            return endpoint, status
+
+        if endpoint == "logout" and self.tokens:
+            _, refresh = self.tokens.popleft()
+            status, _ = await http(self.port, "POST", "logout", {"refresh": refresh})
+            return endpoint, status
+
+        if endpoint == "signup":
+            n = next(self.new_users)
+            status, _ = await http(self.port, "POST", "signup", {
+                "email": f"new{n}-{self.run_id}@load.test", "username": f"new{n}", "password": PASSWORD,
+            })
+            return endpoint, status
+
+        if endpoint == "send-otp":
+            email = self._free_email()
+            if email and time.monotonic() - self.otp_sent_at.get(email, -1e9) > 61:
+                self.busy.add(email)
+                self.otp_sent_at[email] = time.monotonic()
+                status, _ = await http(self.port, "POST", "send-otp", {"email": email})
+                if status == 200:
+                    self.awaiting_otp.append(email)
+                else:
+                    self.busy.discard(email)
+                return endpoint, status
+
+        if endpoint == "reset-password" and self.awaiting_otp:
+            email = self.awaiting_otp.popleft()
+            otp = self.sink.take_otp(email)
+            if otp is not None:
+                new_password = f"{PASSWORD}-{next(self.resets)}"
+                status, _ = await http(self.port, "POST", "reset-password",
+                                       {"email": email, "otp": otp, "password": new_password})
+                if status == 200:
+                    self.passwords[email] = new_password
+                self.busy.discard(email)
+                return endpoint, status
+            self.awaiting_otp.append(email)   # mail not delivered yet
+
+        # "login", or any endpoint whose prerequisite is not available yet.
+        email = self._free_email() or random.choice(self.emails)
+        status, body = await http(self.port, "POST", "login", {"email": email, "password": self.passwords[email]})
+        if status == 200:
+            self.tokens.append((body["access"], body["refresh"]))
+        return "login", status
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+
+    def record(self, endpoint, status, seconds):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        self.statuses.setdefault(endpoint, Counter())[status] += 1
+
+    @staticmethod
+    def _summary(latencies, statuses, duration):
+        ordered = sorted(latencies)
+        errors = sum(count for status, count in statuses.items() if not 200 <= status < 400)
+
+        def pct(p):
+            return round(ordered[min(int(len(ordered) * p), len(ordered) - 1)] * 1000, 2)
+
+        return {
+            "requests": len(ordered),
+            "throughput_rps": round(len(ordered) / duration, 1),
+            "errors": errors,
+            "error_rate": round(errors / len(ordered), 4),
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+            "status_counts": {str(status): count for status, count in sorted(statuses.items())},
+        }
+
+    def report(self, duration):
+        endpoints = {
+            name: self._summary(self.latencies[name], self.statuses[name], duration)
+            for name in sorted(self.latencies)
+        }
+        everything = [s for values in self.latencies.values() for s in values]
+        totals = sum((statuses for statuses in self.statuses.values()), Counter())
+        return {"endpoints": endpoints, "total": self._summary(everything, totals, duration) if everything else {}}
+
+
+async def run_open_loop(scenario, rate, duration, mix, max_inflight=2000, poisson=False, stats=None):
+    """Offer ``rate`` requests/s for ``duration`` seconds; returns :class:`Stats`."""
+    stats = stats or Stats()
+    names, weights = list(mix), list(mix.values())
+    inflight = set()
+    loop = asyncio.get_running_loop()
+
+    async def one(endpoint, scheduled):
+        try:
+            called, status = await scenario.call(endpoint)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            called, status = endpoint, 0   # connection refused / reset / timed out
+        stats.record(called, status, loop.time() - scheduled)
+
+    start = loop.time()
+    scheduled = start
+    while scheduled - start < duration:
+        scheduled += random.expovariate(rate) if poisson else 1 / rate
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        endpoint = random.choices(names, weights)[0]
+        if len(inflight) >= max_inflight:
+            stats.record(endpoint, 0, 0.0)   # generator saturated: count as an error, not a silent skip
+            continue
+        task = asyncio.create_task(one(endpoint, scheduled))
+        inflight.add(task)
+        task.add_done_callback(inflight.discard)
+    if inflight:
+        await asyncio.wait(inflight)
+    return stats
@@ -0,0 +1,48 @@
+"""Start/stop the SMTP sink and the app server child process for a benchmark run."""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from benchmarks.loadtest.smtp_sink import SMTPSink
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, proc, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited with code {proc.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit("server did not start listening in time")
+
+
+@contextmanager
+def running_app(users, threads, env=None):
+    """Yield ``(port, sink)`` for an app booted by ``benchmarks.loadtest.server``; ``env`` adds variables."""
+    sink = SMTPSink().start()
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.loadtest.server", "--port", str(port),
+         "--smtp-port", str(sink.port), "--users", str(users), "--threads", str(threads)],
+        env=dict(os.environ, PYTHONUNBUFFERED="1", **(env or {})), stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port, server)
+        yield port, sink
+    finally:
+        server.terminate()
+        server.wait()
+        sink.stop()
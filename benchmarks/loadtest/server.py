@@ -0,0 +1,105 @@
+"""
+Boots the Django app for a load test: fake Mongo collections, a throwaway
+SQLite database (token blacklist), email pointed at the SMTP sink.
+
+    python -m benchmarks.loadtest.server --port 8765 --smtp-port 2525 --users 2000
+
+Runs under gunicorn (one worker, since the fake collections live in that
+worker's memory, with ``--threads`` threads) when gunicorn is installed, and
+under a threading wsgiref server otherwise.
+"""
+
+import argparse
+import os
+import socketserver
+import tempfile
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from benchmarks.loadtest.fake_mongo import FakeCollection, FakeProgressCollection
+
+PASSWORD = "LoadTest#2024"
+
+
+def user_email(i):
+    return f"user{i}@load.test"
+
+
+def setup_app(smtp_port, users):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "loginlogout.settings")
+    os.environ["MONGO_URI"] = "mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=1"   # never used
+    os.environ.setdefault("SCHEDULER_ENABLED", "0")   # the fake collections cannot hold the lease
+
+    from django.conf import settings
+    settings.DATABASES["default"]["NAME"] = os.path.join(tempfile.mkdtemp(prefix="tclforge-load-"), "db.sqlite3")
+
+    import django
+    django.setup()
+    from django.contrib.auth.hashers import make_password
+    from django.core.management import call_command
+    from loginapp.api_stack import get_wsgi_application
+    from django.utils import timezone
+    from loginapp.mongo_guard import GuardedCollection
+
+    call_command("migrate", verbosity=0, interactive=False)
+    settings.EMAIL_HOST, settings.EMAIL_PORT = "127.0.0.1", smtp_port
+    settings.EMAIL_USE_TLS, settings.EMAIL_HOST_PASSWORD = False, None
+    settings.LOGIN_COLLECTION = GuardedCollection(FakeCollection("Login"))
+    settings.RESET_OTP_COLLECTION = GuardedCollection(FakeCollection("password_reset_otp"))
+    settings.PROGRESS_COLLECTION = GuardedCollection(FakeProgressCollection())
+    settings.REFRESH_FAMILY_COLLECTION = GuardedCollection(FakeCollection("refresh_token_families"))
+    settings.AUDIT_COLLECTION = GuardedCollection(FakeCollection("audit_events"))
+
+    hashed = make_password(PASSWORD)   # one PBKDF2 run, shared by every seeded user
+    for i in range(users):
+        settings.LOGIN_COLLECTION.insert_one({
+            "_id": f"seed-{i}", "email": user_email(i), "username": f"user{i}",
+            "password": hashed, "created_at": timezone.now(),
+        })
+
+    from loginapp import faults
+    faults.install()   # re-wrap the fake collections when FAULT_INJECTION_ENABLED=1
+    return get_wsgi_application()
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def serve(app, port, threads):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print(f"gunicorn not installed; serving on :{port} with wsgiref", flush=True)
+        make_server("127.0.0.1", port, app, _ThreadingWSGIServer, _QuietHandler).serve_forever()
+        return
+
+    class Standalone(BaseApplication):
+        def load_config(self):
+            for key, value in {"bind": f"127.0.0.1:{port}", "workers": 1, "threads": threads,
+                               "worker_class": "gthread", "backlog": 2048, "loglevel": "warning"}.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Standalone().run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--smtp-port", type=int, required=True)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+    serve(setup_app(args.smtp_port, args.users), args.port, args.threads)
+
+
+if __name__ == "__main__":
+    main()
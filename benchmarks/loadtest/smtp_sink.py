@@ -0,0 +1,84 @@
+"""
+Local SMTP sink: accepts every message, keeps the last OTP per recipient.
+
+Speaks just enough SMTP for ``smtplib`` (no STARTTLS, no AUTH), so the app
+must run with ``EMAIL_USE_TLS = False`` pointed at it.
+"""
+
+import re
+import socketserver
+import threading
+
+OTP_RE = re.compile(rb"OTP for password reset is: (\d{6})")
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 tclforge-sink ESMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line[:4].upper()
+            if verb in (b"EHLO", b"HELO"):
+                self.reply("250-tclforge-sink")
+                self.reply("250 8BITMIME")
+            elif verb == b"MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == b"RCPT":
+                recipients.append(line.split(b"<", 1)[-1].split(b">", 1)[0].decode().lower())
+                self.reply("250 OK")
+            elif verb == b"DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                body = []
+                for data_line in iter(self.rfile.readline, b""):
+                    if data_line in (b".\r\n", b".\n"):
+                        break
+                    body.append(data_line)
+                self.server.sink.deliver(recipients, b"".join(body))
+                self.reply("250 OK queued")
+            elif verb == b"QUIT":
+                self.reply("221 Bye")
+                return
+            else:  # RSET, NOOP, ...
+                self.reply("250 OK")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    def __init__(self, host="127.0.0.1", port=0):
+        self._server = _Server((host, port), _SMTPHandler)
+        self._server.sink = self
+        self.port = self._server.server_address[1]
+        self.messages = 0
+        self.otps = {}   # recipient -> last OTP seen
+        self._lock = threading.Lock()
+
+    def deliver(self, recipients, body):
+        match = OTP_RE.search(body)
+        with self._lock:
+            self.messages += 1
+            for recipient in recipients:
+                if match:
+                    self.otps[recipient] = match.group(1).decode()
+
+    def take_otp(self, recipient):
+        with self._lock:
+            return self.otps.pop(recipient.lower(), None)
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="smtp-sink", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
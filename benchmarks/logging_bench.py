@@ -0,0 +1,79 @@
+"""
+Per-request logging overhead at high request rates.
+
+    python -m benchmarks.logging_bench --threads 8 --requests 200000
+
+Each simulated request emits one access record and one app record from a
+pool of threads, the way request threads do in a gunicorn worker.  Compares
+the queued JSON pipeline from ``loginapp.log_pipeline`` with a synchronous
+``RotatingFileHandler`` and with logging disabled.  Reported times are what
+the *request thread* spends in ``logger.info``.
+"""
+
+import argparse
+import logging
+import statistics
+import tempfile
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from loginapp.log_pipeline import JsonFormatter, QueuedFileHandler
+
+
+def emit_requests(logger, count, samples):
+    extra = {"method": "POST", "path": "/login", "route": "login", "status": 200,
+             "duration_ms": 3.2, "bytes": 512, "remote_addr": "10.0.0.7"}
+    for i in range(count):
+        start = time.perf_counter()
+        logger.info("%s %s %s", "POST", "/login", 200, extra=extra)
+        logger.info("login ok for user %d", i)
+        samples.append(time.perf_counter() - start)
+
+
+def run(name, handler, threads, requests):
+    logger = logging.getLogger(f"bench.{name}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO if handler else logging.WARNING)
+    if handler:
+        logger.addHandler(handler)
+
+    per_thread = requests // threads
+    samples = [[] for _ in range(threads)]
+    workers = [threading.Thread(target=emit_requests, args=(logger, per_thread, samples[i])) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    wall = time.perf_counter() - start
+    if handler:
+        handler.close()   # drains the queue for the queued pipeline
+    drained = time.perf_counter() - start
+
+    flat = sorted(s for thread_samples in samples for s in thread_samples)
+    print(f"{name:<10} {statistics.median(flat) * 1e6:8.2f} us p50  "
+          f"{flat[int(len(flat) * 0.99) - 1] * 1e6:8.2f} us p99  "
+          f"{per_thread * threads / wall:10,.0f} req/s  (all written after {drained:.2f} s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        run("disabled", None, args.threads, args.requests)
+
+        sync = RotatingFileHandler(tmp / "sync.jsonl", maxBytes=20 * 1024 * 1024, backupCount=5)
+        sync.setFormatter(JsonFormatter())
+        run("sync", sync, args.threads, args.requests)
+
+        run("queued", QueuedFileHandler(tmp / "queued.jsonl"), args.threads, args.requests)
+
+
+if __name__ == "__main__":
+    main()
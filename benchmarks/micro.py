@@ -0,0 +1,243 @@
+"""
+Microbenchmarks for the auth hot paths, with stored baselines.
+
+    python -m benchmarks.micro run                 # print results
+    python -m benchmarks.micro run --save          # overwrite benchmarks/baselines/micro.json
+    python -m benchmarks.micro compare             # exit 1 if anything is >20% slower than baseline
+    python -m benchmarks.micro compare --tolerance 0.1 --only token
+
+Each benchmark is calibrated to run ~0.2 s per repeat; the reported figure is
+the median time per call over the repeats.  Baselines are only meaningful
+on the machine that recorded them, so the stored file notes the host and
+``compare`` warns when it differs.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BASELINE = Path(__file__).resolve().parent / "baselines" / "micro.json"
+BENCHMARKS = {}
+
+
+def bench(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+# =====================================================
+# 🔹 BENCHMARKS (each returns the zero-argument callable to time)
+# =====================================================
+def _hasher_benchmarks():
+    from django.conf import settings
+    from django.contrib.auth.hashers import check_password, make_password
+    from django.utils.module_loading import import_string
+
+    for path in settings.PASSWORD_HASHERS:
+        algorithm = import_string(path).algorithm
+        try:
+            encoded = make_password("Tcl#Forge2024", hasher=algorithm)
+        except ValueError:
+            continue   # optional library (argon2-cffi, bcrypt) not installed
+        bench(f"make_password[{algorithm}]")(lambda a=algorithm: lambda: make_password("Tcl#Forge2024", hasher=a))
+        bench(f"check_password[{algorithm}]")(lambda e=encoded: lambda: check_password("Tcl#Forge2024", e))
+
+
+@bench("RefreshToken()")
+def _refresh_token():
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    def mint():
+        token = RefreshToken()
+        token["email"] = "dev@example.com"
+        return token
+    return mint
+
+
+@bench("RefreshToken.access_token")
+def _access_token():
+    from rest_framework_simplejwt.tokens import RefreshToken
+    token = RefreshToken()
+    token["email"] = "dev@example.com"
+    return lambda: str(token.access_token)
+
+
+@bench("token validation")
+def _validate_token():
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.tokens import RefreshToken
+    token = RefreshToken()
+    token["email"] = "dev@example.com"
+    raw = str(token.access_token).encode()
+    auth = JWTAuthentication()
+    return lambda: auth.get_validated_token(raw)
+
+
+@bench("User.validate_strong_password")
+def _strong_password():
+    from loginapp.models import User
+    user = User(email="dev@example.com")
+    return lambda: user.validate_strong_password("Tcl#Forge2024")
+
+
+@bench("DRF Response render")
+def _drf_response():
+    from rest_framework.renderers import JSONRenderer
+    from rest_framework.response import Response
+    payload = {"username": "dev", "email": "dev@example.com", "created_at": "2024-01-01 10:00:00"}
+
+    def render():
+        response = Response(payload, status=200)
+        response.accepted_renderer = JSONRenderer()
+        response.accepted_media_type = "application/json"
+        response.renderer_context = {}
+        return response.render()
+    return render
+
+
+def _json_benchmarks():
+    """Serialization cost per response: DRF's stdlib renderer vs ``loginapp.json_api``."""
+    from datetime import datetime, timezone
+    from rest_framework.negotiation import DefaultContentNegotiation
+    from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from loginapp import json_api
+
+    bodies = {
+        "error": {"error": "Invalid credentials"},
+        "profile": {"username": "dev", "email": "dev@example.com", "created_at": "2024-01-01 10:00:00"},
+        "leaderboard": {"total_users": 2000, "offset": 0, "entries": [
+            {"rank": i + 1, "username": f"user{i}", "score": 5000 - i, "updated_at": datetime(2024, 1, 1, tzinfo=timezone.utc)} for i in range(20)
+        ]},
+    }
+    stdlib, fast = JSONRenderer(), json_api.ORJSONRenderer()
+    for name, body in bodies.items():
+        bench(f"json render[{name}, stdlib]")(lambda b=body: lambda: stdlib.render(b, "application/json"))
+        bench(f"json render[{name}, orjson]")(lambda b=body: lambda: fast.render(b, "application/json"))
+    constant = json_api.constant(error="Invalid credentials")
+    bench("json render[error, constant]")(lambda: lambda: fast.render(constant, "application/json"))
+
+    request = Request(APIRequestFactory().get("/me", HTTP_ACCEPT="text/html,application/xhtml+xml,*/*;q=0.8"))
+    default, json_only = DefaultContentNegotiation(), json_api.JSONOnlyNegotiation()
+    renderers = [JSONRenderer(), BrowsableAPIRenderer()]
+    bench("negotiation[default]")(lambda: lambda: default.select_renderer(request, renderers))
+    bench("negotiation[json only]")(lambda: lambda: json_only.select_renderer(request, [fast]))
+
+
+def _template_benchmarks():
+    from django.conf import settings
+    from django.template.loader import render_to_string
+    from django.test import RequestFactory
+
+    request = RequestFactory().get("/")
+    for path in sorted(Path(settings.TEMPLATE_DIR).glob("*.html")):
+        bench(f"render[{path.name}]")(lambda n=path.name: lambda: render_to_string(n, request=request))
+
+
+# =====================================================
+# 🔹 RUNNER
+# =====================================================
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "loginlogout.settings")
+    import django
+    django.setup()
+    _hasher_benchmarks()
+    _json_benchmarks()
+    _template_benchmarks()
+
+
+def measure(fn, repeats, target=0.2):
+    """Median seconds per call over ``repeats`` runs of an auto-sized loop."""
+    fn()  # warm caches / lazy imports
+    loops, elapsed = 1, 0.0
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= target / 4 or loops >= 1 << 20:
+            break
+        loops *= 4
+    loops = max(1, int(loops * target / max(elapsed, 1e-9)))
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / loops)
+    return statistics.median(samples)
+
+
+def host():
+    return {"python": platform.python_version(), "machine": platform.machine(),
+            "processor": platform.processor() or platform.machine(), "cpus": os.cpu_count()}
+
+
+def run(only=None, repeats=5):
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if only and only not in name:
+            continue
+        results[name] = round(measure(setup(), repeats) * 1e6, 3)
+        print(f"  {name:<45} {results[name]:>12.2f} us", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Names of benchmarks slower than ``baseline * (1 + tolerance)``, printing a table."""
+    regressions = []
+    print(f"{'benchmark':<45} {'baseline':>12} {'now':>12} {'change':>8}")
+    for name, now in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<45} {'-':>12} {now:>10.2f}us {'new':>8}")
+            continue
+        change = now / before - 1
+        flag = "  REGRESSED" if change > tolerance else ""
+        print(f"{name:<45} {before:>10.2f}us {now:>10.2f}us {change:>+7.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("action", choices=["run", "compare"])
+    parser.add_argument("--only", help="Run benchmarks whose name contains this text.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.20, help="Allowed slowdown before failing (0.2 = 20%%).")
+    parser.add_argument("--save", action="store_true", help="Store the results as the new baseline.")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    args = parser.parse_args()
+
+    setup_django()
+    results = run(args.only, args.repeats)
+
+    if args.action == "run":
+        print(json.dumps(results, indent=2))
+        if args.save:
+            args.baseline.parent.mkdir(parents=True, exist_ok=True)
+            args.baseline.write_text(json.dumps({"host": host(), "results_us": results}, indent=2) + "\n")
+            print(f"Saved baseline to {args.baseline}", file=sys.stderr)
+        return
+
+    stored = json.loads(args.baseline.read_text())
+    if stored["host"] != host():
+        print(f"warning: baseline recorded on {stored['host']}, running on {host()}", file=sys.stderr)
+    regressions = compare(results, stored["results_us"], args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.tolerance:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Replay captured production traffic against a local build.
+
+    TRAFFIC_CAPTURE_ENABLED=1 gunicorn ...          # in production: writes logs/capture-<pid>.tsv
+    python -m benchmarks.replay logs/capture-*.tsv --speed 1
+    python -m benchmarks.replay logs/capture-*.tsv --speed 5 --output replay.json
+
+Boots the app the same way as ``benchmarks.loadtest`` (fake Mongo, SMTP
+sink, seeded users) and re-issues every captured request at its original
+offset divided by ``--speed``, so bursts and idle gaps keep their shape.
+The capture holds no bodies or credentials, so auth routes get fresh
+valid payloads from the load-test scenario, routes that need a login are
+sent with one of its access tokens, known POST routes get a minimal valid
+body and other requests a filler body of the recorded size.  Routes that
+cannot be replayed faithfully (``NOT_REPLAYABLE``) are left out and
+counted under ``not_replayable`` in the report.
+
+The report compares, per route, the recorded server time with the
+replayed latency (measured from each request's scheduled start).
+"""
+
+import argparse
+import asyncio
+import json
+import uuid
+from collections import Counter
+
+from benchmarks.loadtest.generator import Scenario, Stats, http
+from benchmarks.loadtest.harness import running_app
+from loginapp.traffic_capture import parse_line
+
+AUTH_ROUTES = {"login", "me", "refresh", "logout", "signup", "send-otp", "reset-password"}   # via Scenario.call
+AUTHENTICATED = {"leaderboard", "leaderboard/me", "progress/sync", "batch"}   # sent with a scenario access token
+
+
+def _progress_body(n):
+    return {"client_id": f"replay-{n}", "seq": 1,
+            "deltas": [{"field": "challenge_scores", "key": "gen-1", "value": n % 100}]}
+
+
+BODIES = {   # minimal valid body per POST route, from the request number
+    "progress/sync": _progress_body,
+    "check": lambda n: {"script": "puts hello"},
+    "batch": lambda n: {"requests": [{"path": "/me"}, {"path": "/leaderboard"}]},
+}
+# Not re-issued, but counted in the report: the chatbot needs the model
+# upstream, a password change would lock the scenario's user out, and the
+# observability endpoints need METRICS_TOKEN / DIAGNOSTICS_TOKEN.
+NOT_REPLAYABLE = {"chat", "auth-reset-password", "metrics", "debug/memory", "debug/faults", "debug/audit"}
+
+
+def load(paths, limit=None):
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            records += [r for r in map(parse_line, f) if r is not None]
+    records.sort(key=lambda r: r["epoch_ms"])
+    return records[:limit] if limit else records
+
+
+async def issue(scenario, record, n=0):
+    """Re-issue one captured request; returns ``(endpoint actually called, status)``."""
+    route = record["route"]
+    if route in AUTH_ROUTES:
+        # Falls back to another auth call (usually login) when it has no token or OTP to use.
+        return await scenario.call(route)
+    path = record["path"].lstrip("/")
+    token = await scenario.access_token() if route in AUTHENTICATED else None
+    if record["method"] in ("GET", "HEAD"):
+        status, _ = await http(scenario.port, record["method"], path, token=token)
+        return route, status
+    body = BODIES[route](n) if route in BODIES else {"pad": "x" * max((record["request_bytes"] or 0) - 11, 0)}
+    status, _ = await http(scenario.port, record["method"], path, body, token=token)
+    return route, status
+
+
+async def replay(scenario, records, speed):
+    """Returns ``(stats, seconds, {route: records skipped as not replayable})``."""
+    loop = asyncio.get_running_loop()
+    stats, skipped = Stats(), Counter()
+    start, first = loop.time(), records[0]["epoch_ms"]
+
+    async def one(record, scheduled, n):
+        try:
+            endpoint, status = await issue(scenario, record, n)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            endpoint, status = record["route"], 0
+        stats.record(endpoint, status, loop.time() - scheduled)
+
+    tasks = []
+    for n, record in enumerate(records):
+        if record["route"] in NOT_REPLAYABLE:
+            skipped[record["route"]] += 1
+            continue
+        scheduled = start + (record["epoch_ms"] - first) / 1000 / speed
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(record, scheduled, n)))
+    await asyncio.gather(*tasks)
+    return stats, loop.time() - start, dict(skipped)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)]
+
+
+def divergence(records, report):
+    recorded = {}
+    for record in records:
+        recorded.setdefault(record["route"], []).append(record["duration_ms"])
+    rows = {}
+    for route, replayed in report["endpoints"].items():
+        before = recorded.get(route)
+        if not before:
+            continue
+        row = {"recorded_p50_ms": round(percentile(before, 0.5), 2),
+               "recorded_p95_ms": round(percentile(before, 0.95), 2),
+               "replayed_p50_ms": replayed["p50_ms"], "replayed_p95_ms": replayed["p95_ms"],
+               "error_rate": replayed["error_rate"]}
+        row["p50_ratio"] = round(row["replayed_p50_ms"] / max(row["recorded_p50_ms"], 0.01), 2)
+        row["p95_ratio"] = round(row["replayed_p95_ms"] / max(row["recorded_p95_ms"], 0.01), 2)
+        rows[route] = row
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("capture", nargs="+", help="capture-<pid>.tsv file(s), e.g. from several workers or hosts.")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay N times faster than recorded.")
+    parser.add_argument("--limit", type=int, help="Replay only the first N requests.")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--output", help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+
+    records = load(args.capture, args.limit)
+    if not records:
+        raise SystemExit("No capture records found.")
+    with running_app(args.users, args.threads) as (port, sink):
+        scenario = Scenario(port, sink, args.users, uuid.uuid4().hex[:8])
+        stats, elapsed, skipped = asyncio.run(replay(scenario, records, args.speed))
+
+    span = (records[-1]["epoch_ms"] - records[0]["epoch_ms"]) / 1000
+    report = stats.report(max(elapsed, 1e-3))
+    result = {
+        "config": {"requests": len(records), "recorded_seconds": round(span, 2), "speed": args.speed,
+                   "replay_seconds": round(elapsed, 2)},
+        "divergence": divergence(records, report),
+        "not_replayable": skipped,
+        **report,
+    }
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+CPU cost of keeping a session alive for a day: re-login vs /refresh.
+
+    python -m benchmarks.session_cost
+    python -m benchmarks.session_cost --requests 50 --lifetimes 720,60,15,5
+
+Boots the app in-process exactly like ``benchmarks.loadtest.server`` (fake
+Mongo collections, throwaway SQLite), then measures the process CPU time of
+full ``/login`` requests (user lookup + PBKDF2 verify + minting) and of
+``/refresh`` requests (token verify + rotation + minting) through the whole
+middleware stack.  For each access-token lifetime it reports the CPU a
+session-day costs when every expiry means a new ``/login``, and when one
+``/login`` is followed by ``/refresh`` calls.  Mongo round-trip latency is
+not CPU and is not included.
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks.loadtest.server import PASSWORD, setup_app, user_email
+
+
+def cpu_per_request(client, path, body_for, requests):
+    """Median CPU seconds per request over ``requests`` calls; ``body_for(previous_json)`` builds each body."""
+    samples, previous = [], None
+    for _ in range(requests):
+        body = body_for(previous)
+        start = time.process_time()
+        response = client.post(f"/{path}", body, content_type="application/json")
+        samples.append(time.process_time() - start)
+        if response.status_code != 200:
+            raise SystemExit(f"/{path} answered {response.status_code}: {response.content[:200]!r}")
+        previous = response.json()
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=30, help="Requests measured per endpoint.")
+    parser.add_argument("--lifetimes", default="720,60,15,5", help="Access-token lifetimes to compare, in minutes.")
+    args = parser.parse_args()
+
+    setup_app(smtp_port=0, users=1)
+    from django.conf import settings
+    from django.test import Client
+    settings.USER_CACHE_ENABLED = False   # a login after an expiry rarely finds the user cached
+    client = Client()
+
+    credentials = {"email": user_email(0), "password": PASSWORD}
+    login = cpu_per_request(client, "login", lambda _: credentials, args.requests)
+    first = client.post("/login", credentials, content_type="application/json").json()
+    refresh = cpu_per_request(
+        client, "refresh", lambda previous: {"refresh": (previous or first)["refresh"]}, args.requests,
+    )
+
+    rows = []
+    for minutes in (int(m) for m in args.lifetimes.split(",")):
+        renewals = 24 * 60 / minutes
+        relogin = renewals * login
+        with_refresh = login + (renewals - 1) * refresh
+        rows.append({
+            "access_lifetime_min": minutes,
+            "renewals_per_day": round(renewals, 1),
+            "relogin_cpu_ms": round(relogin * 1000, 1),
+            "refresh_cpu_ms": round(with_refresh * 1000, 1),
+            "saved_cpu_ms": round((relogin - with_refresh) * 1000, 1),
+        })
+
+    print(f"{'lifetime':>9} {'renewals/day':>13} {'re-login':>12} {'refresh':>12} {'saved':>12}")
+    for row in rows:
+        print(f"{row['access_lifetime_min']:>7}min {row['renewals_per_day']:>13} {row['relogin_cpu_ms']:>10}ms "
+              f"{row['refresh_cpu_ms']:>10}ms {row['saved_cpu_ms']:>10}ms")
+    print(json.dumps({"login_cpu_ms": round(login * 1000, 3), "refresh_cpu_ms": round(refresh * 1000, 3),
+                      "session_day": rows}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
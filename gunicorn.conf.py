@@ -0,0 +1,12 @@
+"""
+Gunicorn settings (read from the working directory, or ``-c gunicorn.conf.py``).
+
+Each worker starts its job scheduler (:mod:`loginapp.scheduler`) as soon as
+it has loaded the app, so a worker that gets no traffic still runs its jobs.
+"""
+
+
+def post_worker_init(worker):
+    from loginapp import scheduler
+
+    scheduler.ensure_started()
@@ -0,0 +1,63 @@
+"""
+A lean middleware stack for the JSON API routes.
+
+The API views authenticate with a bearer JWT and never use the session,
+the CSRF cookie (DRF views are CSRF-exempt), ``django.contrib.auth``'s
+``request.user``, messages, or ``X-Frame-Options``.  ``SplitStackWSGIHandler``
+builds two middleware chains at startup and picks one per request by path:
+
+* paths of ``api_urlpatterns`` in ``ROOT_URLCONF`` run ``API_MIDDLEWARE``
+  (CORS, security headers and our instrumentation);
+* everything else (pages, notes, admin) runs the full ``MIDDLEWARE``.
+
+Routing is an exact set lookup on ``request.path_info``, so ``/login`` is
+lean and ``/login.html`` is not.  ``API_MIDDLEWARE = None`` turns the split
+off.  Measured per-request savings: ``python -m benchmarks.api_stack``.
+"""
+
+from importlib import import_module
+
+import django
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIHandler
+
+
+def api_paths(urlconf=None):
+    """``{"/login", "/me", ...}``: the plain-string routes of ``api_urlpatterns``."""
+    module = import_module(urlconf or settings.ROOT_URLCONF)
+    return frozenset("/" + str(pattern.pattern) for pattern in getattr(module, "api_urlpatterns", ()))
+
+
+def _lean_handler(middleware):
+    # BaseHandler.load_middleware() only reads settings.MIDDLEWARE; swap it for the
+    # duration of the load (startup, before any request thread exists).
+    handler = BaseHandler()
+    full = settings.MIDDLEWARE
+    settings.MIDDLEWARE = middleware
+    try:
+        handler.load_middleware()
+    finally:
+        settings.MIDDLEWARE = full
+    return handler
+
+
+class SplitStackWSGIHandler(WSGIHandler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.api_paths = frozenset()
+        self._api = None
+        if settings.API_MIDDLEWARE is not None:
+            self.api_paths = api_paths()
+            self._api = _lean_handler(settings.API_MIDDLEWARE)
+
+    def get_response(self, request):
+        if request.path_info in self.api_paths:
+            return self._api.get_response(request)
+        return super().get_response(request)
+
+
+def get_wsgi_application():
+    """``django.core.wsgi.get_wsgi_application`` with the split stack."""
+    django.setup(set_prefix=False)
+    return SplitStackWSGIHandler()
@@ -1,6 +1,31 @@
+import logging
+
 from django.apps import AppConfig
 
 
+logger = logging.getLogger("tclforge.startup")
+
+
 class LoginappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'loginapp'
+
+    def ready(self):
+        from django.conf import settings
+
+        # Replaces the banners settings.py used to print from every worker.
+        logger.info(".env loaded from %s (exists=%s)", settings.ENV_PATH, settings.ENV_PATH.exists())
+        logger.info("Templates path: %s", settings.TEMPLATE_DIR)
+        if not settings.EMAIL_HOST_PASSWORD:
+            logger.warning("EMAIL_PASSWORD not found in .env file.")
+        if not settings.MONGO_URI:
+            logger.warning("MONGO_URI not found in .env file.")
+        if settings.MONGO_CONNECT_ERROR:
+            logger.error("MongoDB connection failed: %s", settings.MONGO_CONNECT_ERROR)
+        else:
+            logger.info("MongoDB connected successfully.")
+        if not settings.OPENROUTER_API_KEY:
+            logger.warning("OPENROUTER_API_KEY not found in .env file.")
+
+        from loginapp import faults
+        faults.install()
@@ -0,0 +1,292 @@
+"""
+Write-behind security/usage event log.
+
+Views call ``audit.record("login", email, request)``; that appends the event
+to a bounded in-process queue and returns, so no auth request waits on
+Mongo.  A background thread per worker writes the queue to
+``AUDIT_COLLECTION`` with ``insert_many`` whenever ``AUDIT_BATCH_SIZE``
+events are waiting or ``AUDIT_FLUSH_INTERVAL`` seconds have passed::
+
+    {event, email, ip, at, ...extra fields}
+
+Events: ``login``, ``login_failed``, ``logout``, ``otp_sent``,
+``password_reset`` (via OTP) and ``password_changed``.
+
+When Mongo is unavailable the batch is appended to
+``AUDIT_SPILL_DIR/audit-<pid>.jsonl`` instead; the next successful flush of
+any worker claims the spill files (by renaming them to
+``replay-<pid>-audit-<pid>.jsonl`` under an exclusive ``flock``, which
+appends take too) and inserts their events.  Replay files of a worker
+that died mid-replay are claimed again by the next one.  When the queue is
+full (``AUDIT_MAX_QUEUE``) new events are dropped and counted in
+``tclforge_audit_dropped_total``.
+
+Every worker also keeps per-minute event counts for the last
+``AUDIT_COUNTER_MINUTES`` minutes and writes them to
+``METRICS_DIR/<ppid>/<pid>.audit.json`` on each flush; ``/debug/audit``
+(``Authorization: Bearer <DIAGNOSTICS_TOKEN>``) sums all workers.
+"""
+
+import atexit
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+import pymongo.errors
+from bson import ObjectId
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils import timezone
+
+from loginapp import json_api, metrics, mongo_guard
+
+
+logger = logging.getLogger(__name__)
+
+
+class MinuteCounters:
+    """Event counts per wall-clock minute, for the last ``minutes`` minutes."""
+
+    def __init__(self, minutes=60, clock=time.time):
+        self.minutes = minutes
+        self._clock = clock
+        self._buckets = deque()   # (minute start, Counter), oldest first
+        self._lock = threading.Lock()
+
+    def add(self, event):
+        minute = int(self._clock() // 60) * 60
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] != minute:
+                self._buckets.append((minute, Counter()))
+                while self._buckets and self._buckets[0][0] <= minute - self.minutes * 60:
+                    self._buckets.popleft()
+            self._buckets[-1][1][event] += 1
+
+    def snapshot(self):
+        """``{minute start (unix seconds): {event: count}}`` within the window."""
+        oldest = int(self._clock() // 60) * 60 - (self.minutes - 1) * 60
+        with self._lock:
+            return {minute: dict(counts) for minute, counts in self._buckets if minute >= oldest}
+
+
+class AuditWriter:
+    def __init__(self, spill_dir, max_queue, batch_size, interval, counter_minutes):
+        self.spill_dir = Path(spill_dir)
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.interval = interval
+        self.counters = MinuteCounters(counter_minutes)
+        self._queue = deque()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def add(self, event):
+        self.counters.add(event["event"])
+        if len(self._queue) >= self.max_queue:
+            metrics.count("audit_dropped")   # shed events rather than grow or block the request
+            return
+        self._queue.append(event)
+        if len(self._queue) >= self.batch_size:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                self.write_report()
+            except Exception:
+                logger.exception("Audit flush failed")
+
+    def flush(self):
+        with self._lock:
+            while self._queue:
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    batch.append(self._queue.popleft())
+                if self._insert(batch):
+                    self._replay_spills()
+                else:
+                    self._spill(batch)
+
+    def _insert(self, batch):
+        """True if ``batch`` was written (or rejected for good), False if Mongo is unavailable."""
+        try:
+            settings.AUDIT_COLLECTION.insert_many(batch, ordered=False)
+        except mongo_guard.MongoUnavailable:
+            return False
+        except pymongo.errors.BulkWriteError as e:
+            # Replayed spills may repeat events a timed-out insert_many did write; their _id makes that a no-op.
+            errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+            if errors:
+                logger.error("Dropped %d audit events: %s", len(errors), errors[0].get("errmsg"))
+        except pymongo.errors.PyMongoError as e:
+            if mongo_guard.is_availability_error(e):
+                return False
+            logger.error("Dropped %d audit events: %s", len(batch), e)
+        metrics.count("audit_written", len(batch))
+        return True
+
+    def _spill(self, batch):
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        path = self.spill_dir / f"audit-{os.getpid()}.jsonl"
+        while True:
+            with open(path, "ab") as f:
+                _flock(f)
+                if not _is_current(f, path):
+                    continue   # claimed between open and lock: append to a new file instead
+                for event in batch:
+                    f.write(json_api.dumps(event) + b"\n")   # keeps any _id insert_many assigned
+                break
+        metrics.count("audit_spilled", len(batch))
+
+    def _claim_spills(self):
+        """Spill files this worker now owns: ones left by replays that died, then new ones."""
+        claimed = []
+        for path in self.spill_dir.glob("replay-*-audit-*.jsonl"):
+            owner = int(path.name.split("-")[1])
+            if owner == os.getpid():
+                claimed.append(path)
+            elif not metrics.process_alive(owner):
+                mine = path.with_name(f"replay-{os.getpid()}-{path.name.split('-', 2)[2]}")
+                if _claim(path, mine):
+                    claimed.append(mine)
+        for path in self.spill_dir.glob("audit-*.jsonl"):
+            mine = path.with_name(f"replay-{os.getpid()}-{path.name}")
+            if _claim(path, mine):
+                claimed.append(mine)
+        return claimed
+
+    def _replay_spills(self):
+        if not self.spill_dir.is_dir():
+            return
+        for claimed in self._claim_spills():
+            with open(claimed, "rb") as f:
+                events = [_from_spill(json_api.loads(line)) for line in f if line.strip()]
+            for start in range(0, len(events), self.batch_size):
+                if not self._insert(events[start:start + self.batch_size]):
+                    self._spill(events[start:])
+                    break
+            claimed.unlink()
+            logger.info("Replayed %d spilled audit events from %s", len(events), claimed.name)
+
+    def write_report(self):
+        directory = metrics.metrics_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{os.getpid()}.audit.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.counters.snapshot()), encoding="utf-8")
+        tmp.replace(path)
+
+
+def _flock(f):
+    """Exclusive lock on an open spill file until it is closed (Windows runs one process: no-op)."""
+    if sys.platform != "win32":
+        import fcntl
+
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _is_current(f, path):
+    """Whether the open file ``f`` is still the one at ``path`` (it was not renamed away)."""
+    try:
+        return os.stat(path).st_ino == os.fstat(f.fileno()).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def _claim(path, claimed):
+    """Rename ``path`` to ``claimed`` once no ``_spill`` is appending to it; False if another worker got it."""
+    try:
+        if sys.platform == "win32":
+            path.replace(claimed)   # one process, and an open file cannot be renamed there
+            return True
+        with open(path, "rb") as f:
+            _flock(f)   # waits out a _spill in progress; later ones see the rename and start a new file
+            if not _is_current(f, path):
+                return False
+            path.replace(claimed)   # atomic: exactly one worker replays each file
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _from_spill(event):
+    if "_id" in event:
+        event["_id"] = ObjectId(event["_id"])
+    event["at"] = datetime.fromisoformat(event["at"].replace("Z", "+00:00"))
+    return event
+
+
+def read_counters(directory):
+    """Per-minute counts summed over every live worker: ``{minute: {event: count}}``."""
+    totals = {}
+    for path in directory.glob("*.audit.json"):
+        try:
+            if not metrics.process_alive(int(path.name.split(".")[0])):
+                path.unlink(missing_ok=True)   # recycled worker
+                continue
+            report = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        for minute, counts in report.items():
+            bucket = totals.setdefault(int(minute), Counter())
+            bucket.update(counts)
+    return {minute: dict(totals[minute]) for minute in sorted(totals)}
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def writer():
+    """This process's writer (a forked worker gets its own thread and queue)."""
+    global _writer, _writer_pid
+    if _writer_pid != os.getpid():
+        with _writer_lock:
+            if _writer_pid != os.getpid():
+                _writer = AuditWriter(
+                    settings.AUDIT_SPILL_DIR,
+                    max_queue=settings.AUDIT_MAX_QUEUE,
+                    batch_size=settings.AUDIT_BATCH_SIZE,
+                    interval=settings.AUDIT_FLUSH_INTERVAL,
+                    counter_minutes=settings.AUDIT_COUNTER_MINUTES,
+                )
+                _writer_pid = os.getpid()
+    return _writer
+
+
+def record(event, email=None, request=None, **fields):
+    """Queue one audit event; never blocks on Mongo."""
+    if not settings.AUDIT_ENABLED:
+        return
+    entry = {"event": event, "email": email, "at": timezone.now()}
+    if request is not None:
+        entry["ip"] = request.META.get("REMOTE_ADDR")
+        entry["user_agent"] = request.META.get("HTTP_USER_AGENT", "")[:200]
+    entry.update(fields)
+    writer().add(entry)
+
+
+def audit_view(request):
+    """Per-minute audit event counts of all workers (requires DIAGNOSTICS_TOKEN)."""
+    if not metrics.bearer_ok(request, getattr(settings, "DIAGNOSTICS_TOKEN", None)):
+        return JsonResponse({"error": "Forbidden"}, status=403)
+    if settings.AUDIT_ENABLED:
+        writer().write_report()
+    minutes = read_counters(metrics.metrics_dir())
+    return JsonResponse({"minutes": [
+        {"minute": datetime.fromtimestamp(minute, dt_timezone.utc).isoformat(), "counts": counts}
+        for minute, counts in minutes.items()
+    ]})
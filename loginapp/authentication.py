@@ -0,0 +1,66 @@
+"""
+Stateless JWT authentication for the Mongo-backed users.
+
+Tokens minted by ``/login`` identify the user by an ``email`` claim, not by
+the ``user_id`` that simplejwt's ``JWTAuthentication`` looks up in the SQLite
+``loginapp.User`` table (which is not where users live).
+``ClaimsJWTAuthentication`` instead builds a ``ClaimsUser`` straight from
+the validated token, so authenticating costs no database query.  Views that
+need the stored user read ``request.user.doc``, loaded on first access
+through the user cache.
+"""
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from loginapp import user_cache
+
+
+_MISSING = object()
+PROFILE_FIELDS = ("username", "created_at")
+
+
+class ClaimsUser:
+    """The authenticated user, as far as the access token tells."""
+
+    __slots__ = ("email", "claims", "_doc")
+
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+    is_staff = False
+    is_superuser = False
+
+    def __init__(self, claims):
+        self.email = claims["email"]
+        self.claims = claims
+        self._doc = _MISSING
+
+    @property
+    def pk(self):
+        return self.email
+
+    @property
+    def doc(self):
+        """The user's ``LOGIN_COLLECTION`` document (projected), or ``None`` if it is gone."""
+        if self._doc is _MISSING:
+            self._doc = user_cache.get_user(self.email)
+        return self._doc
+
+    def __getattr__(self, name):
+        # Profile fields come from the claims when present (PROFILE_CLAIMS_IN_TOKEN), else from the document.
+        if name not in PROFILE_FIELDS:
+            raise AttributeError(name)
+        if name in self.claims:
+            return self.claims[name]
+        return self.doc.get(name) if self.doc is not None else None
+
+    def __str__(self):
+        return self.email
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if not validated_token.get("email"):
+            raise InvalidToken("Token contained no recognizable user identification")
+        return ClaimsUser(validated_token)
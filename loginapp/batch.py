@@ -0,0 +1,159 @@
+"""
+``/batch``: several API calls in one request.
+
+A page that needs ``/me``, ``/leaderboard/me`` and a progress sync on load
+can send them together::
+
+    POST /batch
+    {"requests": [
+        {"method": "GET", "path": "/me", "headers": {"If-None-Match": "\\"me-1a2b\\""}},
+        {"method": "GET", "path": "/leaderboard?limit=10"},
+        {"method": "POST", "path": "/progress/sync", "body": {"client_id": "...", "since": 0}}
+    ]}
+
+and gets ``{"responses": [{"status", "headers", "body"}, ...]}`` in the same
+order.  Sub-requests are dispatched in-process to the existing views,
+authenticated as the caller (the batch's token is validated once and the
+user handed to every view).  Consecutive ``GET``s run concurrently on a
+small per-worker thread pool; any other method waits for everything before
+it and runs alone, so writes keep their order.
+
+Limits: ``BATCH_MAX_REQUESTS`` sub-requests, ``BATCH_MAX_BODY_BYTES`` of
+sub-request bodies in total, only the cheap routes in ``BATCH_PATHS``
+(no ``/login``, ``/chat``, or ``/batch`` itself), and the whole batch
+shares the request's Mongo deadline.  Sub-requests do not go through the
+middleware: the batch is timed, logged and budgeted as one request, with
+one trace span per sub-request.
+"""
+
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import resolve
+from rest_framework.response import Response
+
+from loginapp import json_api, metrics, mongo_guard, tracing
+
+
+logger = logging.getLogger(__name__)
+
+METHODS = frozenset({"GET", "POST"})
+REQUEST_HEADERS = {"if-none-match": "HTTP_IF_NONE_MATCH"}
+RESPONSE_HEADERS = ("ETag", "Cache-Control", "Retry-After")
+
+
+class BatchError(Exception):
+    pass
+
+
+def parse(payload):
+    """``[(method, path, query, body_bytes, meta_headers), ...]`` from the ``/batch`` body; raises ``BatchError``."""
+    items = payload.get("requests") if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        raise BatchError("requests must be a non-empty list")
+    if len(items) > settings.BATCH_MAX_REQUESTS:
+        raise BatchError(f"At most {settings.BATCH_MAX_REQUESTS} requests per batch")
+
+    parsed, total_bytes = [], 0
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise BatchError(f"requests[{i}] must be an object")
+        method = str(item.get("method", "GET")).upper()
+        url = urlsplit(str(item.get("path", "")))
+        if method not in METHODS:
+            raise BatchError(f"requests[{i}]: method must be one of {', '.join(sorted(METHODS))}")
+        if url.path not in settings.BATCH_PATHS:
+            raise BatchError(f"requests[{i}]: {url.path or 'path'} cannot be batched")
+        headers = item.get("headers") or {}
+        if not isinstance(headers, dict) or any(name.lower() not in REQUEST_HEADERS for name in headers):
+            raise BatchError(f"requests[{i}]: only {', '.join(REQUEST_HEADERS)} headers are forwarded")
+        body = json_api.dumps(item["body"]) if item.get("body") is not None else b""
+        total_bytes += len(body)
+        if total_bytes > settings.BATCH_MAX_BODY_BYTES:
+            raise BatchError(f"Request bodies exceed {settings.BATCH_MAX_BODY_BYTES} bytes")
+        meta = {REQUEST_HEADERS[name.lower()]: str(value) for name, value in headers.items()}
+        parsed.append((method, url.path, url.query, body, meta))
+    return parsed
+
+
+# =====================================================
+# 🔹 IN-PROCESS DISPATCH
+# =====================================================
+def sub_request(parent, method, path, query, body, headers):
+    """A ``WSGIRequest`` for one sub-request, with the parent's client metadata and user."""
+    environ = {key: value for key, value in parent.META.items() if key not in ("HTTP_IF_NONE_MATCH", "CONTENT_TYPE")}
+    environ.update(headers)
+    environ.update({
+        "REQUEST_METHOD": method, "PATH_INFO": path, "QUERY_STRING": query,
+        "CONTENT_LENGTH": str(len(body)), "wsgi.input": io.BytesIO(body),
+    })
+    if body:
+        environ["CONTENT_TYPE"] = "application/json"
+    request = WSGIRequest(environ)
+    # DRF's Request uses these instead of its authenticators: no second token validation.
+    request._force_auth_user = parent.user
+    request._force_auth_token = parent.auth
+    return request
+
+
+def result(response):
+    headers = {name: response[name] for name in RESPONSE_HEADERS if response.has_header(name)}
+    if isinstance(response, Response):
+        body = response.data
+    else:
+        body = json_api.loads(response.content) if response.content else None
+    return {"status": response.status_code, "headers": headers, "body": body}
+
+
+def dispatch(parent, method, path, query, body, headers):
+    request = sub_request(parent, method, path, query, body, headers)
+    with tracing.span(f"batch {method} {path}"):
+        try:
+            match = resolve(path)
+            request.resolver_match = match
+            return result(match.func(request, *match.args, **match.kwargs))
+        except mongo_guard.MongoUnavailable as e:
+            return {"status": 503, "headers": {"Retry-After": str(e.retry_after)}, "body": {"error": str(e)}}
+        except Exception:
+            logger.exception("Batched %s %s failed", method, path)
+            return {"status": 500, "headers": {}, "body": json_api.constant(error="Internal server error")}
+
+
+_pool = None
+_pool_pid = None
+
+
+def pool():
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        _pool = ThreadPoolExecutor(settings.BATCH_CONCURRENCY, thread_name_prefix="batch")
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def run(request, items):
+    """Responses for ``parse()``d ``items``, in order; runs of ``GET``s go to the pool together."""
+    metrics.count("batch_subrequests", len(items))
+    responses, reads = [], []
+
+    def flush_reads():
+        if len(reads) == 1:
+            responses.append(dispatch(request, *reads[0]))
+        elif reads:
+            futures = [tracing.submit(pool(), dispatch, request, *item) for item in reads]
+            responses.extend(future.result() for future in futures)
+        reads.clear()
+
+    for item in items:
+        if item[0] == "GET":
+            reads.append(item)
+            continue
+        flush_reads()
+        responses.append(dispatch(request, *item))
+    flush_reads()
+    return responses
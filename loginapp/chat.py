@@ -0,0 +1,238 @@
+"""
+Server-side proxy for the TCL chatbot.
+
+The browser used to call openrouter.ai directly with a hard-coded key and
+wait for the whole completion.  The proxy keeps the key on the server,
+trims the conversation to a token budget, streams tokens back as
+Server-Sent Events and caches answers to repeated questions.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from loginapp import retrieval
+
+
+DEFAULT_SYSTEM_PROMPT = """You are a helpful TCL programming assistant. Focus on:
+- TCL/Tk programming language
+- Code examples and explanations
+- Debugging and best practices
+- Interview preparation for TCL roles
+- File operations, string manipulation, procedures
+- Keep responses concise and technical
+- If asked about non-TCL topics, politely redirect"""
+
+
+class ChatError(Exception):
+    """Raised when the upstream model call fails."""
+
+
+# =====================================================
+# 🔹 HISTORY TRIMMING
+# =====================================================
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token, like OpenAI's rule of thumb)."""
+    return len(text) // 4 + 1
+
+
+def trim_history(history, question, budget, context=""):
+    """
+    Return the messages to send upstream: system prompt (plus retrieved
+    ``context``), as many of the most recent ``history`` turns as fit in
+    ``budget`` tokens, then ``question``.
+    """
+    system = getattr(settings, "CHAT_SYSTEM_PROMPT", DEFAULT_SYSTEM_PROMPT) + context
+    remaining = budget - estimate_tokens(system) - estimate_tokens(question)
+
+    kept = []
+    for message in reversed(history or []):
+        if not isinstance(message, dict):
+            continue
+        role, content = message.get("role"), message.get("content")
+        if role not in ("user", "assistant") or not isinstance(content, str):
+            continue  # the client never gets to choose the system prompt
+        cost = estimate_tokens(content)
+        if cost > remaining:
+            break
+        remaining -= cost
+        kept.append({"role": role, "content": content})
+    kept.reverse()
+
+    return [{"role": "system", "content": system}, *kept, {"role": "user", "content": question}]
+
+
+# =====================================================
+# 🔹 ANSWER CACHE (TTL + LRU eviction)
+# =====================================================
+_NORMALIZE_PUNCTUATION = re.compile(r"[^\w\s$\[\]{}]+")
+
+
+def normalize_question(question):
+    """Lower-case, drop punctuation and collapse whitespace."""
+    question = _NORMALIZE_PUNCTUATION.sub(" ", question.lower())
+    return " ".join(question.split())
+
+
+def cache_key(model, question, history):
+    """
+    Answer cache key, or ``None`` for a follow-up: with earlier turns the
+    answer depends on the conversation ("explain that again"), so it is
+    neither served from nor stored in the cache.
+    """
+    if any(isinstance(message, dict) and message.get("role") in ("user", "assistant") for message in history or []):
+        return None
+    return (model, normalize_question(question))
+
+
+class AnswerCache:
+    """Thread-safe bounded cache of answers keyed by model + normalized question."""
+
+    def __init__(self, max_entries=1000, ttl=3600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self._clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, answer):
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+answer_cache = AnswerCache(
+    max_entries=getattr(settings, "CHAT_CACHE_MAX_ENTRIES", 1000),
+    ttl=getattr(settings, "CHAT_CACHE_TTL", 3600),
+)
+
+
+# =====================================================
+# 🔹 UPSTREAM STREAMING
+# =====================================================
+def stream_completion(model, messages):
+    """Yield content deltas from an OpenAI-compatible streaming endpoint."""
+    try:
+        response = requests.post(
+            settings.OPENROUTER_URL,
+            headers={
+                "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
+                "HTTP-Referer": getattr(settings, "CHAT_REFERER", "https://tclforge.onrender.com"),
+                "X-Title": "TCL Forge",
+            },
+            json={
+                "model": model,
+                "messages": messages,
+                "temperature": 0.7,
+                "max_tokens": getattr(settings, "CHAT_MAX_TOKENS", 500),
+                "stream": True,
+            },
+            stream=True,
+            timeout=getattr(settings, "CHAT_UPSTREAM_TIMEOUT", (5, 60)),
+        )
+    except requests.RequestException as e:
+        raise ChatError(f"Model service unreachable: {e}") from e
+
+    with response:
+        if response.status_code != 200:
+            raise ChatError(f"Model request failed: {response.status_code} - {response.text[:200]}")
+
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue  # blank separators and ": keep-alive" comments
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            try:
+                chunk = json.loads(data)
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+            except (ValueError, KeyError, IndexError) as e:
+                raise ChatError(f"Malformed model stream: {data[:200]}") from e
+            if delta:
+                yield delta
+
+
+def sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def chat_events(model, question, history):
+    """
+    Yield SSE frames answering ``question``: from the answer cache, then
+    straight from our notes on a confident match, otherwise from the model.
+    """
+    key = cache_key(model, question, history)
+    cached = answer_cache.get(key) if key is not None else None
+    if cached is not None:
+        yield sse("delta", {"content": cached})
+        yield sse("done", {"cached": True})
+        return
+
+    results = []
+    if getattr(settings, "RETRIEVAL_ENABLED", False):
+        try:
+            results = retrieval.get_index().search(question, k=settings.RETRIEVAL_TOP_K)
+        except OSError:
+            results = []  # index unavailable: fall back to a plain model call
+    answer = retrieval.direct_answer(results)
+    if answer is not None:
+        if key is not None:
+            answer_cache.put(key, answer)
+        yield sse("delta", {"content": answer})
+        yield sse("done", {"cached": False, "source": "notes"})
+        return
+
+    messages = trim_history(
+        history, question,
+        getattr(settings, "CHAT_HISTORY_TOKEN_BUDGET", 2000),
+        context=retrieval.grounding_context(results),
+    )
+    parts = []
+    try:
+        for delta in stream_completion(model, messages):
+            parts.append(delta)
+            yield sse("delta", {"content": delta})
+    except ChatError as e:
+        yield sse("error", {"error": str(e)})
+        return
+
+    answer = "".join(parts)
+    if answer and key is not None:
+        answer_cache.put(key, answer)
+    yield sse("done", {"cached": False})
+
+
+async def aiter_events(events):
+    """Serve a sync SSE generator from an async iterator (ASGI streaming)."""
+    done = object()
+    while True:
+        frame = await sync_to_async(next, thread_sensitive=False)(events, done)
+        if frame is done:
+            return
+        yield frame
@@ -0,0 +1,269 @@
+"""
+Fault and latency injection for the Mongo collections and the email backend.
+
+Off unless ``FAULT_INJECTION_ENABLED`` (env ``FAULT_INJECTION_ENABLED=1``):
+then ``install()`` wraps ``settings.*_COLLECTION`` and the email backend,
+and every call first consults the active rules.  Rules are keyed by target,
+most specific first:
+
+    mongo.<collection>.<method>   e.g. "mongo.Login.find_one"
+    mongo.<collection>            e.g. "mongo.password_reset_otp"
+    mongo
+    smtp
+
+and each rule may set::
+
+    {"latency_ms": 500}                          fixed delay
+    {"latency_ms": {"p50": 40, "p99": 900}}      log-normal delay fitted to two percentiles
+    {"error_rate": 0.05}                         share of calls raising AutoReconnect / SMTPServerDisconnected
+    {"timeout_rate": 0.01, "timeout_ms": 30000}  share of calls hanging, then raising a timeout
+
+The initial rules come from ``FAULT_INJECTION``.  ``/debug/faults``
+(``Authorization: Bearer <DIAGNOSTICS_TOKEN>``) shows them with this
+worker's injection counters (GET), replaces them (POST, JSON body) or
+clears them (DELETE).  Changes are written next to the metrics files, so
+every worker of the same master picks them up within a second.
+"""
+
+import json
+import logging
+import math
+import os
+import random
+import smtplib
+import socket
+import threading
+import time
+from collections import Counter
+
+import pymongo.errors
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from loginapp import metrics
+from loginapp.mongo_guard import GuardedCollection
+
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_SETTINGS = (
+    "LOGIN_COLLECTION", "RESET_OTP_COLLECTION", "PROGRESS_COLLECTION", "REFRESH_FAMILY_COLLECTION", "AUDIT_COLLECTION",
+    "SCHEDULER_LOCK_COLLECTION",
+)
+WRAPPED_METHODS = frozenset({
+    "find", "find_one", "find_one_and_update", "find_one_and_delete", "insert_one", "insert_many",
+    "update_one", "update_many", "delete_one", "delete_many", "replace_one", "bulk_write",
+    "aggregate", "count_documents", "create_index",
+})
+RULE_KEYS = {"latency_ms", "error_rate", "timeout_rate", "timeout_ms"}
+RELOAD_INTERVAL = 1.0   # seconds between checks of the shared rules file
+Z99 = 2.3263            # standard normal 99th percentile
+
+
+def validate(rules):
+    """Raise ``ValueError`` unless ``rules`` is ``{target: rule}`` as described above."""
+    if not isinstance(rules, dict):
+        raise ValueError("rules must be an object keyed by target")
+    for target, rule in rules.items():
+        if not (target in ("mongo", "smtp") or target.startswith("mongo.")):
+            raise ValueError(f"unknown target {target!r}")
+        if not isinstance(rule, dict) or set(rule) - RULE_KEYS:
+            raise ValueError(f"{target}: rule keys must be among {sorted(RULE_KEYS)}")
+        for key in ("error_rate", "timeout_rate"):
+            if not isinstance(rule.get(key, 0), (int, float)) or not 0 <= rule.get(key, 0) <= 1:
+                raise ValueError(f"{target}: {key} must be between 0 and 1")
+        if not isinstance(rule.get("timeout_ms", 0), (int, float)) or rule.get("timeout_ms", 0) < 0:
+            raise ValueError(f"{target}: timeout_ms must be a non-negative number")
+        latency = rule.get("latency_ms", 0)
+        if isinstance(latency, dict):
+            p50, p99 = latency.get("p50"), latency.get("p99")
+            if not all(isinstance(v, (int, float)) for v in (p50, p99)) or not 0 < p50 <= p99:
+                raise ValueError(f"{target}: latency_ms needs 0 < p50 <= p99")
+        elif not isinstance(latency, (int, float)) or latency < 0:
+            raise ValueError(f"{target}: latency_ms must be a number or {{p50, p99}}")
+    return rules
+
+
+def sample_latency(latency):
+    """Seconds of delay for one call."""
+    if isinstance(latency, dict):
+        sigma = math.log(latency["p99"] / latency["p50"]) / Z99
+        return random.lognormvariate(math.log(latency["p50"]), sigma) / 1000
+    return latency / 1000
+
+
+class FaultRules:
+    """The active rules (shared by file across workers) and this worker's counters."""
+
+    def __init__(self, initial):
+        self.initial = validate(dict(initial or {}))
+        self.rules = self.initial
+        self.injected = Counter()
+        self._loaded_mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def path():
+        return metrics.metrics_dir() / "faults.json"
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked < RELOAD_INTERVAL:
+            return
+        self._checked = now
+        try:
+            mtime = self.path().stat().st_mtime_ns
+        except FileNotFoundError:
+            self.rules, self._loaded_mtime = self.initial, None
+            return
+        if mtime != self._loaded_mtime:
+            try:
+                self.rules = validate(json.loads(self.path().read_text(encoding="utf-8")))
+                self._loaded_mtime = mtime
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring unreadable fault rules %s: %s", self.path(), e)
+
+    def replace(self, rules):
+        validate(rules)
+        path = self.path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(rules), encoding="utf-8")
+        tmp.replace(path)
+        with self._lock:
+            self.rules, self._checked = rules, 0.0
+        logger.warning("Fault injection rules replaced: %s", rules or "none")
+
+    def match(self, *targets):
+        with self._lock:
+            self._refresh()
+            rules = self.rules
+        for target in targets:
+            if target in rules:
+                return target, rules[target]
+        return None, None
+
+    def inject(self, targets, error, timeout):
+        """Delay and/or raise for one call to the most specific of ``targets``."""
+        target, rule = self.match(*targets)
+        if rule is None:
+            return
+        roll = random.random()
+        timeout_rate = rule.get("timeout_rate", 0)
+        if roll < timeout_rate:
+            self.injected[f"{target}:timeout"] += 1
+            time.sleep(rule.get("timeout_ms", 30_000) / 1000)
+            raise timeout(f"injected timeout ({target})")
+        delay = sample_latency(rule.get("latency_ms", 0))
+        if delay:
+            self.injected[f"{target}:latency"] += 1
+            time.sleep(delay)
+        if roll < timeout_rate + rule.get("error_rate", 0):
+            self.injected[f"{target}:error"] += 1
+            raise error(f"injected error ({target})")
+
+
+_rules = None
+_rules_pid = None
+
+
+def rules():
+    global _rules, _rules_pid
+    if _rules_pid != os.getpid():
+        _rules = FaultRules(getattr(settings, "FAULT_INJECTION", {}))
+        _rules_pid = os.getpid()
+    return _rules
+
+
+# =====================================================
+# 🔹 WRAPPERS
+# =====================================================
+class FaultyCollection:
+    """Proxy for a pymongo ``Collection`` that injects faults before each operation."""
+
+    def __init__(self, collection):
+        self.wrapped = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self.wrapped, name)
+        if name not in WRAPPED_METHODS:
+            return attr
+        targets = (f"mongo.{self.wrapped.name}.{name}", f"mongo.{self.wrapped.name}", "mongo")
+
+        def call(*args, **kwargs):
+            rules().inject(targets, pymongo.errors.AutoReconnect, pymongo.errors.NetworkTimeout)
+            return attr(*args, **kwargs)
+        return call
+
+
+class FaultInjectingEmailBackend(BaseEmailBackend):
+    """Wraps the originally configured ``EMAIL_BACKEND`` (see ``install()``)."""
+
+    inner_backend = None
+
+    def __init__(self, fail_silently=False, **kwargs):
+        super().__init__(fail_silently=fail_silently)
+        self.inner = get_connection(self.inner_backend, fail_silently=fail_silently, **kwargs)
+
+    def open(self):
+        return self.inner.open()
+
+    def close(self):
+        return self.inner.close()
+
+    def send_messages(self, email_messages):
+        try:
+            rules().inject(("smtp",), smtplib.SMTPServerDisconnected, socket.timeout)
+        except (smtplib.SMTPException, OSError):
+            if not self.fail_silently:
+                raise
+            return 0
+        return self.inner.send_messages(email_messages)
+
+
+def install():
+    """Wrap the configured collections and email backend; safe to call again after swapping them."""
+    if not getattr(settings, "FAULT_INJECTION_ENABLED", False):
+        return False
+    for name in COLLECTION_SETTINGS:
+        collection = getattr(settings, name, None)
+        if isinstance(collection, GuardedCollection):
+            # Inject below the guard, so injected failures trip the breaker like real ones.
+            if collection.wrapped is not None and not isinstance(collection.wrapped, FaultyCollection):
+                collection.wrapped = FaultyCollection(collection.wrapped)
+        elif collection is not None and not isinstance(collection, FaultyCollection):
+            setattr(settings, name, FaultyCollection(collection))
+    backend = f"{__name__}.{FaultInjectingEmailBackend.__name__}"
+    if settings.EMAIL_BACKEND != backend:
+        FaultInjectingEmailBackend.inner_backend = settings.EMAIL_BACKEND
+        settings.EMAIL_BACKEND = backend
+    logger.warning("Fault injection enabled; initial rules: %s", rules().rules or "none")
+    return True
+
+
+# =====================================================
+# 🔹 /debug/faults
+# =====================================================
+@csrf_exempt
+def faults_view(request):
+    if not metrics.bearer_ok(request, getattr(settings, "DIAGNOSTICS_TOKEN", None)):
+        return JsonResponse({"error": "Forbidden"}, status=403)
+    if not getattr(settings, "FAULT_INJECTION_ENABLED", False):
+        return JsonResponse({"error": "Fault injection is disabled (FAULT_INJECTION_ENABLED=1)"}, status=404)
+
+    active = rules()
+    if request.method == "POST":
+        try:
+            active.replace(json.loads(request.body or b"{}"))
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+    elif request.method == "DELETE":
+        active.replace({})
+    elif request.method != "GET":
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+    active.match()   # pick up changes from other workers
+    return JsonResponse({"pid": os.getpid(), "rules": active.rules, "injected": dict(active.injected)})
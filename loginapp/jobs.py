@@ -0,0 +1,82 @@
+"""
+Maintenance and cache-warming jobs for :mod:`loginapp.scheduler`.
+
+Each job returns a short summary worth logging, or ``None``.  Intervals
+live in ``SCHEDULED_JOBS``.  Jobs on shared Mongo data run on the leader;
+jobs on this host's files (SQLite, the retrieval index) are ``per_host``;
+other ``leader=False`` jobs warm per-worker state and run in every worker.
+"""
+
+import logging
+from datetime import timedelta
+
+import pymongo.errors
+from django.conf import settings
+from django.core.management import call_command
+from django.db import close_old_connections
+from django.utils import timezone
+
+from loginapp import leaderboard, retrieval, scheduler
+
+
+logger = logging.getLogger(__name__)
+
+# (collection setting, keys, create_index options)
+INDEXES = [
+    ("LOGIN_COLLECTION", [("email", 1)], {}),
+    ("RESET_OTP_COLLECTION", [("email", 1), ("created_at", -1)], {}),   # /send-otp rate check, /reset-password
+    ("PROGRESS_COLLECTION", [("version", 1)], {}),                      # leaderboard refresh ($gt since)
+    ("REFRESH_FAMILY_COLLECTION", [("expires_at", 1)], {"expireAfterSeconds": 0}),   # TTL: drop dead families
+    ("REFRESH_FAMILY_COLLECTION", [("email", 1)], {}),                  # revoke_all on password change
+    ("AUDIT_COLLECTION", [("email", 1), ("at", -1)], {}),
+]
+
+
+@scheduler.job(leader=True, timeout=60)
+def prune_otps():
+    cutoff = timezone.now() - timedelta(seconds=settings.OTP_RETENTION_SECONDS)
+    deleted = settings.RESET_OTP_COLLECTION.delete_many({"created_at": {"$lt": cutoff}}).deleted_count
+    return f"deleted {deleted} expired OTPs" if deleted else None
+
+
+@scheduler.job(leader=False, per_host=True, timeout=300)
+def flush_expired_tokens():
+    """simplejwt's outstanding/blacklisted tokens past their expiry (SQLite)."""
+    try:
+        call_command("flushexpiredtokens", verbosity=0)
+    finally:
+        close_old_connections()   # this thread's connection would otherwise stay open
+
+
+@scheduler.job(leader=True, timeout=120)
+def ensure_indexes():
+    """Create missing indexes; existing identical ones are a no-op on the server."""
+    failed = 0
+    for setting, keys, options in INDEXES:
+        try:
+            getattr(settings, setting).create_index(keys, **options)
+        except pymongo.errors.OperationFailure as e:
+            failed += 1   # e.g. an index on the same keys with other options; needs a manual drop
+            logger.error("Index %s on %s not created: %s", keys, setting, e)
+    return f"{failed} of {len(INDEXES)} indexes could not be created" if failed else None
+
+
+@scheduler.job(leader=False, per_host=True, timeout=300)
+def rebuild_retrieval_index():
+    """Rebuild the chatbot's index when the notes changed (workers pick it up in ``warm_retrieval``)."""
+    if settings.RETRIEVAL_ENABLED and retrieval.is_stale():
+        chunks, terms = retrieval.build_index()
+        return f"rebuilt retrieval index: {chunks} chunks / {terms} terms"
+    return None
+
+
+@scheduler.job(leader=False, timeout=30)
+def warm_leaderboard():
+    leaderboard.get_board()
+
+
+@scheduler.job(leader=False, timeout=60)
+def warm_retrieval():
+    if settings.RETRIEVAL_ENABLED:
+        retrieval.reload_if_rebuilt()
+        retrieval.get_index()
@@ -0,0 +1,130 @@
+"""
+JSON rendering and parsing for the DRF API, on orjson.
+
+The API only speaks JSON, so ``REST_FRAMEWORK`` is configured with:
+
+* ``ORJSONRenderer`` as the only renderer (no browsable API): orjson
+  serializes datetimes, UUIDs and dataclasses natively; ``ObjectId``,
+  ``Decimal``, lazy translation strings and sets go through ``default``;
+* ``ORJSONParser`` as the only parser;
+* ``JSONOnlyNegotiation``: the first renderer and parser are used without
+  parsing ``Accept`` or matching media types.  A request body with another
+  content type gets the usual 415.
+
+Constant bodies such as ``{"error": "Invalid credentials"}`` are built with
+``constant(error=...)``: a ``dict`` serialized once per process and reused,
+so the renderer just returns the stored bytes.
+
+Without orjson installed, the same classes fall back to the stdlib ``json``
+module with DRF's encoder, producing equivalent (compact) output.
+"""
+
+import datetime
+import decimal
+import functools
+import json
+
+from bson import ObjectId
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from rest_framework.exceptions import ParseError
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:   # optional: slower, same output
+    orjson = None
+
+
+def default(obj):
+    """Types orjson does not serialize itself, rendered like DRF's ``JSONEncoder`` does."""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Promise):
+        return force_str(obj)
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, datetime.timedelta):
+        return str(obj.total_seconds())
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode()
+    if hasattr(obj, "tolist"):   # numpy scalars and arrays
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps(data):
+        return orjson.dumps(data, default=default, option=orjson.OPT_UTC_Z)
+
+    loads = orjson.loads
+    DecodeError = orjson.JSONDecodeError
+else:
+    class _Encoder(JSONEncoder):
+        def default(self, obj):
+            if isinstance(obj, ObjectId):
+                return str(obj)
+            return super().default(obj)
+
+    def dumps(data):
+        return json.dumps(data, cls=_Encoder, ensure_ascii=False, separators=(",", ":")).encode()
+
+    loads = json.loads
+    DecodeError = ValueError
+
+
+class Prerendered(dict):
+    """A response body that is never mutated, serialized once."""
+
+    __slots__ = ("rendered",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rendered = dumps(self)
+
+
+@functools.lru_cache(maxsize=512)
+def constant(**fields):
+    """``Prerendered(fields)``, shared by every response with this literal body."""
+    return Prerendered(fields)
+
+
+# =====================================================
+# 🔹 DRF RENDERER / PARSER / NEGOTIATION
+# =====================================================
+class ORJSONRenderer(BaseRenderer):
+    media_type = "application/json"
+    format = "json"
+    charset = None   # JSON is UTF-8 by definition; no "; charset=" parameter
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if isinstance(data, Prerendered):
+            return data.rendered
+        return dumps(data)
+
+
+class ORJSONParser(BaseParser):
+    media_type = "application/json"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return loads(stream.read())
+        except DecodeError as e:
+            raise ParseError(f"JSON parse error - {e}")
+
+
+class JSONOnlyNegotiation(BaseContentNegotiation):
+    def select_parser(self, request, parsers):
+        parser = parsers[0]
+        content_type = request.content_type.split(";", 1)[0].strip().lower()
+        return parser if content_type == parser.media_type else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
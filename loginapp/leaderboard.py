@@ -0,0 +1,315 @@
+"""
+Cohort leaderboard ranked by total challenge score.
+
+Scores are small integers, so each worker keeps a Fenwick tree (binary
+indexed tree) over the score range: a user's rank is one prefix sum and the
+k-th best score is one tree descent, both O(log n) in the score range, and
+an update touches O(log n) nodes instead of re-sorting everyone.  Users
+tied on a score are kept sorted by email in a :class:`TieBucket`, so a page
+deep inside a large tie (most learners at 0) is found by index instead of
+walking the tie, and every worker lists ties in the same order.
+
+The tree is rebuilt from a Mongo aggregation over ``learner_progress`` on
+first use, kept current by :func:`record` when this worker applies a
+progress sync, and caught up with other workers' writes (documents whose
+``version`` moved) at most every ``LEADERBOARD_REFRESH_SECONDS``.
+"""
+
+import hashlib
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+from loginapp import json_api
+
+
+class TieBucket:
+    """
+    Users sharing one score, sorted, in chunks of ``chunk`` to ``2 * chunk``
+    users: add, remove and ``slice`` cost O(n / chunk + chunk), so a tie of a
+    million users stays cheap to update and to page through.
+    """
+
+    __slots__ = ("chunk", "_chunks", "_maxes", "_len")
+
+    def __init__(self, users=(), chunk=1000):
+        users = sorted(users)
+        self.chunk = chunk
+        self._chunks = [users[i:i + chunk] for i in range(0, len(users), chunk)]
+        self._maxes = [chunk_[-1] for chunk_ in self._chunks]
+        self._len = len(users)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for chunk_ in self._chunks:
+            yield from chunk_
+
+    def add(self, user):
+        self._len += 1
+        if not self._chunks:
+            self._chunks, self._maxes = [[user]], [user]
+            return
+        i = min(bisect_left(self._maxes, user), len(self._maxes) - 1)
+        chunk_ = self._chunks[i]
+        insort(chunk_, user)
+        self._maxes[i] = chunk_[-1]
+        if len(chunk_) > 2 * self.chunk:
+            self._chunks[i:i + 1] = [chunk_[:self.chunk], chunk_[self.chunk:]]
+            self._maxes[i:i + 1] = [chunk_[self.chunk - 1], chunk_[-1]]
+
+    def remove(self, user):
+        i = bisect_left(self._maxes, user)
+        chunk_ = self._chunks[i]
+        del chunk_[bisect_left(chunk_, user)]
+        self._len -= 1
+        if chunk_:
+            self._maxes[i] = chunk_[-1]
+        else:
+            del self._chunks[i], self._maxes[i]
+
+    def slice(self, start, count):
+        """Users ``start .. start + count - 1`` in sorted order."""
+        users = []
+        for chunk_ in self._chunks:
+            if start >= len(chunk_):
+                start -= len(chunk_)
+                continue
+            users.extend(chunk_[start:start + count - len(users)])
+            start = 0
+            if len(users) == count:
+                break
+        return users
+
+
+class Leaderboard:
+    """Users ranked by an integer score in ``[0, max_score]``; ties share a rank."""
+
+    def __init__(self, max_score):
+        self.max_score = max_score
+        self._tree = [0] * (max_score + 2)   # Fenwick tree, 1-based, index = score + 1
+        self._scores = {}                    # user -> score
+        self._buckets = {}                   # score -> TieBucket
+        self._lock = threading.RLock()
+        self.version = 0                     # bumped on every change; keys the page cache
+
+    def __len__(self):
+        return len(self._scores)
+
+    # ---------------- Fenwick tree ----------------
+    def _add(self, score, delta):
+        index = score + 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def _count_up_to(self, score):
+        """Number of users with a score <= ``score``."""
+        index, total = score + 1, 0
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def _kth_lowest(self, k):
+        """Score held by the k-th lowest user (1-based)."""
+        index, step = 0, 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = index + step
+            if nxt < len(self._tree) and self._tree[nxt] < k:
+                index = nxt
+                k -= self._tree[nxt]
+            step >>= 1
+        return index  # tree index ``index + 1`` holds it, i.e. score == index
+
+    # ---------------- updates ----------------
+    def update(self, user, score):
+        score = max(0, min(int(score), self.max_score))
+        with self._lock:
+            old = self._scores.get(user)
+            if old == score:
+                return
+            if old is not None:
+                self._remove(user, old)
+            self._scores[user] = score
+            bucket = self._buckets.get(score)
+            if bucket is None:
+                bucket = self._buckets[score] = TieBucket()
+            bucket.add(user)
+            self._add(score, 1)
+            self.version += 1
+
+    def remove(self, user):
+        with self._lock:
+            old = self._scores.pop(user, None)
+            if old is not None:
+                self._remove(user, old)
+                self.version += 1
+
+    def _remove(self, user, score):
+        bucket = self._buckets[score]
+        bucket.remove(user)
+        if not bucket:
+            del self._buckets[score]
+        self._add(score, -1)
+
+    def bulk_load(self, scores):
+        """Replace all entries with ``{user: score}`` in O(n log n + max_score)."""
+        with self._lock:
+            self._scores, ties = {}, {}
+            counts = [0] * (self.max_score + 2)
+            for user, score in scores.items():
+                score = max(0, min(int(score), self.max_score))
+                self._scores[user] = score
+                ties.setdefault(score, []).append(user)
+                counts[score + 1] += 1
+            self._buckets = {score: TieBucket(users) for score, users in ties.items()}
+            # Linear-time Fenwick construction from the raw counts.
+            for index in range(1, len(counts)):
+                parent = index + (index & -index)
+                if parent < len(counts):
+                    counts[parent] += counts[index]
+            self._tree = counts
+            self.version += 1
+
+    # ---------------- queries ----------------
+    def rank(self, user):
+        """``(rank, score)`` with rank 1 = best, or ``None`` for unknown users."""
+        with self._lock:
+            score = self._scores.get(user)
+            if score is None:
+                return None
+            return len(self._scores) - self._count_up_to(score) + 1, score
+
+    def top(self, limit, offset=0):
+        """``[(rank, user, score), ...]`` for positions ``offset+1 .. offset+limit``."""
+        with self._lock:
+            total = len(self._scores)
+            entries = []
+            position = offset + 1
+            while len(entries) < limit and position <= total:
+                score = self._kth_lowest(total - position + 1)
+                higher = total - self._count_up_to(score)
+                start = position - higher - 1   # index of ``position`` within the tie
+                users = self._buckets[score].slice(start, limit - len(entries))
+                entries.extend((higher + 1, user, score) for user in users)
+                position += len(users)
+            return entries
+
+
+# =====================================================
+# 🔹 SHARED BOARD (Mongo-backed)
+# =====================================================
+def total_score(progress_doc):
+    return round(sum((progress_doc.get("challenge_scores") or {}).values()))
+
+
+def _aggregate(since=None):
+    """Total score, progress version and username of each learner, computed in Mongo."""
+    pipeline = [] if since is None else [{"$match": {"version": {"$gt": since}}}]
+    pipeline += [
+        {"$project": {
+            "version": 1,
+            "total": {"$sum": {"$map": {
+                "input": {"$objectToArray": {"$ifNull": ["$challenge_scores", {}]}},
+                "in": "$$this.v",
+            }}},
+        }},
+        {"$lookup": {"from": settings.LOGIN_COLLECTION.name, "localField": "_id",
+                     "foreignField": "email", "as": "user"}},
+        {"$project": {"total": 1, "version": 1, "username": {"$first": "$user.username"}}},
+    ]
+    return settings.PROGRESS_COLLECTION.aggregate(pipeline)
+
+
+class SharedBoard:
+    """Process-wide leaderboard plus usernames and a page cache."""
+
+    def __init__(self):
+        self.board = Leaderboard(settings.LEADERBOARD_MAX_SCORE)
+        self.names = {}
+        self._synced_version = None
+        self._refreshed_at = 0.0
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def _apply(self, rows):
+        for row in rows:
+            self.names[row["_id"]] = row.get("username") or row["_id"].split("@")[0]
+            self.board.update(row["_id"], round(row["total"]))
+            if row.get("version") and (self._synced_version is None or row["version"] > self._synced_version):
+                self._synced_version = row["version"]
+
+    def rebuild(self):
+        rows = list(_aggregate())
+        with self._lock:
+            self.names = {}
+            self._synced_version = None
+            self.board.bulk_load({row["_id"]: round(row["total"]) for row in rows})
+            self._apply(rows)
+            self._refreshed_at = time.monotonic()
+
+    def refresh(self):
+        """Pick up other workers' score changes, at most once per refresh interval."""
+        if time.monotonic() - self._refreshed_at < settings.LEADERBOARD_REFRESH_SECONDS:
+            return
+        with self._lock:
+            if time.monotonic() - self._refreshed_at < settings.LEADERBOARD_REFRESH_SECONDS:
+                return
+            self._refreshed_at = time.monotonic()
+            since = self._synced_version
+        if since is None and not len(self.board):
+            self.rebuild()
+            return
+        rows = list(_aggregate(since))
+        with self._lock:
+            self._apply(rows)
+
+    def page(self, limit, offset):
+        """Return ``(body_bytes, etag)`` for a leaderboard page, cached per board version."""
+        key = (limit, offset)
+        # Under the board's lock: the version cannot move while the page is built,
+        # and no other thread clears the cache between the lookup and the insert.
+        with self.board._lock:
+            version = self.board.version
+            cached = self._pages.get(key)
+            if cached and cached[0] == version:
+                return cached[1], cached[2]
+
+            entries = [
+                {"rank": rank, "username": self.names.get(user, user.split("@")[0]), "score": score}
+                for rank, user, score in self.board.top(limit, offset)
+            ]
+            body = json_api.dumps({"total_users": len(self.board), "offset": offset, "entries": entries})
+            # Content hash, so every worker hands out the same ETag for the same page.
+            etag = '"lb-%s"' % hashlib.blake2b(body, digest_size=12).hexdigest()
+            if len(self._pages) >= 256:
+                self._pages.clear()
+            self._pages[key] = (version, body, etag)
+        return body, etag
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_board():
+    """The worker's leaderboard, built from Mongo on first use and refreshed lazily."""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                shared = SharedBoard()
+                shared.rebuild()
+                _shared = shared
+    _shared.refresh()
+    return _shared
+
+
+def record(email, progress_doc):
+    """Apply a just-written progress document to this worker's board, if it is loaded."""
+    if _shared is not None:
+        _shared.board.update(email, total_score(progress_doc))
@@ -0,0 +1,190 @@
+"""
+Non-blocking structured logging.
+
+Every handler configured in ``settings.LOGGING`` is a ``QueueHandler``: the
+request thread only resolves the message and puts the record on a queue; a
+``QueueListener`` thread per handler does the JSON formatting and the file
+or console I/O.  Files are JSON lines, rotated by size, one per process
+(gunicorn workers rotating a shared file would lose lines):
+
+    logs/access-<pid>.jsonl   one line per request (``AccessLogMiddleware``)
+    logs/app-<pid>.jsonl      everything logged by ``loginapp``, ``tclforge`` and ``django``
+
+``SamplingFilter`` keeps a configurable share of each logger's records
+below WARNING (``LOG_SAMPLING``), so access logging can be thinned at high
+request rates without losing errors.
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+
+from loginapp import metrics, tracing
+
+
+# Attributes every LogRecord has; anything else was passed via ``extra=``.
+_STANDARD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "trace_id"}
+
+access_logger = logging.getLogger("tclforge.access")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, trace id and ``extra`` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "trace_id", None):
+            entry["trace_id"] = record.trace_id
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps ``rates[logger]`` of the records below WARNING from each listed logger."""
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = rates or {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.name, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+# =====================================================
+# 🔹 QUEUED HANDLERS
+# =====================================================
+class _QueuedHandler(QueueHandler):
+    """Hands records to a private ``QueueListener`` that owns the real handler."""
+
+    def __init__(self, target):
+        super().__init__(queue.SimpleQueue())
+        self._listen(target)
+
+    def _listen(self, target):
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.queue, target, respect_handler_level=True)
+        self.listener.start()   # stopped (and drained) by close(), which logging.shutdown() calls at exit
+
+    def prepare(self, record):
+        # Resolve everything that depends on the calling thread, but leave the
+        # (comparatively expensive) formatting to the listener thread.
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        current = tracing.current_span()
+        if current is not None:
+            record.trace_id = current.trace_id
+        return record
+
+    def close(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
+
+
+class QueuedFileHandler(_QueuedHandler):
+    """
+    JSON lines (or bare messages) to ``<stem>-<pid><suffix>`` next to
+    ``filename``, rotated at ``max_bytes``, written off the request thread.
+
+    Each process writes and rotates its own file; a worker forked after
+    logging was configured (``gunicorn --preload``) switches to a file and
+    listener thread of its own on its first record.  Opening one deletes
+    the files (and backups) of processes that are gone, so recycled
+    workers do not leave a set of files each.
+    """
+
+    def __init__(self, filename, max_bytes=20 * 1024 * 1024, backup_count=5, plain=False):
+        self.filename = Path(filename)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.plain = plain
+        self._pid = os.getpid()
+        self._fork_lock = threading.Lock()
+        super().__init__(self._target())
+
+    def _target(self):
+        path = self.filename.with_name(f"{self.filename.stem}-{os.getpid()}{self.filename.suffix}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._prune_dead(path.parent)
+        target = RotatingFileHandler(path, maxBytes=self.max_bytes, backupCount=self.backup_count,
+                                     encoding="utf-8", delay=True)
+        target.setFormatter(logging.Formatter("%(message)s") if self.plain else JsonFormatter())
+        return target
+
+    def _prune_dead(self, directory):
+        pattern = re.compile(rf"{re.escape(self.filename.stem)}-(\d+){re.escape(self.filename.suffix)}(\.\d+)?")
+        for path in directory.iterdir():
+            match = pattern.fullmatch(path.name)
+            if match and not metrics.process_alive(int(match.group(1))):
+                path.unlink(missing_ok=True)
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            with self._fork_lock:
+                if self._pid != os.getpid():
+                    self._listen(self._target())   # the parent's listener thread did not survive the fork
+                    self._pid = os.getpid()
+        super().enqueue(record)
+
+
+class QueuedStreamHandler(_QueuedHandler):
+    """Human-readable lines to stderr, written off the request thread."""
+
+    def __init__(self):
+        target = logging.StreamHandler(sys.stderr)
+        target.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+        super().__init__(target)
+
+
+# =====================================================
+# 🔹 ACCESS LOG
+# =====================================================
+class AccessLogMiddleware:
+    """Logs one structured ``tclforge.access`` record per request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        if access_logger.isEnabledFor(logging.INFO):
+            match = getattr(request, "resolver_match", None)
+            access_logger.info(
+                "%s %s %s", request.method, request.path, response.status_code,
+                extra={
+                    "method": request.method,
+                    "path": request.path,
+                    "route": match.route if match is not None else None,
+                    "status": response.status_code,
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                    "bytes": len(response.content) if not response.streaming else None,
+                    "remote_addr": request.META.get("REMOTE_ADDR"),
+                },
+            )
+        return response
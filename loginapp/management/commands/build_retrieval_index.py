@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from loginapp import retrieval
+
+
+class Command(BaseCommand):
+    help = "Rebuild the chatbot's BM25 index over the notes decks and interview prep page."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--query", help="Run a lookup against the fresh index and print the matches.")
+
+    def handle(self, *args, **options):
+        chunks, terms = retrieval.build_index(settings.RETRIEVAL_INDEX_DIR)
+        retrieval.reload()
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {chunks} chunks / {terms} terms into {settings.RETRIEVAL_INDEX_DIR}"
+        ))
+
+        if options["query"]:
+            for chunk, score, coverage in retrieval.get_index().search(options["query"], k=settings.RETRIEVAL_TOP_K):
+                self.stdout.write(f"{score:7.3f}  {coverage:4.0%}  {chunk['source']}  {chunk['title']}")
@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from loginapp import memory, metrics
+
+
+class Command(BaseCommand):
+    help = "Show the latest RSS / tracemalloc report of every running worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--json", action="store_true", help="Print the raw reports as JSON.")
+        parser.add_argument("--top", type=int, default=5, help="Allocation sites to show per worker.")
+
+    def handle(self, *args, **options):
+        root = metrics.metrics_root()
+        reports = []
+        # This command is not a child of the server's master, so look at every generation.
+        for generation in sorted(root.iterdir()) if root.is_dir() else []:
+            if generation.is_dir():
+                reports += [dict(report, master=generation.name) for report in memory.read_reports(generation)]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(reports, indent=2))
+            return
+        if not reports:
+            self.stdout.write(f"No worker reports under {root} (workers report every MEMORY_SAMPLE_EVERY requests).")
+        for report in reports:
+            samples = report["samples"]
+            growth = ""
+            if len(samples) >= 2:
+                first, last = samples[0], samples[-1]
+                growth = (f"  {(last['rss_bytes'] - first['rss_bytes']) / 2**20:+.1f} MB"
+                          f" over {last['requests'] - first['requests']} requests")
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"master {report['master']}  worker {report['pid']}  "
+                f"rss {report['rss_bytes'] / 2**20:.1f} MB  requests {report['requests']}{growth}"
+            ))
+            for site in report["top_growth"][:options["top"]]:
+                self.stdout.write(f"    {site['size_diff'] / 1024:+10.1f} KiB  {site['site']}")
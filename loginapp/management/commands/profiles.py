@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from loginapp import profiling
+
+
+class Command(BaseCommand):
+    help = "List or print request profiles captured by the X-Profile header (collapsed-stack format)."
+
+    def add_arguments(self, parser):
+        sub = parser.add_subparsers(dest="action", required=True)
+        sub.add_parser("list", help="List captured profiles, newest first.")
+        show = sub.add_parser("show", help="Print one profile; open the output in speedscope or flamegraph.pl.")
+        show.add_argument("profile_id")
+        show.add_argument("--output", "-o", help="Write to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        if options["action"] == "list":
+            profiles = profiling.list_profiles()
+            if not profiles:
+                self.stdout.write(f"No profiles in {profiling.profile_dir()}")
+            for profile_id, header, samples in profiles:
+                self.stdout.write(f"{profile_id}  {samples:6d} samples  {header}")
+            return
+
+        collapsed = profiling.load(options["profile_id"])
+        if collapsed is None:
+            raise CommandError(f"No profile {options['profile_id']!r} in {profiling.profile_dir()}")
+        # Drop the "# METHOD path ms" header so speedscope accepts the output as-is.
+        stacks = "".join(line for line in collapsed.splitlines(True) if not line.startswith("#"))
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.write(stacks)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(stacks, ending="")
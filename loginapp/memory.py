@@ -0,0 +1,173 @@
+"""
+Per-worker memory tracking and leak hints.
+
+``MemoryTrackingMiddleware`` samples the worker every
+``MEMORY_SAMPLE_EVERY`` requests: resident set size from ``/proc`` and, when
+``MEMORY_TRACEMALLOC_FRAMES`` is non-zero, a ``tracemalloc`` snapshot whose
+top allocation sites are diffed against the previous sample.  If RSS grew
+by more than ``MEMORY_GROWTH_WARN_MB`` over those requests, a warning with
+the biggest growing sites is logged.
+
+Each worker writes its latest report next to its metrics file, so
+``/debug/memory`` (``Authorization: Bearer <DIAGNOSTICS_TOKEN>``) and
+``manage.py memory_report`` can show every worker, whichever one serves
+the call.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from loginapp import metrics
+
+
+logger = logging.getLogger(__name__)
+
+TOP_SITES = 15
+HISTORY = 20   # samples kept per worker
+
+
+def rss_bytes():
+    """Current resident set size (peak RSS where ``/proc`` is unavailable, 0 on Windows)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if sys.platform == "win32":
+            return 0
+        import resource   # Unix only
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _site(stat):
+    frame = stat.traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+class MemoryTracker:
+    """RSS history and tracemalloc diffs for this worker."""
+
+    def __init__(self, every, frames, warn_mb):
+        self.every = every
+        self.warn_bytes = warn_mb * 1024 * 1024
+        self.requests = 0
+        self.samples = deque(maxlen=HISTORY)
+        self.top_growth = []
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._sample_lock = threading.Lock()
+        if frames and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+            due = self.requests % self.every == 0
+        if due:
+            self.sample()
+
+    def sample(self):
+        with self._sample_lock:
+            self._sample()
+
+    def _sample(self):
+        rss = rss_bytes()
+        entry = {"time": time.time(), "requests": self.requests, "rss_bytes": rss}
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ))
+            entry["traced_bytes"] = tracemalloc.get_traced_memory()[0]
+            if self._snapshot is not None:
+                self.top_growth = [
+                    {"site": _site(stat), "size_diff": stat.size_diff, "size": stat.size, "count_diff": stat.count_diff}
+                    for stat in snapshot.compare_to(self._snapshot, "lineno")[:TOP_SITES]
+                ]
+            self._snapshot = snapshot
+
+        previous = self.samples[-1] if self.samples else None
+        self.samples.append(entry)
+        if previous and rss - previous["rss_bytes"] > self.warn_bytes:
+            logger.warning(
+                "Worker %s RSS grew %.1f MB over %d requests (now %.1f MB); top growing sites: %s",
+                os.getpid(), (rss - previous["rss_bytes"]) / 2**20, entry["requests"] - previous["requests"],
+                rss / 2**20, ", ".join(f"{s['site']} +{s['size_diff'] / 1024:.0f} KiB" for s in self.top_growth[:3]) or "n/a",
+            )
+        self.write_report()
+
+    def report(self):
+        return {
+            "pid": os.getpid(),
+            "requests": self.requests,
+            "rss_bytes": rss_bytes(),
+            "tracemalloc": tracemalloc.is_tracing(),
+            "samples": list(self.samples),
+            "top_growth": self.top_growth,
+        }
+
+    def write_report(self):
+        directory = metrics.metrics_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{os.getpid()}.memory.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.report()), encoding="utf-8")
+        tmp.replace(path)
+
+
+def read_reports(directory):
+    """Latest report of every live worker whose file is in ``directory``."""
+    reports = []
+    for path in sorted(directory.glob("*.memory.json")):
+        try:
+            if not metrics.process_alive(int(path.name.split(".")[0])):
+                path.unlink(missing_ok=True)   # recycled worker
+                continue
+            reports.append(json.loads(path.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            continue
+    return reports
+
+
+_tracker = None
+_tracker_pid = None
+
+
+def tracker():
+    global _tracker, _tracker_pid
+    if _tracker_pid != os.getpid():
+        _tracker = MemoryTracker(
+            every=settings.MEMORY_SAMPLE_EVERY,
+            frames=settings.MEMORY_TRACEMALLOC_FRAMES,
+            warn_mb=settings.MEMORY_GROWTH_WARN_MB,
+        )
+        _tracker_pid = os.getpid()
+    return _tracker
+
+
+class MemoryTrackingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        tracker().count_request()
+        return response
+
+
+def memory_view(request):
+    """All workers' memory reports (this worker's with its current RSS)."""
+    if not metrics.bearer_ok(request, getattr(settings, "DIAGNOSTICS_TOKEN", None)):
+        return JsonResponse({"error": "Forbidden"}, status=403)
+    tracker().write_report()
+    return JsonResponse({"workers": read_reports(metrics.metrics_dir())})
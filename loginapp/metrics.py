@@ -0,0 +1,366 @@
+"""
+Per-request latency breakdown with a Prometheus ``/metrics`` endpoint.
+
+While a request is handled, time spent in each dependency is added to a
+per-request phase table:
+
+    mongo     pymongo command monitoring (``MongoCommandTimer``)
+    hash      password hashing / verification (``TimedPBKDF2PasswordHasher``)
+    jwt       token minting (``phase("jwt")`` in the views)
+    smtp      ``send_mail`` (``TimedEmailBackend``)
+    template  template rendering (``TimedDjangoTemplates``)
+    app       whatever is left of the request's wall time
+    total     the whole request
+
+``RequestMetricsMiddleware`` folds the table into per-route histograms;
+``count()`` keeps named counters (cache hits, ...) the same way.
+Every gunicorn worker writes its histograms into its own memory-mapped file
+under ``METRICS_DIR`` (``/dev/shm`` when available); ``/metrics`` sums the
+files of all workers of the current master process.  It answers only
+``Authorization: Bearer <METRICS_TOKEN>``, and 403 while no token is set.
+"""
+
+import contextvars
+import hmac
+import mmap
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.mail.backends.smtp import EmailBackend
+from django.http import HttpResponse
+from django.template.backends.django import DjangoTemplates, Template
+from pymongo import monitoring
+
+from loginapp import tracing
+
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW = 2 + len(BUCKETS) + 1          # count, sum, one slot per bucket, +Inf
+MAX_SERIES = 1024                   # (route, phase) pairs per worker
+MAX_COUNTERS = 256                  # named counters per worker (see ``count``)
+
+_phases = contextvars.ContextVar("request_phases", default=None)
+
+
+@contextmanager
+def phase(name):
+    """Add the time spent in the block to the current request's ``name`` phase (and trace it)."""
+    phases = _phases.get()
+    if phases is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        with tracing.span(name):
+            yield
+    finally:
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def add_phase_time(name, seconds):
+    phases = _phases.get()
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+
+# =====================================================
+# 🔹 DEPENDENCY HOOKS
+# =====================================================
+class MongoCommandTimer(monitoring.CommandListener):
+    """Charges every Mongo command's round trip to the ``mongo`` phase."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        add_phase_time("mongo", event.duration_micros / 1e6)
+
+    def failed(self, event):
+        add_phase_time("mongo", event.duration_micros / 1e6)
+
+
+class TimedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """Django's default hasher, with its work charged to the ``hash`` phase."""
+
+    # ``verify`` re-encodes the password, so timing ``encode`` covers both paths.
+    def encode(self, password, salt, iterations=None):
+        with phase("hash"):
+            return super().encode(password, salt, iterations)
+
+
+class TimedEmailBackend(EmailBackend):
+    """SMTP backend with connection + send time charged to the ``smtp`` phase."""
+
+    def send_messages(self, email_messages):
+        with phase("smtp"):
+            return super().send_messages(email_messages)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with phase("template"):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Django template backend that times ``render()`` into the ``template`` phase."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+# =====================================================
+# 🔹 SHARED-MEMORY HISTOGRAMS (one mmap file per worker)
+# =====================================================
+def metrics_root():
+    """Parent of the per-master directories (``METRICS_DIR``)."""
+    base = getattr(settings, "METRICS_DIR", None)
+    if not base:
+        base = "/dev/shm/tclforge-metrics" if os.path.isdir("/dev/shm") else os.path.join(tempfile.gettempdir(), "tclforge-metrics")
+    return Path(base)
+
+
+def process_alive(pid):
+    """
+    False once ``pid`` has exited, so files it left behind can go.  Always
+    True on Windows, where ``os.kill(pid, 0)`` terminates the process
+    instead of probing it.
+    """
+    if sys.platform == "win32":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass   # alive, but owned by another user
+    return True
+
+
+def metrics_dir():
+    """Directory shared by all workers of the current gunicorn master."""
+    return metrics_root() / str(os.getppid())
+
+
+class WorkerHistograms:
+    """This process's histograms, stored as float64 rows in a memory-mapped file."""
+
+    def __init__(self, directory):
+        directory.mkdir(parents=True, exist_ok=True)
+        self._prune_dead_masters(directory.parent)
+        self._keys_path = directory / f"{os.getpid()}.keys"
+        self._keys_path.write_text("")
+        with open(directory / f"{os.getpid()}.values", "wb+") as f:
+            f.truncate(MAX_SERIES * ROW * 8)
+            self._mmap = mmap.mmap(f.fileno(), MAX_SERIES * ROW * 8)
+        self._values = memoryview(self._mmap).cast("d")
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prune_dead_masters(root):
+        for generation in root.iterdir():
+            if not generation.name.isdigit() or int(generation.name) == os.getppid():
+                continue
+            if not process_alive(int(generation.name)):
+                for path in generation.iterdir():
+                    path.unlink(missing_ok=True)
+                generation.rmdir()
+
+    def _row(self, route, name):
+        key = (route, name)
+        row = self._rows.get(key)
+        if row is None:
+            if len(self._rows) >= MAX_SERIES:
+                return None  # out of slots: drop rather than grow without bound
+            row = len(self._rows)
+            # The value row is zero until the key is appended, so readers never see a half-made series.
+            with open(self._keys_path, "a", encoding="utf-8") as f:
+                f.write(f"{route}\t{name}\n")
+            self._rows[key] = row
+        return row
+
+    def observe(self, route, name, seconds):
+        with self._lock:
+            row = self._row(route, name)
+            if row is None:
+                return
+            base = row * ROW
+            values = self._values
+            values[base] += 1
+            values[base + 1] += seconds
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    values[base + 2 + i] += 1
+                    break
+            else:
+                values[base + 2 + len(BUCKETS)] += 1
+
+
+def read_all(directory):
+    """Sum every worker's rows: ``{(route, phase): [count, sum, b0, ..., inf]}``."""
+    totals = {}
+    if not directory.is_dir():
+        return totals
+    for keys_path in directory.glob("*.keys"):
+        values_path = keys_path.with_suffix(".values")
+        try:
+            keys = keys_path.read_text(encoding="utf-8").splitlines()
+            data = memoryview(values_path.read_bytes()).cast("d")
+        except (OSError, TypeError):
+            continue
+        for row, line in enumerate(keys):
+            route, _, name = line.partition("\t")
+            series = totals.setdefault((route, name), [0.0] * ROW)
+            for i in range(ROW):
+                series[i] += data[row * ROW + i]
+    return totals
+
+
+def render_prometheus(totals):
+    lines = [
+        "# HELP tclforge_request_phase_seconds Time spent per request, split by dependency phase.",
+        "# TYPE tclforge_request_phase_seconds histogram",
+    ]
+    for (route, name), series in sorted(totals.items()):
+        labels = 'route="%s",phase="%s"' % (route.replace("\\", "\\\\").replace('"', '\\"'), name)
+        cumulative = 0.0
+        for i, bound in enumerate(BUCKETS):
+            cumulative += series[2 + i]
+            lines.append(f'tclforge_request_phase_seconds_bucket{{{labels},le="{bound}"}} {cumulative:.0f}')
+        lines.append(f'tclforge_request_phase_seconds_bucket{{{labels},le="+Inf"}} {series[0]:.0f}')
+        lines.append(f"tclforge_request_phase_seconds_sum{{{labels}}} {series[1]:.6f}")
+        lines.append(f"tclforge_request_phase_seconds_count{{{labels}}} {series[0]:.0f}")
+    return "\n".join(lines) + "\n"
+
+
+class WorkerCounters:
+    """This process's named, ever-increasing counters, as float64 slots in a memory-mapped file."""
+
+    def __init__(self, directory):
+        directory.mkdir(parents=True, exist_ok=True)
+        self._keys_path = directory / f"{os.getpid()}.counter_keys"
+        self._keys_path.write_text("")
+        with open(directory / f"{os.getpid()}.counters", "wb+") as f:
+            f.truncate(MAX_COUNTERS * 8)
+            self._mmap = mmap.mmap(f.fileno(), MAX_COUNTERS * 8)
+        self._values = memoryview(self._mmap).cast("d")
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, amount=1):
+        with self._lock:
+            slot = self._slots.get(name)
+            if slot is None:
+                if len(self._slots) >= MAX_COUNTERS:
+                    return
+                slot = len(self._slots)
+                with open(self._keys_path, "a", encoding="utf-8") as f:
+                    f.write(name + "\n")
+                self._slots[name] = slot
+            self._values[slot] += amount
+
+
+def read_counters(directory):
+    """Sum every worker's counters: ``{name: total}``."""
+    totals = {}
+    if not directory.is_dir():
+        return totals
+    for keys_path in directory.glob("*.counter_keys"):
+        try:
+            names = keys_path.read_text(encoding="utf-8").splitlines()
+            data = memoryview(keys_path.with_suffix(".counters").read_bytes()).cast("d")
+        except (OSError, TypeError):
+            continue
+        for slot, name in enumerate(names):
+            totals[name] = totals.get(name, 0.0) + data[slot]
+    return totals
+
+
+def render_counters(totals):
+    lines = []
+    for name, value in sorted(totals.items()):
+        lines.append(f"# TYPE tclforge_{name}_total counter")
+        lines.append(f"tclforge_{name}_total {value:.0f}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+_worker = None
+_worker_pid = None
+_counters = None
+_counters_pid = None
+
+
+def worker_histograms():
+    """This process's histograms (recreated after a fork, e.g. gunicorn --preload)."""
+    global _worker, _worker_pid
+    if _worker is None or _worker_pid != os.getpid():
+        _worker = WorkerHistograms(metrics_dir())
+        _worker_pid = os.getpid()
+    return _worker
+
+
+def count(name, amount=1):
+    """Add ``amount`` to this worker's ``name`` counter (exported as ``tclforge_<name>_total``)."""
+    global _counters, _counters_pid
+    if _counters is None or _counters_pid != os.getpid():
+        _counters = WorkerCounters(metrics_dir())
+        _counters_pid = os.getpid()
+    _counters.add(name, amount)
+
+
+# =====================================================
+# 🔹 MIDDLEWARE + ENDPOINT
+# =====================================================
+class RequestMetricsMiddleware:
+    """Times each request and records its phase breakdown per route."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        phases = {}
+        token = _phases.set(phases)
+        start = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            total = time.perf_counter() - start
+            _phases.reset(token)
+            match = getattr(request, "resolver_match", None)
+            route = match.route if match is not None else "unmatched"
+            histograms = worker_histograms()
+            for name, seconds in phases.items():
+                histograms.observe(route, name, seconds)
+            histograms.observe(route, "app", max(total - sum(phases.values()), 0.0))
+            histograms.observe(route, "total", total)
+
+
+def bearer_ok(request, token):
+    """Whether ``request`` carries ``Authorization: Bearer <token>``; never when ``token`` is unset."""
+    if not token:
+        return False
+    supplied = request.headers.get("Authorization") or ""
+    # Constant time; bytes, because compare_digest raises TypeError for a str with non-ASCII characters.
+    return hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode())
+
+
+def metrics_view(request):
+    """Prometheus text exposition of every worker's histograms (requires METRICS_TOKEN)."""
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if not token:
+        return HttpResponse("Forbidden: METRICS_TOKEN is not set\n", status=403, content_type="text/plain")
+    if not bearer_ok(request, token):
+        return HttpResponse("Unauthorized\n", status=401, content_type="text/plain")
+    body = render_prometheus(read_all(metrics_dir())) + render_counters(read_counters(metrics_dir()))
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
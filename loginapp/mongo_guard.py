@@ -0,0 +1,215 @@
+"""
+Request deadlines and a circuit breaker for every MongoDB call.
+
+``settings.*_COLLECTION`` are ``GuardedCollection`` proxies, defined even
+when Mongo was unreachable at boot.  Each operation:
+
+* runs inside ``pymongo.timeout(remaining)``, so the driver turns what is
+  left of the request's ``MONGO_REQUEST_DEADLINE_MS`` into ``maxTimeMS``
+  and socket / server-selection timeouts (``MONGO_OPERATION_TIMEOUT_MS``
+  outside a request);
+* goes through this worker's ``CircuitBreaker``: after
+  ``MONGO_BREAKER_FAILURES`` consecutive connection errors or timeouts it
+  opens and calls fail immediately; after ``MONGO_BREAKER_RESET_SECONDS``
+  one probe call is let through (half-open) and its outcome closes or
+  re-opens the breaker.
+
+Both failure modes raise ``MongoUnavailable``, which
+``MongoDeadlineMiddleware`` turns into a 503 with ``Retry-After``.
+Cursors returned by ``find`` are only guarded when created.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+
+import pymongo
+import pymongo.errors
+from django.conf import settings
+from django.http import JsonResponse
+
+
+logger = logging.getLogger(__name__)
+
+GUARDED_METHODS = frozenset({
+    "find", "find_one", "find_one_and_update", "find_one_and_delete", "insert_one", "insert_many",
+    "update_one", "update_many", "delete_one", "delete_many", "replace_one", "bulk_write",
+    "aggregate", "count_documents", "create_index",
+})
+
+_deadline = contextvars.ContextVar("mongo_deadline", default=None)
+
+
+class MongoUnavailable(Exception):
+    """Mongo cannot be used for this call: breaker open, deadline spent, or connection failure."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_availability_error(exc):
+    """Errors that say Mongo is down or slow, as opposed to a bad query or a duplicate key."""
+    return isinstance(exc, pymongo.errors.ConnectionFailure) or getattr(exc, "timeout", False)
+
+
+# =====================================================
+# 🔹 DEADLINES
+# =====================================================
+def remaining():
+    """Seconds left for Mongo calls in the current request (or the per-operation default)."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return getattr(settings, "MONGO_OPERATION_TIMEOUT_MS", 2000) / 1000
+    return deadline - time.monotonic()
+
+
+class deadline:
+    """``with deadline(seconds):`` bounds the Mongo calls inside; nested deadlines never extend the outer one."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __enter__(self):
+        until = time.monotonic() + self.seconds
+        outer = _deadline.get()
+        self._token = _deadline.set(until if outer is None else min(until, outer))
+        return self
+
+    def __exit__(self, *exc):
+        _deadline.reset(self._token)
+
+
+# =====================================================
+# 🔹 CIRCUIT BREAKER
+# =====================================================
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failures, reset_seconds, clock=time.monotonic):
+        self.threshold = failures
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise ``MongoUnavailable`` unless the call may go ahead; returns whether it is the probe."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+            wait = self.opened_at + self.reset_seconds - self.clock()
+            if self.state == self.OPEN and wait <= 0:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+        raise MongoUnavailable("Database temporarily unavailable", retry_after=max(1, round(wait)))
+
+    def record_success(self, probe=False):
+        with self._lock:
+            if probe or self.state != self.CLOSED:
+                logger.warning("MongoDB circuit breaker closed; service restored")
+            self.state, self.failures, self._probing = self.CLOSED, 0, False
+
+    def record_failure(self, probe=False):
+        with self._lock:
+            self.failures += 1
+            if probe:
+                self._probing = False
+            if probe or (self.state == self.CLOSED and self.failures >= self.threshold):
+                self.state, self.opened_at = self.OPEN, self.clock()
+                logger.error("MongoDB circuit breaker opened after %d consecutive failures; "
+                             "failing fast for %ss", self.failures, self.reset_seconds)
+
+    def release_probe(self):
+        """The probe ended without reaching the server; let another one through."""
+        with self._lock:
+            self._probing = False
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def breaker():
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    failures=getattr(settings, "MONGO_BREAKER_FAILURES", 5),
+                    reset_seconds=getattr(settings, "MONGO_BREAKER_RESET_SECONDS", 10),
+                )
+    return _breaker
+
+
+# =====================================================
+# 🔹 COLLECTION PROXY
+# =====================================================
+class GuardedCollection:
+    """Proxy for a pymongo ``Collection`` (or ``None`` if the client could not be created)."""
+
+    def __init__(self, collection, name=None):
+        self.wrapped = collection
+        self.name = name or collection.name
+
+    @classmethod
+    def from_db(cls, db, name):
+        return cls(db[name] if db is not None else None, name)
+
+    def __getattr__(self, name):
+        if self.wrapped is None:
+            raise MongoUnavailable("Database is not configured")
+        attr = getattr(self.wrapped, name)
+        if name not in GUARDED_METHODS:
+            return attr
+
+        def call(*args, **kwargs):
+            left = remaining()
+            if left <= 0:
+                raise MongoUnavailable("Request deadline exceeded before calling the database")
+            circuit = breaker()
+            probe = circuit.before_call()
+            try:
+                with pymongo.timeout(left):
+                    result = attr(*args, **kwargs)
+            except pymongo.errors.PyMongoError as e:
+                if is_availability_error(e):
+                    circuit.record_failure(probe)
+                    raise MongoUnavailable(f"Database call failed: {type(e).__name__}") from e
+                circuit.record_success(probe)   # the server answered (e.g. duplicate key)
+                raise
+            except BaseException:
+                if probe:
+                    circuit.release_probe()
+                raise
+            circuit.record_success(probe)
+            return result
+        return call
+
+
+# =====================================================
+# 🔹 MIDDLEWARE
+# =====================================================
+class MongoDeadlineMiddleware:
+    """Starts each request's Mongo deadline and answers ``MongoUnavailable`` with a 503."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with deadline(settings.MONGO_REQUEST_DEADLINE_MS / 1000):
+            return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, MongoUnavailable):
+            return None
+        logger.warning("%s %s -> 503: %s", request.method, request.path, exception)
+        response = JsonResponse({"error": "Service temporarily unavailable, please retry shortly"}, status=503)
+        response["Retry-After"] = str(exception.retry_after)
+        return response
@@ -0,0 +1,219 @@
+"""
+Mongo round-trip accounting and slow-command log.
+
+``MongoCommandMonitor`` is registered on the ``MongoClient`` in settings and
+sees every command pymongo sends:
+
+* inside a request, each command is counted against the request, and
+  ``MongoBudgetMiddleware`` logs a warning (or raises, with
+  ``MONGO_ROUND_TRIP_STRICT``) when a route makes more round trips than
+  ``MONGO_ROUND_TRIP_BUDGETS`` allows;
+* any command slower than ``MONGO_SLOW_COMMAND_MS`` is logged with its filter
+  shape (values replaced by their types) and, once per shape, the query
+  planner's winning plan, e.g. ``FETCH <- IXSCAN {email: 1}`` or ``COLLSCAN``.
+
+Tests can pin a view's cost with :class:`MongoRoundTripsMixin`::
+
+    with self.assertMongoRoundTrips(2):
+        self.client.post("/login", ...)
+"""
+
+import contextvars
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from pymongo import monitoring
+
+
+logger = logging.getLogger(__name__)
+
+# Commands that are driver housekeeping, not round trips made by our code.
+IGNORED_COMMANDS = frozenset({"hello", "ismaster", "isMaster", "ping", "buildInfo", "endSessions", "explain"})
+# Command field that carries the filter, per command name.
+FILTER_FIELDS = {"find": "filter", "count": "query", "distinct": "query", "findAndModify": "query"}
+
+_current = contextvars.ContextVar("mongo_round_trips", default=None)
+
+
+class RoundTripBudgetExceeded(AssertionError):
+    """Raised in strict mode when a request goes over its Mongo round-trip budget."""
+
+
+class RoundTrips:
+    """Commands issued while handling one request (or one test block)."""
+
+    def __init__(self, parent=None):
+        self.commands = []   # (command name, collection)
+        self.parent = parent  # enclosing tracker, e.g. a test block around a request
+
+    def add(self, name, collection):
+        trips = self
+        while trips is not None:
+            trips.commands.append((name, collection))
+            trips = trips.parent
+
+    def __len__(self):
+        return len(self.commands)
+
+    def summary(self):
+        return ", ".join(f"{name} {collection}" for name, collection in self.commands)
+
+
+@contextmanager
+def track():
+    """Count the Mongo commands issued by the block; yields a :class:`RoundTrips`."""
+    trips = RoundTrips(_current.get())
+    token = _current.set(trips)
+    try:
+        yield trips
+    finally:
+        _current.reset(token)
+
+
+# =====================================================
+# 🔹 FILTER SHAPE + PLAN SUMMARY
+# =====================================================
+def filter_shape(value):
+    """Replace the values of a query with their type names, keeping operators and fields."""
+    if isinstance(value, dict):
+        return {key: filter_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [filter_shape(value[0])] if value else []
+    return type(value).__name__
+
+
+def command_filter(name, command):
+    if name in FILTER_FIELDS:
+        return command.get(FILTER_FIELDS[name])
+    if name in ("update", "delete"):
+        key = "updates" if name == "update" else "deletes"
+        statements = command.get(key) or [{}]
+        return statements[0].get("q")
+    if name == "aggregate":
+        stages = command.get("pipeline") or [{}]
+        return stages[0].get("$match")
+    return None
+
+
+def plan_summary(explain_reply):
+    """``FETCH <- IXSCAN {email: 1}`` style summary of the winning plan."""
+    plan = (explain_reply.get("queryPlanner") or {}).get("winningPlan") or {}
+    plan = plan.get("queryPlan", plan)   # slot-based engine nests the classic plan
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if plan.get("keyPattern"):
+            stage += " " + ", ".join(f"{k}: {v}" for k, v in plan["keyPattern"].items()).join("{}")
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " <- ".join(stages) or "unknown"
+
+
+# =====================================================
+# 🔹 COMMAND LISTENER
+# =====================================================
+class MongoCommandMonitor(monitoring.CommandListener):
+    """Counts commands per request and logs slow ones with their filter shape and plan."""
+
+    def __init__(self):
+        self._pending = {}          # (connection, request id) -> (name, collection, filter, command, db)
+        self._explained = set()     # shapes whose plan has already been logged
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        name = event.command_name
+        if name in IGNORED_COMMANDS:
+            return
+        collection = event.command.get(name)
+        collection = collection if isinstance(collection, str) else ""
+        trips = _current.get()
+        if trips is not None:
+            trips.add(name, collection)
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (
+                name, collection, command_filter(name, event.command), event.command, event.database_name,
+            )
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def _finished(self, event):
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        millis = event.duration_micros / 1000
+        if millis < getattr(settings, "MONGO_SLOW_COMMAND_MS", 100):
+            return
+        name, collection, query, command, database = pending
+        shape = filter_shape(query) if query is not None else None
+        logger.warning("Slow Mongo command: %s %s.%s %.1f ms filter=%s", name, database, collection, millis, shape)
+        key = (database, collection, name, repr(shape))
+        with self._lock:
+            if key in self._explained or len(self._explained) >= 1000:
+                return
+            self._explained.add(key)
+        # Explaining from inside the listener would block the caller on another round trip.
+        threading.Thread(target=self._explain, args=(name, collection, command, database), daemon=True).start()
+
+    @staticmethod
+    def _explain(name, collection, command, database):
+        client = getattr(settings, "MONGO_CLIENT", None)
+        if client is None or name not in (*FILTER_FIELDS, "update", "delete", "aggregate"):
+            return
+        explained = {k: v for k, v in command.items() if not k.startswith("$") and k not in ("lsid", "txnNumber")}
+        try:
+            reply = client[database].command({"explain": explained, "verbosity": "queryPlanner"})
+        except Exception as e:
+            logger.info("Could not explain slow %s on %s: %s", name, collection, e)
+            return
+        logger.warning("Slow Mongo command plan: %s %s: %s", name, collection, plan_summary(reply))
+
+
+# =====================================================
+# 🔹 PER-ROUTE BUDGETS
+# =====================================================
+def budget_for(route):
+    budgets = getattr(settings, "MONGO_ROUND_TRIP_BUDGETS", {})
+    return budgets.get(route, getattr(settings, "MONGO_ROUND_TRIP_DEFAULT_BUDGET", None))
+
+
+class MongoBudgetMiddleware:
+    """Flags requests that make more Mongo round trips than their route's budget."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with track() as trips:
+            response = self.get_response(request)
+
+        match = getattr(request, "resolver_match", None)
+        route = match.route if match is not None else None
+        budget = budget_for(route) if route is not None else None
+        if budget is not None and len(trips) > budget:
+            message = f"/{route} made {len(trips)} Mongo round trips (budget {budget}): {trips.summary()}"
+            if getattr(settings, "MONGO_ROUND_TRIP_STRICT", False):
+                raise RoundTripBudgetExceeded(message)
+            logger.warning(message)
+        if settings.DEBUG:
+            response["X-Mongo-Round-Trips"] = str(len(trips))
+        return response
+
+
+class MongoRoundTripsMixin:
+    """TestCase mixin: ``with self.assertMongoRoundTrips(n): ...``, like ``assertNumQueries``."""
+
+    @contextmanager
+    def assertMongoRoundTrips(self, expected):
+        with track() as trips:
+            yield trips
+        self.assertEqual(
+            len(trips), expected,
+            f"{len(trips)} Mongo round trips, expected {expected}: {trips.summary()}",
+        )
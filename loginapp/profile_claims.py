@@ -0,0 +1,46 @@
+"""
+The ``/me`` profile, built from the user document or from access-token claims.
+
+With ``PROFILE_CLAIMS_IN_TOKEN``, ``/login`` copies ``username`` and
+``created_at`` plus a profile version (``pv``, a hash of the profile) into
+the access token, and ``/me`` answers from those claims without touching
+Mongo.  Nothing in the API edits a profile today; if that changes, the
+claims stay as they were until the access token expires.
+
+Either way ``/me`` sends ``ETag: "me-<pv>"``, so the pages' repeated
+``/me`` calls are revalidated by the browser and answered with a 304.
+"""
+
+import hashlib
+import json
+
+
+def from_user(user):
+    created_at = user.get("created_at")
+    return {
+        "username": user.get("username"),
+        "email": user.get("email"),
+        "created_at": created_at.strftime("%Y-%m-%d %H:%M:%S") if created_at else None,
+    }
+
+
+def version(profile):
+    return hashlib.blake2b(json.dumps(profile, sort_keys=True).encode(), digest_size=8).hexdigest()
+
+
+def add_claims(token, profile):
+    token["username"] = profile["username"]
+    token["created_at"] = profile["created_at"]
+    token["pv"] = version(profile)
+
+
+def from_claims(token):
+    """``(profile, version)`` from an access token carrying profile claims, else ``(None, None)``."""
+    if "pv" not in token:
+        return None, None
+    profile = {"username": token.get("username"), "email": token.get("email"), "created_at": token.get("created_at")}
+    return profile, token["pv"]
+
+
+def etag(profile_version):
+    return f'"me-{profile_version}"'
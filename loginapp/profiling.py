@@ -0,0 +1,130 @@
+"""
+On-demand profiling of single requests.
+
+A request carrying ``X-Profile: <PROFILE_TOKEN>`` (or ``?__profile=<token>``)
+is run under a sampling profiler: a helper thread snapshots the request
+thread's stack every ``PROFILE_SAMPLE_INTERVAL`` seconds.  The samples are
+stored as collapsed stacks (``frame;frame;frame count`` per line), which
+speedscope and flamegraph.pl both open directly, in ``PROFILE_DIR``.  Only
+the newest ``PROFILE_MAX_FILES`` profiles are kept.
+
+Untriggered requests pay one dictionary lookup; with no ``PROFILE_TOKEN``
+configured the middleware removes itself from the stack.
+
+    python manage.py profiles list
+    python manage.py profiles show <id> > request.collapsed
+"""
+
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+
+SUFFIX = ".collapsed"
+
+
+def profile_dir():
+    return Path(getattr(settings, "PROFILE_DIR", None) or Path(settings.BASE_DIR) / "profiles")
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a helper thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+# =====================================================
+# 🔹 ON-DISK RING
+# =====================================================
+def save(method, path, elapsed, collapsed):
+    """Write a profile and drop the oldest ones beyond ``PROFILE_MAX_FILES``; returns its id."""
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    header = f"# {method} {path} {elapsed * 1000:.1f} ms\n"
+    (directory / f"{profile_id}{SUFFIX}").write_text(header + collapsed, encoding="utf-8")
+
+    profiles = sorted(directory.glob(f"*{SUFFIX}"))
+    for old in profiles[:-settings.PROFILE_MAX_FILES]:
+        old.unlink(missing_ok=True)
+    return profile_id
+
+
+def list_profiles():
+    """``[(id, header line, sample count), ...]``, newest first."""
+    found = []
+    for path in sorted(profile_dir().glob(f"*{SUFFIX}"), reverse=True):
+        lines = path.read_text(encoding="utf-8").splitlines()
+        header = lines[0].lstrip("# ") if lines else ""
+        samples = sum(int(line.rsplit(" ", 1)[1]) for line in lines[1:] if line)
+        found.append((path.stem, header, samples))
+    return found
+
+
+def load(profile_id):
+    path = profile_dir() / f"{Path(profile_id).name}{SUFFIX}"
+    return path.read_text(encoding="utf-8") if path.is_file() else None
+
+
+# =====================================================
+# 🔹 MIDDLEWARE
+# =====================================================
+class ProfilingMiddleware:
+    """Profiles requests that present the profiling token."""
+
+    def __init__(self, get_response):
+        self.token = getattr(settings, "PROFILE_TOKEN", None)
+        if not self.token:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        supplied = request.headers.get("X-Profile") or request.GET.get("__profile")
+        # Bytes: compare_digest raises TypeError for a str with non-ASCII characters.
+        if not supplied or not hmac.compare_digest(supplied.encode(), self.token.encode()):
+            return self.get_response(request)
+
+        sampler = StackSampler(threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        elapsed = time.perf_counter() - start
+        response["X-Profile-Id"] = save(request.method, request.path, elapsed, sampler.collapsed())
+        return response
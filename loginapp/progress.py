@@ -0,0 +1,190 @@
+"""
+Server-side learner progress with batched delta sync.
+
+Each user has one document in ``settings.PROGRESS_COLLECTION`` holding what used to
+live only in the browser's localStorage:
+
+    quiz_scores       concept title -> result text      (last write wins, $set)
+    snippets          concept title -> saved code       (last write wins, $set)
+    challenge_scores  "gen-3"       -> best score       (highest wins, $max)
+    unlocked          ["gen-1", ...]                    (union, $addToSet)
+    viewed_concepts   [0, 3, ...]                       (union, $addToSet)
+
+A client sends every pending change in one ``/progress/sync`` call.  The
+batch is applied with a single atomic update; the merge rule of each field
+resolves conflicts between devices.  ``clock`` is the version vector of the
+last batch applied per client, so a retried batch is never applied twice.
+Every touched key gets a server timestamp in ``changed``; the client passes
+back the ``version`` it last saw and receives only keys changed since then.
+"""
+
+from urllib.parse import unquote
+
+from bson.timestamp import Timestamp
+from django.conf import settings
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from loginapp import leaderboard
+
+
+LWW_MAPS = ("quiz_scores", "snippets")
+MAX_MAPS = ("challenge_scores",)
+SETS = ("unlocked", "viewed_concepts")
+FIELDS = LWW_MAPS + MAX_MAPS + SETS
+
+
+class ProgressError(ValueError):
+    """Raised for a malformed sync batch."""
+
+
+def encode_key(key):
+    """Make a user-supplied key safe as a Mongo field name (no '.' or '$')."""
+    return str(key).replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def decode_key(key):
+    return unquote(key)
+
+
+def parse_version(version):
+    """``"<time>.<inc>"`` as returned by :func:`format_version` -> ``Timestamp``."""
+    if not version:
+        return None
+    try:
+        time, inc = (int(part) for part in str(version).split("."))
+        return Timestamp(time, inc)
+    except (TypeError, ValueError):
+        raise ProgressError("Invalid version")
+
+
+def format_version(timestamp):
+    return f"{timestamp.time}.{timestamp.inc}" if timestamp else None
+
+
+# =====================================================
+# 🔹 BATCH -> ONE ATOMIC UPDATE
+# =====================================================
+def build_update(client_id, seq, deltas):
+    """Fold a batch of deltas into a single ``$set``/``$max``/``$addToSet`` update."""
+    if not isinstance(deltas, list) or len(deltas) > settings.PROGRESS_MAX_DELTAS:
+        raise ProgressError(f"Deltas must be a list of at most {settings.PROGRESS_MAX_DELTAS} items")
+
+    resets = {}   # field -> replacement value built from the batch
+    sets, maxes, additions, touched = {}, {}, {}, set()
+    for delta in deltas:
+        if not isinstance(delta, dict) or delta.get("field") not in FIELDS:
+            raise ProgressError("Unknown progress field")
+        field, value = delta["field"], delta.get("value")
+
+        if delta.get("op") == "reset":
+            resets[field] = [] if field in SETS else {}
+            for path in [p for p in list(sets) + list(maxes) if p.startswith(field + ".")]:
+                sets.pop(path, None)
+                maxes.pop(path, None)
+            additions.pop(field, None)
+            continue
+
+        if field in SETS:
+            if not isinstance(value, (str, int)) or isinstance(value, bool):
+                raise ProgressError(f"{field} values must be strings or integers")
+            target = resets[field] if field in resets else additions.setdefault(field, [])
+            if value not in target:
+                target.append(value)
+            touched.add(f"changed.{field}")
+            continue
+
+        key = delta.get("key")
+        if not isinstance(key, str) or not key or len(key) > 200:
+            raise ProgressError(f"{field} deltas need a key")
+        path = f"{field}.{encode_key(key)}"
+        touched.add(f"changed.{path}")
+
+        if field in MAX_MAPS:
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or not 0 <= value <= 100:
+                raise ProgressError(f"{field} values must be numbers between 0 and 100")
+            if field in resets:
+                resets[field][encode_key(key)] = max(value, resets[field].get(encode_key(key), value))
+            else:
+                maxes[path] = max(value, maxes.get(path, value))
+        else:
+            if not isinstance(value, str) or len(value) > settings.PROGRESS_MAX_VALUE_CHARS:
+                raise ProgressError(f"{field} values must be strings of at most {settings.PROGRESS_MAX_VALUE_CHARS} characters")
+            if field in resets:
+                resets[field][encode_key(key)] = value
+            else:
+                sets[path] = value
+
+    sets.update(resets)
+    maxes[f"clock.{encode_key(client_id)}"] = seq
+    stamps = {path: {"$type": "timestamp"} for path in touched}
+    stamps.update({f"reset_at.{field}": {"$type": "timestamp"} for field in resets})
+    stamps["version"] = {"$type": "timestamp"}
+
+    update = {"$max": maxes, "$currentDate": stamps}
+    if sets:
+        update["$set"] = sets
+    if additions:
+        update["$addToSet"] = {field: {"$each": values} for field, values in additions.items()}
+    return update
+
+
+def changes_since(doc, since):
+    """Return ``(changes, replaced_fields)`` for everything modified after ``since``."""
+    changes, replaced = {}, []
+    changed = doc.get("changed", {})
+    reset_at = doc.get("reset_at", {})
+
+    for field in FIELDS:
+        value = doc.get(field, [] if field in SETS else {})
+        if since is None or (reset_at.get(field) and reset_at[field] > since):
+            replaced.append(field)
+        elif field in SETS:
+            if not (changed.get(field) and changed[field] > since):
+                continue
+        else:
+            stamps = changed.get(field, {})
+            value = {k: v for k, v in value.items() if stamps.get(k) and stamps[k] > since}
+            if not value:
+                continue
+        changes[field] = value if field in SETS else {decode_key(k): v for k, v in value.items()}
+    return changes, replaced
+
+
+def sync(email, client_id, seq, since, deltas):
+    """Apply one batch (if new) and return the response payload."""
+    collection = settings.PROGRESS_COLLECTION
+    since = parse_version(since)
+    applied = False
+
+    if deltas:
+        if not isinstance(client_id, str) or not client_id or len(client_id) > 64:
+            raise ProgressError("client_id is required")
+        if not isinstance(seq, int) or isinstance(seq, bool) or seq < 1:
+            raise ProgressError("seq must be a positive integer")
+        update = build_update(client_id, seq, deltas)
+        try:
+            # Matches only if this client's batch ``seq`` is new; otherwise the
+            # upsert collides with the existing document and nothing is applied.
+            doc = collection.find_one_and_update(
+                {"_id": email, f"clock.{encode_key(client_id)}": {"$not": {"$gte": seq}}},
+                update,
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            applied = True
+            if any(delta.get("field") == "challenge_scores" for delta in deltas):
+                leaderboard.record(email, doc)
+        except DuplicateKeyError:
+            doc = collection.find_one({"_id": email})
+    else:
+        doc = collection.find_one({"_id": email}) or {}
+
+    changes, replaced = changes_since(doc, since)
+    return {
+        "applied": applied,
+        "version": format_version(doc.get("version")) or format_version(since),
+        "clock": {decode_key(k): v for k, v in doc.get("clock", {}).items()},
+        "changes": changes,
+        "replace": replaced,
+    }
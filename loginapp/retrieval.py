@@ -0,0 +1,274 @@
+"""
+Local BM25 retrieval over the notes decks and interview prep content.
+
+Used by the chatbot proxy to answer questions that our own material already
+covers without a model call, and to ground the rest with the best matches.
+
+The index is built once (``python manage.py build_retrieval_index`` or on
+first use), stored as plain ``.npy`` arrays and memory-mapped on load, so
+every worker shares the same pages and a lookup is a handful of vectorized
+NumPy operations.  Rebuilds replace the files by rename, so a running
+worker keeps its mapping until ``reload_if_rebuilt()`` picks up the new one.
+"""
+
+import html
+import json
+import os
+import re
+import threading
+import zipfile
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+
+
+INDEX_VERSION = 1
+K1 = 1.5
+B = 0.75
+
+STOPWORDS = frozenset("""
+    a an and are as at be by can do does for from how i in is it me my of on
+    or so tcl that the this to use used using what when where which why will
+    with you your
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9_]+")
+_SLIDE_TEXT = re.compile(r"<a:t>([^<]*)</a:t>|</a:p>")
+_INTERVIEW_TOOL = re.compile(r"^\s*(\w+):\s*\[", re.M)
+_INTERVIEW_ITEM = re.compile(r'\{\s*id:\s*(\d+),\s*question:\s*"((?:[^"\\]|\\.)*)",\s*command:\s*"((?:[^"\\]|\\.)*)"\s*\}')
+
+
+def tokenize(text):
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+# =====================================================
+# 🔹 CHUNKING
+# =====================================================
+def notes_chunks(path):
+    """One chunk per slide of a ``.pptx`` deck."""
+    deck = path.stem.replace("TCL_", "").replace("_", " ")
+    with zipfile.ZipFile(path) as archive:
+        slides = sorted(
+            (n for n in archive.namelist() if re.fullmatch(r"ppt/slides/slide\d+\.xml", n)),
+            key=lambda n: int(re.search(r"\d+", n).group()),
+        )
+        for number, name in enumerate(slides, start=1):
+            xml = archive.read(name).decode("utf-8", "replace")
+            lines, current = [], []
+            for match in _SLIDE_TEXT.finditer(xml):
+                if match.group(1) is None:
+                    if current:
+                        lines.append("".join(current).strip())
+                    current = []
+                else:
+                    current.append(html.unescape(match.group(1)))
+            lines = [line for line in lines if line]
+            if lines:
+                yield {
+                    "source": f"notes/{path.name}#slide{number}",
+                    "title": f"{deck} notes: {lines[0]}",
+                    "text": "\n".join(lines),
+                }
+
+
+def interview_chunks(path):
+    """One chunk per question/command pair in the interview prep page."""
+    source = path.read_text(encoding="utf-8")
+    tools = [(m.start(), m.group(1)) for m in _INTERVIEW_TOOL.finditer(source)]
+    for match in _INTERVIEW_ITEM.finditer(source):
+        tool = next((name for start, name in reversed(tools) if start < match.start()), "tcl")
+        question = match.group(2).replace('\\"', '"')
+        command = match.group(3).replace('\\"', '"')
+        yield {
+            "source": f"{path.name}#{tool}-{match.group(1)}",
+            "title": question,
+            "text": f"{question}\n{command}",
+            "answer": f"{question}\n\n`{command}`",
+        }
+
+
+def source_files():
+    templates = Path(settings.TEMPLATE_DIR)
+    notes = sorted(p for p in (templates / "notes").glob("*.pptx") if not p.name.startswith("~$"))
+    return notes + [templates / "TCL_Interview_Pre.html"]
+
+
+def manifest():
+    """Fingerprint of the source files; the index is rebuilt when it changes."""
+    files = {}
+    for path in source_files():
+        if path.exists():
+            stat = path.stat()
+            files[path.name] = [stat.st_size, stat.st_mtime_ns]
+    return {"version": INDEX_VERSION, "k1": K1, "b": B, "files": files}
+
+
+# =====================================================
+# 🔹 BUILD (BM25 weights, term-major CSC arrays on disk)
+# =====================================================
+def build_index(index_dir=None):
+    """Chunk every source, compute BM25 weights and write the index files."""
+    index_dir = Path(index_dir or settings.RETRIEVAL_INDEX_DIR)
+    chunks = []
+    for path in source_files():
+        if not path.exists():
+            continue
+        chunks.extend(notes_chunks(path) if path.suffix == ".pptx" else interview_chunks(path))
+
+    vocabulary = {}
+    rows, cols = [], []
+    lengths = np.zeros(len(chunks), dtype=np.float32)
+    for row, chunk in enumerate(chunks):
+        tokens = tokenize(f"{chunk['title']} {chunk['text']}")
+        lengths[row] = len(tokens)
+        for token in tokens:
+            rows.append(row)
+            cols.append(vocabulary.setdefault(token, len(vocabulary)))
+
+    # Duplicate (row, col) pairs are summed, giving raw term frequencies.
+    tf = sparse.coo_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(len(chunks), len(vocabulary)),
+    ).tocsc()
+    tf.sum_duplicates()
+
+    doc_freq = np.diff(tf.indptr).astype(np.float32)
+    idf = np.log1p((len(chunks) - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+    norm = K1 * (1 - B + B * lengths / max(lengths.mean(), 1.0)) if len(chunks) else lengths
+    term_of_entry = np.repeat(np.arange(len(vocabulary)), np.diff(tf.indptr))
+    tf.data = (idf[term_of_entry] * tf.data * (K1 + 1) / (tf.data + norm[tf.indices])).astype(np.float32)
+
+    index_dir.mkdir(parents=True, exist_ok=True)
+    _replace(index_dir / "weights.npy", lambda f: np.save(f, tf.data))
+    _replace(index_dir / "rows.npy", lambda f: np.save(f, tf.indices.astype(np.int32)))
+    _replace(index_dir / "indptr.npy", lambda f: np.save(f, tf.indptr.astype(np.int64)))
+    _replace(index_dir / "idf.npy", lambda f: np.save(f, idf))
+    _replace(index_dir / "vocabulary.json", lambda f: f.write(json.dumps(vocabulary).encode()))
+    _replace(index_dir / "chunks.json", lambda f: f.write(json.dumps(chunks).encode()))
+    # Written last: a complete manifest marks a complete index.
+    _replace(index_dir / "manifest.json", lambda f: f.write(json.dumps(manifest()).encode()))
+    return len(chunks), len(vocabulary)
+
+
+def _replace(path, write):
+    # New file + rename: workers that have the old arrays memory-mapped keep reading the old inode.
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        write(f)
+    tmp.replace(path)
+
+
+def is_stale(index_dir=None):
+    """True if the index in ``index_dir`` is missing or was built from other source files."""
+    try:
+        with open(Path(index_dir or settings.RETRIEVAL_INDEX_DIR) / "manifest.json", encoding="utf-8") as f:
+            return json.load(f) != manifest()
+    except (OSError, ValueError):
+        return True
+
+
+# =====================================================
+# 🔹 LOOKUP
+# =====================================================
+class RetrievalIndex:
+    def __init__(self, index_dir):
+        index_dir = Path(index_dir)
+        self.manifest_mtime = (index_dir / "manifest.json").stat().st_mtime_ns
+        self.weights = np.load(index_dir / "weights.npy", mmap_mode="r")
+        self.rows = np.load(index_dir / "rows.npy", mmap_mode="r")
+        self.indptr = np.load(index_dir / "indptr.npy", mmap_mode="r")
+        self.idf = np.load(index_dir / "idf.npy", mmap_mode="r")
+        with open(index_dir / "vocabulary.json", encoding="utf-8") as f:
+            self.vocabulary = json.load(f)
+        with open(index_dir / "chunks.json", encoding="utf-8") as f:
+            self.chunks = json.load(f)
+
+    def search(self, query, k=3):
+        """
+        Return up to ``k`` ``(chunk, score, coverage)`` tuples, best first.
+        ``coverage`` is the idf-weighted share of query terms the chunk contains.
+        """
+        terms = np.array(sorted({self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary}), dtype=np.int64)
+        if not terms.size or not self.chunks:
+            return []
+        unknown = sum(1 for t in set(tokenize(query)) if t not in self.vocabulary)
+        query_idf = float(self.idf[terms].sum()) + unknown * float(self.idf.max())
+
+        # Gather the posting lists of all query terms in one go.
+        starts, ends = self.indptr[terms], self.indptr[terms + 1]
+        counts = ends - starts
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        docs = self.rows[positions]
+        scores = np.bincount(docs, weights=self.weights[positions], minlength=len(self.chunks))
+        matched_idf = np.bincount(docs, weights=np.repeat(self.idf[terms], counts), minlength=len(self.chunks))
+
+        k = min(k, len(self.chunks))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (self.chunks[i], float(scores[i]), float(matched_idf[i] / query_idf))
+            for i in top if scores[i] > 0
+        ]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Load the shared index, (re)building it first if the sources changed."""
+    global _index
+    if _index is not None:
+        return _index
+    with _index_lock:
+        if _index is None:
+            index_dir = Path(settings.RETRIEVAL_INDEX_DIR)
+            if is_stale(index_dir):
+                build_index(index_dir)
+            _index = RetrievalIndex(index_dir)
+    return _index
+
+
+def reload():
+    """Drop the loaded index so the next lookup maps the files again."""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def reload_if_rebuilt():
+    """``reload()`` if another process rewrote the index since this one mapped it."""
+    index = _index
+    if index is None:
+        return False
+    try:
+        rebuilt = (Path(settings.RETRIEVAL_INDEX_DIR) / "manifest.json").stat().st_mtime_ns != index.manifest_mtime
+    except OSError:
+        return False
+    if rebuilt:
+        reload()
+    return rebuilt
+
+
+def direct_answer(results):
+    """Return an answer text when the best match is confident enough to skip the model."""
+    if not results:
+        return None
+    chunk, score, coverage = results[0]
+    runner_up = results[1][1] if len(results) > 1 else 0.0
+    if coverage < settings.RETRIEVAL_DIRECT_COVERAGE or score < settings.RETRIEVAL_DIRECT_MARGIN * runner_up:
+        return None
+    return f"{chunk.get('answer', chunk['text'])}\n\n(Source: {chunk['source']})"
+
+
+def grounding_context(results):
+    """Format matches as reference material for the model's system prompt."""
+    useful = [chunk for chunk, _, coverage in results if coverage >= settings.RETRIEVAL_CONTEXT_COVERAGE]
+    if not useful:
+        return ""
+    return "\n\nReference material from TCL Forge (prefer it when relevant):\n" + "\n---\n".join(
+        chunk["text"] for chunk in useful
+    )
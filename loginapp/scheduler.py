@@ -0,0 +1,284 @@
+"""
+In-process periodic jobs, with leader election through a Mongo lease.
+
+Jobs are plain functions registered in :mod:`loginapp.jobs`::
+
+    @scheduler.job(leader=True, timeout=60)
+    def prune_otps():
+        ...
+
+and scheduled by name in ``SCHEDULED_JOBS`` (``{name: interval seconds}``;
+jobs not listed there never run).  Every worker runs one scheduler thread,
+started when the worker boots (``post_worker_init`` in ``gunicorn.conf.py``):
+
+* ``leader=True`` jobs (pruning, index checks on the shared database) run
+  only in the worker holding the lease: a ``SCHEDULER_LOCK_COLLECTION``
+  document ``{_id: "scheduler", owner, expires_at}`` taken and renewed with
+  one ``find_one_and_update`` every ``SCHEDULER_TICK_SECONDS``.  The lease
+  lasts ``SCHEDULER_LEASE_SECONDS``, timed by the Mongo server's clock
+  (``$$NOW``) rather than the hosts'; if the leader dies, another worker
+  (on any host) takes over once it has expired.
+* ``per_host=True`` jobs (the host's SQLite database, its retrieval index
+  files) run once per interval on every host: the worker that takes the
+  host's lock file for the job runs it (see ``HostTurn``).
+* other ``leader=False`` jobs (warming this worker's caches) run in every worker.
+
+The first run of each job is spread over ``SCHEDULER_START_JITTER`` seconds
+and later runs are ``interval`` +/- ``SCHEDULER_JITTER`` apart, so workers
+and hosts do not fire together.  Each run gets its own thread, so a slow
+job never delays the lease renewal or the other jobs.  A run gets
+``timeout`` seconds: its Mongo calls share that deadline, and a run still
+going after it is reported as timed out and is not started again until it
+returns.
+
+Per-job counters on ``/metrics``: ``tclforge_job_<name>_{runs,failures,timeouts,seconds}_total``.
+"""
+
+import atexit
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import pymongo.errors
+from django.conf import settings
+from pymongo import ReturnDocument
+
+from loginapp import metrics, mongo_guard
+
+
+logger = logging.getLogger(__name__)
+
+JOBS = {}
+LOCK_ID = "scheduler"
+
+
+class Job:
+    __slots__ = ("name", "func", "leader", "per_host", "timeout", "next_run", "timeout_at", "running", "overdue")
+
+    def __init__(self, name, func, leader, timeout, per_host=False):
+        self.name = name
+        self.func = func
+        self.leader = leader
+        self.per_host = per_host
+        self.timeout = timeout
+        self.next_run = self.timeout_at = None
+        self.running = self.overdue = False
+
+
+def job(name=None, leader=True, timeout=60, per_host=False):
+    """Register ``func`` as a periodic job; its interval comes from ``SCHEDULED_JOBS[name]``."""
+    def register(func):
+        JOBS[name or func.__name__] = Job(name or func.__name__, func, leader and not per_host, timeout, per_host)
+        return func
+    return register
+
+
+# =====================================================
+# 🔹 LEADER LEASE
+# =====================================================
+class Lease:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.held = False
+
+    def renew(self):
+        """Take or extend the lease; returns whether this process is the leader."""
+        try:
+            # Expiry is set and compared on the server's clock ($$NOW), so skew between hosts cannot make two leaders.
+            doc = settings.SCHEDULER_LOCK_COLLECTION.find_one_and_update(
+                {"_id": LOCK_ID, "$or": [{"owner": self.owner}, {"$expr": {"$lt": ["$expires_at", "$$NOW"]}}]},
+                [{"$set": {"owner": self.owner, "expires_at": {"$add": ["$$NOW", self.seconds * 1000]}}}],
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            held = doc is not None and doc["owner"] == self.owner
+        except pymongo.errors.DuplicateKeyError:
+            held = False   # someone else holds an unexpired lease (the upsert collided with it)
+        except (mongo_guard.MongoUnavailable, pymongo.errors.PyMongoError) as e:
+            logger.log(logging.WARNING if self.held else logging.DEBUG, "Scheduler lease not renewed: %s", e)
+            held = False
+        if held != self.held:
+            logger.info("Scheduler leadership %s (%s)", "acquired" if held else "lost", self.owner)
+        self.held = held
+        return held
+
+    def release(self):
+        if self.held:
+            try:
+                settings.SCHEDULER_LOCK_COLLECTION.delete_one({"_id": LOCK_ID, "owner": self.owner})
+            except (mongo_guard.MongoUnavailable, pymongo.errors.PyMongoError):
+                pass   # expires on its own
+            self.held = False
+
+
+# =====================================================
+# 🔹 PER-HOST TURNS
+# =====================================================
+class HostTurn:
+    """
+    A worker's turn at a ``per_host`` job: an exclusive ``flock`` on
+    ``SCHEDULER_HOST_LOCK_DIR/<job>.lock``, held until the run ends.  The
+    file holds the time of the last run on this host, so the other workers
+    skip the job until ``min_gap`` seconds have passed.
+    """
+
+    def __init__(self, fd):
+        self._fd = fd
+
+    @classmethod
+    def take(cls, name, min_gap):
+        """The turn, or ``None`` if another worker on this host has it or just had it."""
+        directory = Path(settings.SCHEDULER_HOST_LOCK_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        fd = os.open(directory / f"{name}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if not _try_lock(fd):
+                os.close(fd)
+                return None
+            try:
+                last = float(os.read(fd, 64) or 0)
+            except ValueError:
+                last = 0.0
+            now = time.time()
+            if now - last < min_gap:
+                os.close(fd)
+                return None
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, repr(now).encode())
+        except BaseException:
+            os.close(fd)
+            raise
+        return cls(fd)
+
+    def release(self):
+        os.close(self._fd)   # drops the lock
+
+
+def _try_lock(fd):
+    if sys.platform == "win32":
+        return True   # no flock; Windows only runs the single-process dev server
+    import fcntl
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+# =====================================================
+# 🔹 SCHEDULER
+# =====================================================
+class Scheduler:
+    def __init__(self, jobs, intervals, tick, jitter, start_jitter, lease, clock=time.monotonic):
+        self.jobs = [jobs[name] for name in intervals if name in jobs]
+        self.intervals = intervals
+        self.tick = tick
+        self.jitter = jitter
+        self.lease = lease
+        self._clock = clock
+        self._stop = threading.Event()
+        now = clock()
+        for job_ in self.jobs:
+            job_.next_run = now + random.uniform(0, start_jitter)
+
+    def start(self):
+        thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        thread.start()
+        atexit.register(self.stop)
+        return thread
+
+    def stop(self):
+        self._stop.set()
+        self.lease.release()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception:
+                logger.exception("Scheduler tick failed")
+            self._stop.wait(self.tick)
+
+    def run_pending(self):
+        """Start every job that is due (and allowed here) in its own thread; returns the names started."""
+        leader = self.lease.renew() if any(job_.leader for job_ in self.jobs) else False   # every tick: keep it
+        now = self._clock()
+        started = []
+        for job_ in self.jobs:
+            if job_.running:
+                if now >= job_.timeout_at and not job_.overdue:
+                    job_.overdue = True
+                    metrics.count(f"job_{job_.name}_timeouts")
+                    logger.warning("Job %s still running after %ss; skipped until it returns", job_.name, job_.timeout)
+                continue
+            if job_.next_run > now:
+                continue
+            job_.next_run = now + self.intervals[job_.name] * random.uniform(1 - self.jitter, 1 + self.jitter)
+            if job_.leader and not leader:
+                continue
+            turn = None
+            if job_.per_host:
+                # A worker's own runs are never closer than this; anything closer was another worker's.
+                turn = HostTurn.take(job_.name, self.intervals[job_.name] * (1 - self.jitter) - self.tick)
+                if turn is None:
+                    continue
+            job_.timeout_at = now + job_.timeout
+            self.start_job(job_, turn)
+            started.append(job_.name)
+        return started
+
+    def start_job(self, job_, turn=None):
+        job_.running, job_.overdue = True, False
+
+        def target():
+            start = time.perf_counter()
+            try:
+                with mongo_guard.deadline(job_.timeout):
+                    result = job_.func()
+                metrics.count(f"job_{job_.name}_runs")
+                if result:
+                    logger.info("Job %s: %s", job_.name, result)
+            except Exception:
+                metrics.count(f"job_{job_.name}_failures")
+                logger.exception("Job %s failed", job_.name)
+            finally:
+                metrics.count(f"job_{job_.name}_seconds", time.perf_counter() - start)
+                if turn is not None:
+                    turn.release()
+                job_.running = False
+
+        threading.Thread(target=target, name=f"job-{job_.name}", daemon=True).start()
+
+
+_scheduler = None
+_scheduler_pid = None
+_scheduler_lock = threading.Lock()
+
+
+def ensure_started():
+    """Start this worker's scheduler once, unless ``SCHEDULER_ENABLED`` is off (called at worker boot)."""
+    global _scheduler, _scheduler_pid
+    if not settings.SCHEDULER_ENABLED or _scheduler_pid == os.getpid():
+        return
+    with _scheduler_lock:
+        if _scheduler_pid == os.getpid():
+            return
+        from loginapp import jobs  # noqa: F401  (registers the jobs)
+        _scheduler = Scheduler(
+            JOBS, settings.SCHEDULED_JOBS,
+            tick=settings.SCHEDULER_TICK_SECONDS,
+            jitter=settings.SCHEDULER_JITTER,
+            start_jitter=settings.SCHEDULER_START_JITTER,
+            lease=Lease(settings.SCHEDULER_LEASE_SECONDS),
+        )
+        _scheduler.start()
+        _scheduler_pid = os.getpid()
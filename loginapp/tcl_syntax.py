@@ -0,0 +1,374 @@
+"""
+Lightweight Tcl syntax checker used by the live runner's ``/check`` endpoint.
+
+The parser follows the Tcl substitution rules closely enough to split a
+script into commands and words, report unbalanced braces / brackets /
+quotes and flag commands that are neither built in nor defined with
+``proc``.  It never executes anything.
+
+Parses are cached per editor session: when the next call only changes
+text further down, every top-level command that ends before the first
+edited line is reused and parsing resumes from there.
+"""
+
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+# Core Tcl commands (8.6) plus the ones MiniTclEnv understands.
+KNOWN_COMMANDS = frozenset("""
+    after append apply array binary break catch cd chan clock close concat
+    continue dict encoding eof error eval exec exit expr fblocked fconfigure
+    fcopy file fileevent flush for foreach format gets glob global if incr
+    info interp join lappend lassign lindex linsert list llength lmap load
+    lrange lrepeat lreplace lreverse lsearch lset lsort namespace open
+    package pid proc puts pwd read regexp regsub rename return scan seek set
+    socket source split string subst switch tailcall tell throw time trace
+    try unset update uplevel upvar variable vwait while yield zlib
+""".split())
+
+# Word indexes whose braced value is itself a script (negative = from end).
+SCRIPT_ARGS = {
+    "proc": (3,),
+    "while": (2,),
+    "for": (1, 3, 4),
+    "foreach": (-1,),
+    "lmap": (-1,),
+    "catch": (1,),
+    "time": (1,),
+    "after": (-1,),
+}
+
+_SPACE = " \t\r\f\v"
+_BARE_STOP = _SPACE + "\n;"
+
+
+class Word:
+    __slots__ = ("start", "end", "kind", "closed")
+
+    def __init__(self, start, end, kind, closed=True):
+        self.start = start
+        self.end = end
+        self.kind = kind  # "brace", "quote" or "bare"
+        self.closed = closed
+
+    def text(self, source):
+        if self.kind == "bare":
+            return source[self.start:self.end]
+        return source[self.start + 1:self.end - 1 if self.closed else self.end]
+
+
+class Command:
+    __slots__ = ("words", "start", "end", "diagnostics", "nested")
+
+    def __init__(self, words, start, end):
+        self.words = words
+        self.start = start
+        self.end = end
+        self.diagnostics = []
+        self.nested = []  # commands found in substitutions and script bodies
+
+
+class _Parser:
+    def __init__(self, text):
+        self.text = text
+        self.diagnostics = []
+        self.nested = []
+
+    def error(self, offset, message, severity="error"):
+        self.diagnostics.append((offset, severity, message))
+
+    # ---------------- scripts ----------------
+    def script(self, pos, end, in_bracket=False, collect=None):
+        """Parse commands in ``text[pos:end]``; returns ``(commands, pos)``."""
+        text = self.text
+        commands = []
+        while True:
+            pos = self._skip(pos, end, _SPACE + "\n;")
+            if pos >= end or (in_bracket and text[pos] == "]"):
+                return commands, pos
+            if text[pos] == "#":
+                pos = self._skip_comment(pos, end)
+                continue
+
+            start = pos
+            marks = len(self.diagnostics), len(self.nested)
+            words = []
+            while True:
+                pos = self._skip(pos, end, _SPACE)
+                if pos >= end or text[pos] in "\n;" or (in_bracket and text[pos] == "]"):
+                    break
+                word, pos = self.word(pos, end, in_bracket)
+                words.append(word)
+
+            command = Command(words, start, pos)
+            self._descend(command, end)
+            if collect is None:
+                # Top-level commands own their diagnostics and nested commands
+                # so each one can be reused on its own by the parse cache.
+                command.diagnostics = self.diagnostics[marks[0]:]
+                command.nested = self.nested[marks[1]:]
+                commands.append(command)
+            else:
+                collect.append(command)
+
+    def _skip(self, pos, end, chars):
+        text = self.text
+        while pos < end:
+            if text[pos] in chars:
+                pos += 1
+            elif text.startswith("\\\n", pos):
+                pos += 2
+            else:
+                break
+        return pos
+
+    def _skip_comment(self, pos, end):
+        text = self.text
+        while pos < end and text[pos] != "\n":
+            pos += 2 if text[pos] == "\\" else 1
+        return min(pos, end)
+
+    # ---------------- words ----------------
+    def word(self, pos, end, in_bracket):
+        char = self.text[pos]
+        if char == "{":
+            return self._braced(pos, end, in_bracket)
+        if char == '"':
+            return self._quoted(pos, end, in_bracket)
+        return self._bare(pos, end, in_bracket)
+
+    def _braced(self, start, end, in_bracket):
+        text = self.text
+        depth = 0
+        pos = start
+        while pos < end:
+            char = text[pos]
+            if char == "\\":
+                pos += 2
+                continue
+            if char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    pos += 1
+                    self._check_word_end(pos, end, in_bracket, "close-brace")
+                    return Word(start, pos, "brace"), pos
+            pos += 1
+        self.error(start, "missing close-brace")
+        return Word(start, end, "brace", closed=False), end
+
+    def _quoted(self, start, end, in_bracket):
+        text = self.text
+        pos = start + 1
+        while pos < end:
+            char = text[pos]
+            if char == "\\":
+                pos += 2
+                continue
+            if char == "[":
+                pos = self._substitution(pos, end)
+                continue
+            if char == '"':
+                pos += 1
+                self._check_word_end(pos, end, in_bracket, "close-quote")
+                return Word(start, pos, "quote"), pos
+            pos += 1
+        self.error(start, 'missing close-quote (")')
+        return Word(start, end, "quote", closed=False), end
+
+    def _bare(self, start, end, in_bracket):
+        text = self.text
+        pos = start
+        while pos < end:
+            char = text[pos]
+            if char in _BARE_STOP or (in_bracket and char == "]"):
+                break
+            if char == "\\":
+                if text.startswith("\\\n", pos):
+                    break
+                pos += 2
+                continue
+            if char == "[":
+                pos = self._substitution(pos, end)
+                continue
+            if char == "$" and text.startswith("${", pos):
+                close = text.find("}", pos, end)
+                if close == -1:
+                    self.error(pos, "missing close-brace for variable name")
+                    return Word(start, end, "bare"), end
+                pos = close + 1
+                continue
+            pos += 1
+        return Word(start, min(pos, end), "bare"), min(pos, end)
+
+    def _substitution(self, start, end):
+        """Parse ``[...]`` at ``start``; returns the offset after ``]``."""
+        _, pos = self.script(start + 1, end, in_bracket=True, collect=self.nested)
+        if pos >= end:
+            self.error(start, "missing close-bracket")
+            return end
+        return pos + 1
+
+    def _check_word_end(self, pos, end, in_bracket, what):
+        if pos >= end:
+            return
+        char = self.text[pos]
+        if char in _BARE_STOP or (in_bracket and char == "]") or self.text.startswith("\\\n", pos):
+            return
+        self.error(pos, f"extra characters after {what}")
+
+    # ---------------- nested scripts ----------------
+    def _descend(self, command, end):
+        words = command.words
+        if not words or words[0].kind == "brace":
+            return
+        name = words[0].text(self.text)
+        if name == "if":
+            bodies = self._if_bodies(words)
+        else:
+            bodies = [words[i] for i in SCRIPT_ARGS.get(name, ()) if -len(words) <= i < len(words)]
+        for body in bodies:
+            if body.kind == "brace" and body.end - body.start >= 2:
+                self.script(body.start + 1, body.end - 1, collect=self.nested)
+
+    def _if_bodies(self, words):
+        bodies = []
+        index = 2  # skip "if" and the first condition
+        while index < len(words):
+            keyword = words[index].text(self.text)
+            if keyword == "then":
+                index += 1
+                continue
+            bodies.append(words[index])
+            if index + 1 >= len(words):
+                break
+            keyword = words[index + 1].text(self.text)
+            if keyword == "elseif":
+                index += 3
+            elif keyword == "else":
+                index += 2
+            else:
+                break
+        return bodies
+
+
+def parse(text, start=0):
+    """Parse ``text`` from ``start`` into top-level :class:`Command` objects."""
+    commands, _ = _Parser(text).script(start, len(text))
+    return commands
+
+
+# =====================================================
+# 🔹 PER-SESSION PARSE CACHE
+# =====================================================
+class ParseCache:
+    """Bounded LRU of the last parse per editor session."""
+
+    def __init__(self, max_sessions=512):
+        self.max_sessions = max_sessions
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._entries.move_to_end(session_id)
+            return entry
+
+    def put(self, session_id, text, commands):
+        with self._lock:
+            self._entries[session_id] = (text, commands)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+
+
+parse_cache = ParseCache(getattr(settings, "TCL_CHECK_MAX_SESSIONS", 512))
+
+
+def _reusable_prefix(old_text, old_commands, text):
+    """Return the leading commands of ``old_commands`` still valid for ``text``."""
+    limit = min(len(old_text), len(text))
+    changed = 0
+    while changed < limit and old_text[changed] == text[changed]:
+        changed += 1
+    first_changed_line = text.rfind("\n", 0, changed) + 1
+
+    kept = 0
+    # Keep a command only if its terminator also lies in the unchanged lines.
+    while kept < len(old_commands) and old_commands[kept].end < first_changed_line:
+        kept += 1
+    return old_commands[:kept]
+
+
+def check(text, session_id=None):
+    """Parse ``text`` and return the ``/check`` response payload."""
+    cached = parse_cache.get(session_id) if session_id else None
+    if cached is not None and cached[0] == text:
+        reused = commands = cached[1]
+    else:
+        reused = _reusable_prefix(cached[0], cached[1], text) if cached else []
+        commands = reused + parse(text, reused[-1].end if reused else 0)
+
+    if session_id:
+        parse_cache.put(session_id, text, commands)
+
+    line_starts = [0]
+    line_starts.extend(i + 1 for i, char in enumerate(text) if char == "\n")
+
+    def position(offset):
+        line = bisect_right(line_starts, offset)
+        return line, offset - line_starts[line - 1] + 1
+
+    every = []
+    for command in commands:
+        every.append(command)
+        every.extend(command.nested)
+    procs = {
+        c.words[1].text(text) for c in every
+        if len(c.words) > 1 and c.words[0].kind == "bare" and c.words[0].text(text) == "proc"
+    }
+
+    raw = [d for command in commands for d in command.diagnostics]
+    for command in every:
+        if not command.words:
+            continue
+        first = command.words[0]
+        name = first.text(text)
+        if first.kind == "bare" and name in ("}", "]"):
+            what = "brace" if name == "}" else "bracket"
+            raw.append((first.start, "error", f"unbalanced close-{what}"))
+        elif first.kind != "quote" and "$" not in name and "[" not in name \
+                and name.lstrip(":") not in KNOWN_COMMANDS and name not in procs:
+            raw.append((first.start, "warning", f'unknown command "{name}"'))
+
+    diagnostics = []
+    for offset, severity, message in sorted(raw):
+        line, column = position(offset)
+        diagnostics.append({
+            "severity": severity,
+            "message": message,
+            "line": line,
+            "column": column,
+            "offset": offset,
+        })
+
+    return {
+        "ok": not any(d["severity"] == "error" for d in diagnostics),
+        "commands": [
+            {
+                "name": c.words[0].text(text),
+                "line": position(c.start)[0],
+                "words": [w.text(text) for w in c.words],
+            }
+            for c in commands if c.words
+        ],
+        "diagnostics": diagnostics,
+        "reused_lines": position(reused[-1].end)[0] if reused else 0,
+    }
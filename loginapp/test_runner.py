@@ -0,0 +1,24 @@
+"""
+``manage.py test`` runner: Django's ``DiscoverRunner`` with the settings
+that only make sense under test applied for the whole run.
+"""
+
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+TEST_SETTINGS = {
+    "MONGO_ROUND_TRIP_STRICT": True,   # an over-budget request fails the test instead of logging a warning
+    "SCHEDULER_ENABLED": False,        # no job threads touching the test databases
+}
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._test_settings = override_settings(**TEST_SETTINGS)
+        self._test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        super().teardown_test_environment(**kwargs)
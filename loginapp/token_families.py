@@ -0,0 +1,95 @@
+"""
+Refresh-token rotation with reuse detection.
+
+Every ``/login`` starts a token family: the refresh token carries its id in
+the ``fam`` claim, and one document in ``REFRESH_FAMILY_COLLECTION``
+remembers the ``jti`` of the only refresh token currently valid for it::
+
+    {_id: fam, email, jti, revoked, created_at, rotated_at, expires_at}
+
+``/refresh`` swaps that ``jti`` for the new token's in a single
+``find_one_and_update``, so a session renews with one Mongo round trip and
+no password hash.  Presenting an older token of the family means it was
+copied and used twice: the family is revoked, so both copies (the user's
+and the thief's) have to log in again.  ``/logout`` revokes the family too,
+and a password change or reset revokes all of the user's families
+(``revoke_all``).
+
+``expires_at`` is the expiry of the login's refresh token.  Rotated tokens
+keep it, so a session ends ``REFRESH_TOKEN_LIFETIME`` after the login
+however often it refreshes, and a TTL index then drops the family.
+"""
+
+import logging
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo import ReturnDocument
+
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshRejected(Exception):
+    pass
+
+
+def _expires_at(refresh):
+    return datetime.fromtimestamp(refresh["exp"], tz=dt_timezone.utc)
+
+
+def start(refresh, email):
+    """Make ``refresh`` (freshly minted at login) the first token of a new family."""
+    refresh["fam"] = uuid.uuid4().hex
+    now = timezone.now()
+    settings.REFRESH_FAMILY_COLLECTION.insert_one({
+        "_id": refresh["fam"], "email": email, "jti": refresh["jti"], "revoked": False,
+        "created_at": now, "rotated_at": now, "expires_at": _expires_at(refresh),
+    })
+
+
+def rotate(refresh):
+    """Give ``refresh`` a new jti/iat and make it the family's current token; raises ``RefreshRejected``."""
+    family = refresh.get("fam")
+    if not family:
+        raise RefreshRejected("Session predates token rotation, please log in again")
+    presented = refresh["jti"]
+    refresh.set_jti()
+    refresh.set_iat()   # "exp" stays the login's, the family's expires_at
+
+    doc = settings.REFRESH_FAMILY_COLLECTION.find_one_and_update(
+        {"_id": family, "jti": presented, "revoked": False},
+        {"$set": {"jti": refresh["jti"], "rotated_at": timezone.now()}},
+        projection={"_id": 1},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if doc is not None:
+        return
+
+    revoked = settings.REFRESH_FAMILY_COLLECTION.find_one_and_update(
+        {"_id": family, "revoked": False},
+        {"$set": {"revoked": True, "revoked_at": timezone.now()}},
+        projection={"email": 1},
+    )
+    if revoked is not None:
+        logger.warning("Refresh token reuse detected for %s (family %s); family revoked", revoked["email"], family)
+        raise RefreshRejected("Refresh token was already used, please log in again")
+    raise RefreshRejected("Session has ended, please log in again")
+
+
+def revoke(refresh):
+    """End the family of ``refresh`` (logout)."""
+    family = refresh.get("fam")
+    if family:
+        settings.REFRESH_FAMILY_COLLECTION.update_one(
+            {"_id": family}, {"$set": {"revoked": True, "revoked_at": timezone.now()}}
+        )
+
+
+def revoke_all(email):
+    """End every session of ``email`` (its password was changed or reset)."""
+    settings.REFRESH_FAMILY_COLLECTION.update_many(
+        {"email": email, "revoked": False}, {"$set": {"revoked": True, "revoked_at": timezone.now()}}
+    )
@@ -0,0 +1,359 @@
+"""
+Lightweight request tracing with batched JSONL export.
+
+``TracingMiddleware`` opens a root span per request and decides once whether
+the trace is sampled (``TRACE_SAMPLE_RATE``).  An incoming W3C
+``traceparent`` is only continued, sampled flag included, when the request
+comes from one of ``TRACE_TRUSTED_UPSTREAMS``; anyone else could otherwise
+set the flag on every request and have all of them recorded.  Code below it adds child spans with::
+
+    with tracing.span("otp.rate_check", email_domain=domain):
+        ...
+
+Mongo commands (``MongoTraceListener``) and the timed phases of
+:mod:`loginapp.metrics` (hash, jwt, smtp, template) become spans as well.  In
+an unsampled request ``span()`` returns a shared no-op object, so the cost
+is one context-variable lookup.
+
+The active span lives in a ``contextvars.ContextVar``.  To follow work into
+a thread pool, submit ``tracing.wrap(fn)``; for a process pool, use
+``tracing.submit(executor, fn, *args)``, which ships the ``traceparent`` to
+the worker and re-attaches it there.
+
+Finished spans are queued and written by a background thread in batches,
+one OTLP/JSON ``ExportTraceServiceRequest`` per line, to
+``TRACE_DIR/spans-<pid>.jsonl`` (rotated at ``TRACE_MAX_BYTES``).  The
+OpenTelemetry collector's ``otlpjsonfile`` receiver reads these files as-is.
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from django.conf import settings
+from pymongo import monitoring
+
+
+SERVER, INTERNAL, CLIENT = 2, 1, 3   # OTLP span kinds
+
+_current = contextvars.ContextVar("trace_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns",
+                 "attributes", "error", "_token")
+
+    def __init__(self, name, trace_id, parent_id=None, kind=INTERNAL, attributes=None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._token = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.finish()
+        return False
+
+    def finish(self):
+        self.end_ns = time.time_ns()
+        exporter().add(self)
+
+
+class _NoopSpan:
+    """Stands in for spans of unsampled traces."""
+
+    __slots__ = ()
+
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP = _NoopSpan()
+
+
+def span(name, kind=INTERNAL, **attributes):
+    """Child span of the current span, or a no-op outside sampled traces."""
+    parent = _current.get()
+    if parent is None:
+        return NOOP
+    return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+
+
+def current_span():
+    return _current.get()
+
+
+# =====================================================
+# 🔹 PROPAGATION (threads + processes)
+# =====================================================
+def parse_traceparent(header):
+    """``(trace_id, parent_span_id, sampled)`` from a W3C traceparent, or ``None``."""
+    parts = (header or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        return parts[1], parts[2], bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+
+
+def carrier():
+    """Serializable trace context of the current span (``{}`` if not tracing)."""
+    current = _current.get()
+    return {"traceparent": current.traceparent()} if current is not None else {}
+
+
+def wrap(fn):
+    """Bind ``fn`` to the caller's context, e.g. ``pool.submit(tracing.wrap(send))``."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def _run_in_process(context, name, fn, args, kwargs):
+    parsed = parse_traceparent(context.get("traceparent"))
+    if parsed is None:
+        return fn(*args, **kwargs)
+    trace_id, parent_id, _ = parsed
+    try:
+        with Span(name, trace_id, parent_id):
+            return fn(*args, **kwargs)
+    finally:
+        exporter().flush()   # pool workers exit without running atexit hooks
+
+
+def submit(executor, fn, *args, **kwargs):
+    """Submit ``fn`` to a thread or process pool executor, continuing the current trace."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    if isinstance(executor, ProcessPoolExecutor):
+        name = f"worker {getattr(fn, '__qualname__', 'task')}"
+        return executor.submit(_run_in_process, carrier(), name, fn, args, kwargs)
+    return executor.submit(wrap(fn), *args, **kwargs)
+
+
+# =====================================================
+# 🔹 BATCHED JSONL EXPORT
+# =====================================================
+def _attribute(key, value):
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def to_otlp(span_):
+    record = {
+        "traceId": span_.trace_id,
+        "spanId": span_.span_id,
+        "name": span_.name,
+        "kind": span_.kind,
+        "startTimeUnixNano": str(span_.start_ns),
+        "endTimeUnixNano": str(span_.end_ns),
+        "attributes": [_attribute(k, v) for k, v in span_.attributes.items()],
+        "status": {"code": 2, "message": span_.error} if span_.error else {"code": 1},
+    }
+    if span_.parent_id:
+        record["parentSpanId"] = span_.parent_id
+    return record
+
+
+class BatchExporter:
+    """Collects finished spans and appends them to rotating JSONL files from a background thread."""
+
+    def __init__(self, directory, max_queue, batch_size, interval, max_bytes, backups):
+        self.directory = Path(directory)
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.dropped = 0
+        self._queue = deque()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def add(self, span_):
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1   # shed spans rather than grow or block the request
+            return
+        self._queue.append(span_)
+        if len(self._queue) >= self.batch_size:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            while self._queue:
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    batch.append(self._queue.popleft())
+                self._write(batch)
+
+    def _write(self, batch):
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [
+                _attribute("service.name", "tclforge"),
+                _attribute("process.pid", os.getpid()),
+            ]},
+            "scopeSpans": [{"scope": {"name": "loginapp.tracing"}, "spans": [to_otlp(s) for s in batch]}],
+        }]}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"spans-{os.getpid()}.jsonl"
+        if path.exists() and path.stat().st_size >= self.max_bytes:
+            self._rotate(path)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(request, separators=(",", ":")) + "\n")
+
+    def _rotate(self, path):
+        for i in range(self.backups - 1, 0, -1):
+            older = path.with_name(f"{path.name}.{i}")
+            if older.exists():
+                older.replace(path.with_name(f"{path.name}.{i + 1}"))
+        path.replace(path.with_name(f"{path.name}.1"))
+
+
+_exporter = None
+_exporter_pid = None
+_exporter_lock = threading.Lock()
+
+
+def exporter():
+    """This process's exporter (a forked worker gets its own thread and file)."""
+    global _exporter, _exporter_pid
+    if _exporter_pid != os.getpid():
+        with _exporter_lock:
+            if _exporter_pid != os.getpid():
+                _exporter = BatchExporter(
+                    getattr(settings, "TRACE_DIR", None) or Path(settings.BASE_DIR) / "traces",
+                    max_queue=getattr(settings, "TRACE_MAX_QUEUE", 10_000),
+                    batch_size=getattr(settings, "TRACE_BATCH_SIZE", 512),
+                    interval=getattr(settings, "TRACE_EXPORT_INTERVAL", 2.0),
+                    max_bytes=getattr(settings, "TRACE_MAX_BYTES", 50 * 1024 * 1024),
+                    backups=getattr(settings, "TRACE_BACKUP_COUNT", 5),
+                )
+                _exporter_pid = os.getpid()
+    return _exporter
+
+
+# =====================================================
+# 🔹 MIDDLEWARE + MONGO SPANS
+# =====================================================
+class TracingMiddleware:
+    """Root span per request; samples new traces at ``TRACE_SAMPLE_RATE``.
+
+    Only requests from ``TRACE_TRUSTED_UPSTREAMS`` (proxies or services that
+    sample themselves) continue their ``traceparent``; the rest start a new
+    trace at the local rate.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        incoming = None
+        if request.META.get("REMOTE_ADDR") in getattr(settings, "TRACE_TRUSTED_UPSTREAMS", ()):
+            incoming = parse_traceparent(request.headers.get("traceparent"))
+        if incoming is not None:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id = None, None
+            sampled = random.random() < getattr(settings, "TRACE_SAMPLE_RATE", 0.0)
+        if not sampled:
+            return self.get_response(request)
+
+        root = Span(f"{request.method} {request.path}", trace_id or os.urandom(16).hex(), parent_id, SERVER,
+                    {"http.method": request.method, "http.target": request.path})
+        with root:
+            response = self.get_response(request)
+            match = getattr(request, "resolver_match", None)
+            if match is not None:
+                root.name = f"{request.method} /{match.route}"
+                root.set("http.route", f"/{match.route}")
+            root.set("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                root.error = f"HTTP {response.status_code}"
+        response["traceparent"] = root.traceparent()
+        return response
+
+
+class MongoTraceListener(monitoring.CommandListener):
+    """One client span per Mongo command issued inside a sampled trace."""
+
+    MAX_OPEN = 10_000   # commands whose reply never came are dropped, oldest first, beyond this
+
+    def __init__(self):
+        self._open = {}
+        self._lock = threading.Lock()   # callbacks come from every request and /batch pool thread
+
+    def started(self, event):
+        parent = _current.get()
+        if parent is None:
+            return
+        collection = event.command.get(event.command_name)
+        opened = Span(
+            f"mongo {event.command_name}", parent.trace_id, parent.span_id, CLIENT,
+            {"db.system": "mongodb", "db.name": event.database_name, "db.operation": event.command_name,
+             "db.mongodb.collection": collection if isinstance(collection, str) else ""},
+        )
+        with self._lock:
+            if len(self._open) >= self.MAX_OPEN:
+                del self._open[next(iter(self._open))]
+            self._open[(event.connection_id, event.request_id)] = opened
+
+    def _pop(self, event):
+        with self._lock:
+            return self._open.pop((event.connection_id, event.request_id), None)
+
+    def succeeded(self, event):
+        opened = self._pop(event)
+        if opened is not None:
+            opened.finish()
+
+    def failed(self, event):
+        opened = self._pop(event)
+        if opened is not None:
+            opened.error = str(event.failure)
+            opened.finish()
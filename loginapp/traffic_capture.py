@@ -0,0 +1,61 @@
+"""
+Sanitized traffic capture for replay (``python -m benchmarks.replay``).
+
+With ``TRAFFIC_CAPTURE_ENABLED``, every request appends one tab-separated
+line to ``logs/capture-<pid>.tsv`` (one file per worker) through the queued
+logging pipeline:
+
+    epoch_ms  method  route  path  status  duration_ms  request_bytes  response_bytes
+
+Only metadata is kept: no headers, cookies, query strings or bodies, so no
+tokens, passwords or OTPs ever reach the file.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+
+capture_logger = logging.getLogger("tclforge.capture")
+
+FIELDS = ("epoch_ms", "method", "route", "path", "status", "duration_ms", "request_bytes", "response_bytes")
+
+
+def parse_line(line):
+    """One capture line -> dict, or ``None`` for blank/foreign lines."""
+    parts = line.rstrip("\n").split("\t")
+    if len(parts) != len(FIELDS):
+        return None
+    record = dict(zip(FIELDS, parts))
+    for key in ("epoch_ms", "duration_ms"):
+        record[key] = float(record[key])
+    for key in ("status", "request_bytes", "response_bytes"):
+        record[key] = int(record[key]) if record[key] != "-" else None
+    return record
+
+
+class TrafficCaptureMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, "TRAFFIC_CAPTURE_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.time()
+        start = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        match = getattr(request, "resolver_match", None)
+        route = match.route if match is not None else "-"
+        path = request.path.replace("\t", " ")
+        request_bytes = request.META.get("CONTENT_LENGTH") or 0
+        response_bytes = len(response.content) if not response.streaming else "-"
+        capture_logger.info(
+            "%.1f\t%s\t%s\t%s\t%d\t%.2f\t%s\t%s",
+            started * 1000, request.method, route or "/", path, response.status_code,
+            elapsed, request_bytes, response_bytes,
+        )
+        return response
@@ -0,0 +1,168 @@
+"""
+Read-through cache of user documents from ``LOGIN_COLLECTION``.
+
+``get_user(email)`` serves the projected user document (``USER_PROJECTION``)
+from a per-worker bounded LRU with a ``USER_CACHE_TTL``.  Keys are the
+normalized email; a cached document is only used when its stored email is
+exactly the one asked for, so lookups behave like the exact-match
+``find_one`` they replace.  Missing users are not cached.
+
+Concurrent misses for the same email share one ``find_one`` (single-flight).
+After a password change, ``invalidate(email)`` drops the entry here and
+writes a fresh random stamp into the email's slot of a small memory-mapped
+file shared by all workers of the master; every cached entry remembers the
+stamp seen before its load, so other workers notice the change on their
+next read.
+
+Counters on ``/metrics``: ``tclforge_user_cache_{hits,misses,coalesced,invalidations}_total``.
+Hit rate is ``hits / (hits + misses + coalesced)``; Mongo queries saved per
+second are ``rate(hits) + rate(coalesced)``.
+"""
+
+import hashlib
+import mmap
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from loginapp import metrics, mongo_guard
+
+
+USER_PROJECTION = {"email": 1, "username": 1, "password": 1, "created_at": 1}
+STAMP_SLOTS = 4096
+
+
+def normalize(email):
+    return email.strip().lower()
+
+
+class SharedStamps:
+    """One 64-bit stamp per email hash slot, in a file shared by every worker."""
+
+    def __init__(self, path, slots=STAMP_SLOTS):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "ab+") as f:
+            if os.fstat(f.fileno()).st_size < slots * 8:
+                f.truncate(slots * 8)
+            self._mmap = mmap.mmap(f.fileno(), slots * 8)
+        self._stamps = memoryview(self._mmap).cast("Q")
+        self.slots = slots
+
+    def _slot(self, key):
+        # Not hash(): str hashes are salted per process.
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") % self.slots
+
+    def read(self, key):
+        return self._stamps[self._slot(key)]
+
+    def bump(self, key):
+        self._stamps[self._slot(key)] = random.getrandbits(64)
+
+
+class _Flight:
+    __slots__ = ("done", "doc", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.doc = None
+        self.error = None
+
+
+class UserCache:
+    def __init__(self, stamps, max_entries=10_000, ttl=30, clock=time.monotonic):
+        self.stamps = stamps
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()   # key -> (expires, stamp, doc)
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def get(self, email):
+        """The user document for ``email`` (a copy), or ``None``."""
+        key = normalize(email)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > self._clock() and entry[1] == self.stamps.read(key) and entry[2]["email"] == email:
+                    self._entries.move_to_end(key)
+                    metrics.count("user_cache_hits")
+                    return dict(entry[2])
+                del self._entries[key]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            if not flight.done.wait(max(mongo_guard.remaining(), 0)):
+                raise mongo_guard.MongoUnavailable("Request deadline exceeded waiting for a user lookup")
+            if flight.error is not None:
+                raise flight.error
+            if flight.doc is not None and flight.doc["email"] == email:
+                metrics.count("user_cache_coalesced")
+                return dict(flight.doc)
+            return self._load(email)   # different spelling of the same key, or not found
+
+        try:
+            flight.doc = self._load(email, key)
+            return None if flight.doc is None else dict(flight.doc)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _load(self, email, key=None):
+        metrics.count("user_cache_misses")
+        stamp = self.stamps.read(key) if key is not None else None   # read before the query, so a racing write wins
+        doc = settings.LOGIN_COLLECTION.find_one({"email": email}, projection=USER_PROJECTION)
+        if doc is not None and key is not None:
+            with self._lock:
+                self._entries[key] = (self._clock() + self.ttl, stamp, doc)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return doc
+
+    def invalidate(self, email):
+        key = normalize(email)
+        self.stamps.bump(key)
+        with self._lock:
+            self._entries.pop(key, None)
+        metrics.count("user_cache_invalidations")
+
+
+_cache = None
+_cache_pid = None
+
+
+def cache():
+    global _cache, _cache_pid
+    if _cache_pid != os.getpid():
+        _cache = UserCache(
+            SharedStamps(metrics.metrics_dir() / "user_cache.stamps"),
+            max_entries=settings.USER_CACHE_MAX_ENTRIES,
+            ttl=settings.USER_CACHE_TTL,
+        )
+        _cache_pid = os.getpid()
+    return _cache
+
+
+def get_user(email):
+    """Drop-in for ``LOGIN_COLLECTION.find_one({"email": email})``."""
+    if not settings.USER_CACHE_ENABLED or not isinstance(email, str):
+        return settings.LOGIN_COLLECTION.find_one({"email": email})
+    return cache().get(email)
+
+
+def invalidate(email):
+    """Call after every write to a user document."""
+    if settings.USER_CACHE_ENABLED:
+        cache().invalidate(email)
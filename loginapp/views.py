@@ -3,17 +3,33 @@ from django.contrib.auth import get_user_model
 from django.core.mail import send_mail
 from django.utils import timezone
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
 from django.contrib.auth.hashers import check_password, make_password
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
 from bson import ObjectId
 
+from loginapp import (
+    audit, batch, chat, json_api, leaderboard, metrics, profile_claims, progress, tcl_syntax, token_families, tracing, user_cache,
+)
+
 User = get_user_model()
 
 
+def etag_matches(request, etag):
+    """Whether ``If-None-Match`` lists ``etag``, compared weakly (``W/"..."``, lists and ``*`` match)."""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    tags = parse_etags(header)
+    return tags == ["*"] or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
 # =====================================================
 # 🔹 SIGNUP API
 # =====================================================
@@ -24,11 +40,11 @@ class SignUpAPIView(APIView):
         password = request.data.get("password")
 
         if not email or not username or not password:
-            return Response({"error": "All fields are required"}, status=400)
+            return Response(json_api.constant(error="All fields are required"), status=400)
 
         # Check if email already exists
         if settings.LOGIN_COLLECTION.find_one({"email": email}):
-            return Response({"error": "Email already exists"}, status=400)
+            return Response(json_api.constant(error="Email already exists"), status=400)
 
         hashed_password = make_password(password)
 
@@ -40,7 +56,7 @@ class SignUpAPIView(APIView):
             "created_at": timezone.now(),
         }
         settings.LOGIN_COLLECTION.insert_one(user_data)
-        return Response({"message": "Signup successful"}, status=201)
+        return Response(json_api.constant(message="Signup successful"), status=201)
 
 
 # =====================================================
@@ -52,20 +68,29 @@ class LoginAPIView(APIView):
         password = request.data.get("password")
 
         if not email or not password:
-            return Response({"error": "Email and password required"}, status=400)
+            return Response(json_api.constant(error="Email and password required"), status=400)
 
-        user = settings.LOGIN_COLLECTION.find_one({"email": email})
+        user = user_cache.get_user(email)
         if not user or not check_password(password, user["password"]):
-            return Response({"error": "Invalid credentials"}, status=401)
+            audit.record("login_failed", email, request, reason="password" if user else "unknown_email")
+            return Response(json_api.constant(error="Invalid credentials"), status=401)
 
         # ✅ Proper JWT generation with embedded email
-        refresh = RefreshToken()
-        refresh["email"] = email  # embed email for token-based auth
+        with metrics.phase("jwt"):
+            refresh = RefreshToken()
+            refresh["email"] = email  # embed email for token-based auth
+            access = refresh.access_token
+            if settings.PROFILE_CLAIMS_IN_TOKEN:
+                profile_claims.add_claims(access, profile_claims.from_user(user))  # lets /me skip Mongo
+            access = str(access)
+        token_families.start(refresh, email)   # rotation family ("fam" claim) for /refresh
+        audit.record("login", email, request, family=refresh["fam"])
+        refresh = str(refresh)
 
         return Response({
             "message": "Login successful",
-            "access": str(refresh.access_token),
-            "refresh": str(refresh),
+            "access": access,
+            "refresh": refresh,
             "email": email
         }, status=200)
 
@@ -78,15 +103,48 @@ class LogoutAPIView(APIView):
         refresh_token = request.data.get("refresh")
 
         if not refresh_token:
-            return Response({"error": "Refresh token required"}, status=400)
+            return Response(json_api.constant(error="Refresh token required"), status=400)
 
         try:
             token = RefreshToken(refresh_token)
             token.blacklist()
         except Exception:
-            return Response({"error": "Invalid or expired token"}, status=400)
+            return Response(json_api.constant(error="Invalid or expired token"), status=400)
+        token_families.revoke(token)
+        audit.record("logout", token.get("email"), request, family=token.get("fam"))
+
+        return Response(json_api.constant(message="Logout successful"), status=200)
+
+
+# =====================================================
+# 🔹 REFRESH API (rotation + reuse detection, no password hash)
+# =====================================================
+class RefreshAPIView(APIView):
+    authentication_classes = []   # an expired access token in the header must not block renewal
+
+    def post(self, request):
+        raw_refresh = request.data.get("refresh")
+        if not raw_refresh:
+            return Response(json_api.constant(error="Refresh token required"), status=400)
 
-        return Response({"message": "Logout successful"}, status=200)
+        try:
+            refresh = RefreshToken(raw_refresh)
+        except TokenError:
+            return Response(json_api.constant(error="Invalid or expired token"), status=401)
+
+        try:
+            token_families.rotate(refresh)
+        except token_families.RefreshRejected as e:
+            return Response({"error": str(e)}, status=401)
+
+        with metrics.phase("jwt"):
+            access = refresh.access_token
+        if settings.PROFILE_CLAIMS_IN_TOKEN:
+            user = user_cache.get_user(refresh["email"])
+            if user:
+                profile_claims.add_claims(access, profile_claims.from_user(user))
+
+        return Response({"access": str(access), "refresh": str(refresh)}, status=200)
 
 
 # =====================================================
@@ -96,22 +154,23 @@ class SendOTPAPIView(APIView):
     def post(self, request):
         email = request.data.get("email")
         if not email:
-            return Response({"error": "Email is required"}, status=400)
+            return Response(json_api.constant(error="Email is required"), status=400)
 
-        user = settings.LOGIN_COLLECTION.find_one({"email": email})
+        user = user_cache.get_user(email)
         if not user:
-            return Response({"error": "User not found"}, status=404)
+            return Response(json_api.constant(error="User not found"), status=404)
 
-        last_otp = settings.RESET_OTP_COLLECTION.find_one(
-            {"email": email}, sort=[("created_at", -1)]
-        )
+        with tracing.span("otp.rate_check"):
+            last_otp = settings.RESET_OTP_COLLECTION.find_one(
+                {"email": email}, sort=[("created_at", -1)]
+            )
         if last_otp:
             otp_created_at = last_otp["created_at"]
             if otp_created_at.tzinfo is None:
                 otp_created_at = timezone.make_aware(otp_created_at)
             if (timezone.now() - otp_created_at).total_seconds() < 60:
                 return Response(
-                    {"error": "Wait 60 seconds before requesting another OTP"},
+                    json_api.constant(error="Wait 60 seconds before requesting another OTP"),
                     status=429
                 )
 
@@ -146,8 +205,9 @@ class SendOTPAPIView(APIView):
             )
         except Exception as e:
             return Response({"error": f"Failed to send email: {e}"}, status=500)
+        audit.record("otp_sent", email, request)
 
-        return Response({"message": "OTP sent successfully to your email."}, status=200)
+        return Response(json_api.constant(message="OTP sent successfully to your email."), status=200)
 
 
 # =====================================================
@@ -160,38 +220,41 @@ class ResetPasswordAPIView(APIView):
         new_password = request.data.get("password")
 
         if not email or not otp or not new_password:
-            return Response({"error": "Email, OTP and new password are required"}, status=400)
+            return Response(json_api.constant(error="Email, OTP and new password are required"), status=400)
 
         otp_doc = settings.RESET_OTP_COLLECTION.find_one(
             {"email": email, "otp": otp, "is_used": False},
             sort=[("created_at", -1)]
         )
         if not otp_doc:
-            return Response({"error": "Invalid OTP"}, status=400)
+            return Response(json_api.constant(error="Invalid OTP"), status=400)
 
         otp_created_at = otp_doc["created_at"]
         if otp_created_at.tzinfo is None:
             otp_created_at = timezone.make_aware(otp_created_at)
         if (timezone.now() - otp_created_at).total_seconds() > 300:
-            return Response({"error": "OTP expired"}, status=400)
+            return Response(json_api.constant(error="OTP expired"), status=400)
 
         settings.RESET_OTP_COLLECTION.update_one(
             {"_id": otp_doc["_id"]}, {"$set": {"is_used": True}}
         )
 
-        user_doc = settings.LOGIN_COLLECTION.find_one({"email": email})
+        user_doc = user_cache.get_user(email)
         if not user_doc:
-            return Response({"error": "User not found"}, status=404)
+            return Response(json_api.constant(error="User not found"), status=404)
 
         if check_password(new_password, user_doc["password"]):
-            return Response({"error": "Cannot reuse old password"}, status=400)
+            return Response(json_api.constant(error="Cannot reuse old password"), status=400)
 
         hashed_new = make_password(new_password)
         settings.LOGIN_COLLECTION.update_one(
             {"email": email}, {"$set": {"password": hashed_new}}
         )
+        user_cache.invalidate(email)
+        token_families.revoke_all(email)   # log out every session, including a thief's
+        audit.record("password_reset", email, request)
 
-        return Response({"message": "Password reset successful"}, status=200)
+        return Response(json_api.constant(message="Password reset successful"), status=200)
 
 
 # =====================================================
@@ -202,72 +265,189 @@ class AuthenticatedResetPasswordView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
+        email = request.user.email
+        old_password = request.data.get("old_password")
+        new_password = request.data.get("new_password")
+
+        if not old_password or not new_password:
+            return Response(json_api.constant(error="Both old and new passwords are required"), status=400)
+
+        user_doc = request.user.doc
+        if not user_doc:
+            return Response(json_api.constant(error="User not found"), status=404)
+
+        if not check_password(old_password, user_doc["password"]):
+            return Response(json_api.constant(error="Incorrect current password"), status=400)
+
+        if check_password(new_password, user_doc["password"]):
+            return Response(json_api.constant(error="New password cannot be same as old password"), status=400)
+
+        hashed_new = make_password(new_password)
+        settings.LOGIN_COLLECTION.update_one(
+            {"email": email}, {"$set": {"password": hashed_new}}
+        )
+        user_cache.invalidate(email)
+        token_families.revoke_all(email)
+        audit.record("password_changed", email, request)
+
+        return Response(json_api.constant(message="Password updated successfully"), status=200)
+
+
+# =====================================================
+# 🔹 USER PROFILE API (Fetch logged-in user info)
+# =====================================================
+class ProfileAPIView(APIView):
+    """Returns profile info of the logged-in user (requires JWT token), with an ETag"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        profile, version = profile_claims.from_claims(request.auth)
+        if profile is None:
+            user = request.user.doc
+            if not user:
+                return Response(json_api.constant(error="User not found"), status=404)
+            profile = profile_claims.from_user(user)
+            version = profile_claims.version(profile)
+
+        etag = profile_claims.etag(version)
+        if etag_matches(request, etag):
+            response = HttpResponse(status=304)
+        else:
+            response = Response(profile, status=200)
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        response["Vary"] = "Authorization"
+        return response
+
+
+# =====================================================
+# 🔹 TCL SYNTAX CHECK (Live runner lint, no execution)
+# =====================================================
+class TclCheckAPIView(APIView):
+    """Parses a Tcl script and reports syntax problems without running it"""
+
+    def post(self, request):
+        script = request.data.get("script")
+        session_id = request.data.get("session")
+
+        if not isinstance(script, str):
+            return Response(json_api.constant(error="Script is required"), status=400)
+
+        if len(script) > getattr(settings, "TCL_CHECK_MAX_CHARS", 100_000):
+            return Response(json_api.constant(error="Script is too large to check"), status=413)
+
         try:
-            jwt_auth = JWTAuthentication()
-            header = jwt_auth.get_header(request)
-            raw_token = jwt_auth.get_raw_token(header)
-            validated_token = jwt_auth.get_validated_token(raw_token)
-            email = validated_token.get("email")
+            result = tcl_syntax.check(script, str(session_id) if session_id else None)
+        except RecursionError:
+            return Response(json_api.constant(error="Script is nested too deeply to check"), status=400)
 
-            if not email:
-                return Response({"error": "Invalid or missing email in token"}, status=401)
+        return Response(result, status=200)
 
-            old_password = request.data.get("old_password")
-            new_password = request.data.get("new_password")
 
-            if not old_password or not new_password:
-                return Response({"error": "Both old and new passwords are required"}, status=400)
+# =====================================================
+# 🔹 CHATBOT PROXY (SSE streaming, server-held API key)
+# =====================================================
+class ChatAPIView(APIView):
+    """Streams TCL chatbot answers to the page as Server-Sent Events (requires JWT token)"""
+    permission_classes = [IsAuthenticated]
 
-            user_doc = settings.LOGIN_COLLECTION.find_one({"email": email})
-            if not user_doc:
-                return Response({"error": "User not found"}, status=404)
+    def post(self, request):
+        question = request.data.get("question")
+        model = request.data.get("model") or settings.CHAT_MODELS[0]
+        history = request.data.get("history")
+
+        if not isinstance(question, str) or not question.strip():
+            return Response(json_api.constant(error="Question is required"), status=400)
+        if len(question) > settings.CHAT_MAX_QUESTION_CHARS:
+            return Response(json_api.constant(error="Question is too long"), status=400)
+        if model not in settings.CHAT_MODELS:
+            return Response(json_api.constant(error="Unsupported model"), status=400)
+        if not isinstance(history, list):
+            history = []
+        if not settings.OPENROUTER_API_KEY:
+            return Response(json_api.constant(error="Chat service is not configured"), status=503)
+
+        events = chat.chat_events(model, question.strip(), history)
+        if isinstance(request._request, ASGIRequest):
+            events = chat.aiter_events(events)
+
+        response = StreamingHttpResponse(events, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # keep proxies from buffering the stream
+        return response
 
-            if not check_password(old_password, user_doc["password"]):
-                return Response({"error": "Incorrect current password"}, status=400)
 
-            if check_password(new_password, user_doc["password"]):
-                return Response({"error": "New password cannot be same as old password"}, status=400)
+# =====================================================
+# 🔹 LEARNER PROGRESS SYNC (batched deltas, one round trip)
+# =====================================================
+class ProgressSyncAPIView(APIView):
+    """Applies a batch of progress deltas and returns what changed since the client's version"""
+    permission_classes = [IsAuthenticated]
 
-            hashed_new = make_password(new_password)
-            settings.LOGIN_COLLECTION.update_one(
-                {"email": email}, {"$set": {"password": hashed_new}}
+    def post(self, request):
+        try:
+            result = progress.sync(
+                request.user.email,
+                request.data.get("client_id"),
+                request.data.get("seq"),
+                request.data.get("since"),
+                request.data.get("deltas") or [],
             )
+        except progress.ProgressError as e:
+            return Response({"error": str(e)}, status=400)
 
-            return Response({"message": "Password updated successfully"}, status=200)
-
-        except Exception as e:
-            return Response({"error": f"Token validation failed: {str(e)}"}, status=401)
+        return Response(result, status=200)
 
 
 # =====================================================
-# 🔹 USER PROFILE API (Fetch logged-in user info)
+# 🔹 LEADERBOARD (cached pages + O(log n) rank lookups)
 # =====================================================
-class ProfileAPIView(APIView):
-    """Returns profile info of the logged-in user (requires JWT token)"""
+class LeaderboardAPIView(APIView):
+    """Returns a page of the cohort leaderboard with an ETag (requires JWT token)"""
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         try:
-            jwt_auth = JWTAuthentication()
-            header = jwt_auth.get_header(request)
-            raw_token = jwt_auth.get_raw_token(header)
-            validated_token = jwt_auth.get_validated_token(raw_token)
-            email = validated_token.get("email")
+            limit = min(int(request.query_params.get("limit", 20)), settings.LEADERBOARD_PAGE_MAX)
+            offset = max(int(request.query_params.get("offset", 0)), 0)
+        except ValueError:
+            return Response(json_api.constant(error="limit and offset must be integers"), status=400)
+
+        body, etag = leaderboard.get_board().page(max(limit, 1), offset)
+        if etag_matches(request, etag):
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(body, content_type="application/json")
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
+
+class LeaderboardRankAPIView(APIView):
+    """Returns the logged-in user's rank and score (requires JWT token)"""
+    permission_classes = [IsAuthenticated]
 
-            if not email:
-                return Response({"error": "Invalid token or email missing"}, status=401)
+    def get(self, request):
+        board = leaderboard.get_board()
+        position = board.board.rank(request.user.email)
+        return Response({
+            "rank": position[0] if position else None,
+            "score": position[1] if position else 0,
+            "total_users": len(board.board),
+        }, status=200)
 
-            user = settings.LOGIN_COLLECTION.find_one({"email": email})
-            if not user:
-                return Response({"error": "User not found"}, status=404)
-
-            return Response({
-                "username": user.get("username"),
-                "email": user.get("email"),
-                "created_at": (
-                    user.get("created_at").strftime("%Y-%m-%d %H:%M:%S")
-                    if user.get("created_at") else None
-                )
-            }, status=200)
-        except Exception as e:
-            return Response({"error": f"Profile fetch failed: {str(e)}"}, status=401)
+
+# =====================================================
+# 🔹 REQUEST BATCHING (several API calls, one round trip)
+# =====================================================
+class BatchAPIView(APIView):
+    """Runs several API calls for the logged-in user and returns all responses (requires JWT token)"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            items = batch.parse(request.data)
+        except batch.BatchError as e:
+            return Response({"error": str(e)}, status=400)
+
+        return Response({"responses": batch.run(request, items)}, status=200)
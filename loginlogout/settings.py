@@ -1,9 +1,15 @@
 from dotenv import load_dotenv
+import json
 import os
 import pymongo
 from pathlib import Path
 from datetime import timedelta
 
+from loginapp.metrics import MongoCommandTimer
+from loginapp.mongo_guard import GuardedCollection
+from loginapp.mongo_monitor import MongoCommandMonitor
+from loginapp.tracing import MongoTraceListener
+
 # === BASE DIRECTORY ===
 BASE_DIR = Path(__file__).resolve().parent.parent  # points to ...\login\loginlogout
 
@@ -12,10 +18,6 @@ BASE_DIR = Path(__file__).resolve().parent.parent  # points to ...\login\loginlo
 ENV_PATH = BASE_DIR / ".env"
 load_dotenv(ENV_PATH)
 
-# === LOG INFO ONCE ===
-if os.environ.get('RUN_MAIN') != 'true':
-    print(f"✅ .env loaded from: {ENV_PATH} (exists={ENV_PATH.exists()})")
-
 # === DJANGO CORE SETTINGS ===
 SECRET_KEY = 'django-insecure-#%^m(!7e)((2^ew5je+ah8#!$)vjoq_f1*_r)e8dgx%c1xjwzr'
 DEBUG = True
@@ -39,14 +41,18 @@ INSTALLED_APPS = [
 # === REST FRAMEWORK CONFIG ===
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'loginapp.authentication.ClaimsJWTAuthentication',  # user from the email claim, no DB query
     ),
+    # JSON only (no browsable API): orjson rendering/parsing, no Accept negotiation
+    'DEFAULT_RENDERER_CLASSES': ('loginapp.json_api.ORJSONRenderer',),
+    'DEFAULT_PARSER_CLASSES': ('loginapp.json_api.ORJSONParser',),
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'loginapp.json_api.JSONOnlyNegotiation',
 }
 
 AUTH_USER_MODEL = 'loginapp.User'
 
 # === EMAIL SETTINGS ===
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = 'loginapp.metrics.TimedEmailBackend'  # SMTP, timed for /metrics
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -54,9 +60,6 @@ EMAIL_HOST_USER = 'kunalsaraswat30@gmail.com'
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_PASSWORD")
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
-if not EMAIL_HOST_PASSWORD:
-    print("⚠️ Warning: EMAIL_PASSWORD not found in .env file.")
-
 # === AUTHENTICATION BACKENDS ===
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
@@ -73,6 +76,29 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+MIDDLEWARE.insert(0, "loginapp.metrics.RequestMetricsMiddleware")  # outermost: times the whole request
+MIDDLEWARE.insert(1, "loginapp.tracing.TracingMiddleware")
+MIDDLEWARE.insert(2, "loginapp.mongo_monitor.MongoBudgetMiddleware")
+MIDDLEWARE.insert(3, "loginapp.profiling.ProfilingMiddleware")  # inactive unless PROFILE_TOKEN is set
+MIDDLEWARE.insert(4, "loginapp.log_pipeline.AccessLogMiddleware")
+MIDDLEWARE.insert(5, "loginapp.memory.MemoryTrackingMiddleware")
+MIDDLEWARE.insert(6, "loginapp.traffic_capture.TrafficCaptureMiddleware")  # inactive unless TRAFFIC_CAPTURE_ENABLED
+MIDDLEWARE.append("loginapp.mongo_guard.MongoDeadlineMiddleware")  # innermost: deadline + 503 for MongoUnavailable
+
+# API routes (api_urlpatterns in ROOT_URLCONF) skip the session/CSRF/auth/messages/clickjacking middleware;
+# served by loginapp.api_stack.SplitStackWSGIHandler. None runs the full stack everywhere.
+PAGE_ONLY_MIDDLEWARE = {
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+}
+API_MIDDLEWARE = (
+    [m for m in MIDDLEWARE if m not in PAGE_ONLY_MIDDLEWARE]
+    if os.getenv("LEAN_API_MIDDLEWARE", "1") == "1" else None
+)
 
 # === URL & TEMPLATES CONFIG ===
 ROOT_URLCONF = 'loginlogout.urls'
@@ -83,7 +109,7 @@ TEMPLATE_DIR = BASE_DIR / "loginlogout" / "templates"
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'loginapp.metrics.TimedDjangoTemplates',  # DjangoTemplates + render timing
         'DIRS': [TEMPLATE_DIR],  # ✅ Django can now find login.html
         'APP_DIRS': True,
         'OPTIONS': {
@@ -98,6 +124,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'loginlogout.wsgi.application'
+TEST_RUNNER = 'loginapp.test_runner.TestRunner'  # applies loginapp.test_runner.TEST_SETTINGS
 
 # === DATABASE (SQLite) ===
 DATABASES = {
@@ -111,22 +138,34 @@ DATABASES = {
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = os.getenv("DB_NAME", "TCL_Forge")
 
-if not MONGO_URI:
-    print("⚠️ Warning: MONGO_URI not found in .env file.")
-
+MONGO_CLIENT = db = None
 try:
-    client = pymongo.MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
-    db = client[DB_NAME]
-    client.server_info()  # test connection
-    print("🟢 MongoDB connected successfully.")
+    MONGO_CLIENT = pymongo.MongoClient(
+        MONGO_URI, serverSelectionTimeoutMS=2000, event_listeners=[MongoCommandTimer(), MongoCommandMonitor(), MongoTraceListener()]
+    )
+    db = MONGO_CLIENT[DB_NAME]
+    MONGO_CLIENT.server_info()  # test connection
+    MONGO_CONNECT_ERROR = None
 except Exception as e:
-    print(f"🔴 MongoDB connection failed: {e}")
-    db = None
+    MONGO_CONNECT_ERROR = str(e)  # logged at startup by LoginappConfig.ready(); the client keeps reconnecting
 
 # === COLLECTIONS ===
-if db is not None:
-    LOGIN_COLLECTION = db["Login"]
-    RESET_OTP_COLLECTION = db["password_reset_otp"]
+# Always defined: while Mongo is unreachable, calls fail fast with a 503 (loginapp/mongo_guard.py).
+LOGIN_COLLECTION = GuardedCollection.from_db(db, "Login")
+RESET_OTP_COLLECTION = GuardedCollection.from_db(db, "password_reset_otp")
+PROGRESS_COLLECTION = GuardedCollection.from_db(db, "learner_progress")
+REFRESH_FAMILY_COLLECTION = GuardedCollection.from_db(db, "refresh_token_families")   # /refresh rotation
+AUDIT_COLLECTION = GuardedCollection.from_db(db, "audit_events")   # written behind by loginapp/audit.py
+SCHEDULER_LOCK_COLLECTION = GuardedCollection.from_db(db, "scheduler_locks")   # leader lease
+
+# === PASSWORD HASHERS ===
+PASSWORD_HASHERS = [
+    'loginapp.metrics.TimedPBKDF2PasswordHasher',  # same "pbkdf2_sha256" hashes, timed for /metrics
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
 
 # === PASSWORD VALIDATORS ===
 AUTH_PASSWORD_VALIDATORS = []  # disabled for simplicity
@@ -142,9 +181,10 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # === SIMPLE JWT CONFIG ===
 SIMPLE_JWT = {
-    'ACCESS_TOKEN_LIFETIME': timedelta(hours=12),
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=int(os.getenv("ACCESS_TOKEN_MINUTES", 12 * 60))),  # /refresh renews
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
 }
+PROFILE_CLAIMS_IN_TOKEN = os.getenv("PROFILE_CLAIMS_IN_TOKEN") == "1"   # /me answers from access-token claims
 
 # === CORS SETTINGS ===
 CORS_ALLOW_ALL_ORIGINS = True  # ✅ allow requests from your local frontend
@@ -153,7 +193,179 @@ CORS_ALLOW_HEADERS = [
     "authorization",
 ]
 
-# === FINAL CONFIRMATION ===
-if os.environ.get('RUN_MAIN') != 'true':
-    print(f"✅ Templates Path: {TEMPLATE_DIR}")
-    print("✅ Django settings configured successfully.")
+# === TCL SYNTAX CHECK (/check) ===
+TCL_CHECK_MAX_SESSIONS = 512     # editor sessions whose last parse is kept
+TCL_CHECK_MAX_CHARS = 100_000    # larger scripts are rejected with 413
+
+# === CHATBOT PROXY (/chat) ===
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+CHAT_MODELS = [
+    "nvidia/nemotron-nano-9b-v2:free",
+    "qwen/qwen3-4b:free",
+    "mistralai/mistral-small-3.2-24b-instruct:free",
+    "openai/gpt-oss-20b:free",
+]
+CHAT_MAX_TOKENS = 500
+CHAT_MAX_QUESTION_CHARS = 4000
+CHAT_HISTORY_TOKEN_BUDGET = 2000   # prompt tokens kept from the conversation
+CHAT_CACHE_TTL = 60 * 60           # seconds a cached answer stays valid (questions without history only)
+CHAT_CACHE_MAX_ENTRIES = 1000
+
+# === CHATBOT RETRIEVAL (notes + interview prep) ===
+RETRIEVAL_ENABLED = True
+RETRIEVAL_INDEX_DIR = BASE_DIR / "retrieval_index"   # memory-mapped .npy files
+RETRIEVAL_TOP_K = 3
+RETRIEVAL_DIRECT_COVERAGE = 0.9    # share of query terms a match must cover to skip the model
+RETRIEVAL_DIRECT_MARGIN = 1.2      # ...and how far it must lead the runner-up
+RETRIEVAL_CONTEXT_COVERAGE = 0.5   # weaker matches still ground the model's answer
+
+# === LEARNER PROGRESS SYNC (/progress/sync) ===
+PROGRESS_MAX_DELTAS = 200           # deltas accepted per batch
+PROGRESS_MAX_VALUE_CHARS = 20_000   # longest saved snippet / quiz result
+
+# === LEADERBOARD (/leaderboard) ===
+LEADERBOARD_MAX_SCORE = 10_000       # total challenge score is clamped to this range
+LEADERBOARD_REFRESH_SECONDS = 5      # how often a worker catches up on other workers' writes
+LEADERBOARD_PAGE_MAX = 100
+
+# === REQUEST METRICS (/metrics) ===
+METRICS_DIR = os.getenv("METRICS_DIR")       # default: /dev/shm/tclforge-metrics (per-worker mmap files)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")   # /metrics requires "Authorization: Bearer <token>"; 403 while unset
+
+# === MONGO ROUND TRIPS + SLOW COMMANDS ===
+MONGO_SLOW_COMMAND_MS = 100                 # log commands slower than this, with filter shape + plan
+MONGO_ROUND_TRIP_DEFAULT_BUDGET = 4         # routes not listed below
+MONGO_ROUND_TRIP_BUDGETS = {
+    "signup": 2,
+    "login": 2,
+    "refresh": 2,
+    "send-otp": 3,
+    "reset-password": 5,
+    "auth-reset-password": 3,
+    "me": 1,
+    "progress/sync": 2,
+    "leaderboard": 2,
+    "leaderboard/me": 2,
+    "batch": 16,    # BATCH_MAX_REQUESTS sub-requests x 2
+}
+MONGO_ROUND_TRIP_STRICT = False             # raise instead of warn; on under `manage.py test` (loginapp.test_runner)
+
+# === MONGO DEADLINES + CIRCUIT BREAKER ===
+MONGO_REQUEST_DEADLINE_MS = 3000     # shared by all Mongo calls of a request (-> maxTimeMS / socket timeouts)
+MONGO_OPERATION_TIMEOUT_MS = 2000    # per call made outside a request
+MONGO_BREAKER_FAILURES = 5           # consecutive connection errors / timeouts that open the breaker
+MONGO_BREAKER_RESET_SECONDS = 10     # open time before a half-open probe is let through
+
+# === REQUEST BATCHING (/batch, loginapp/batch.py) ===
+BATCH_PATHS = {"/me", "/leaderboard", "/leaderboard/me", "/progress/sync", "/check"}   # cheap routes only
+BATCH_MAX_REQUESTS = 8              # sub-requests per batch
+BATCH_MAX_BODY_BYTES = 64 * 1024    # sub-request bodies, all together
+BATCH_CONCURRENCY = 4               # per-worker threads running batched GETs
+
+# === AUDIT EVENTS (loginapp/audit.py, write-behind) ===
+AUDIT_ENABLED = True
+AUDIT_BATCH_SIZE = 200              # events per insert_many
+AUDIT_FLUSH_INTERVAL = 2.0          # seconds between background flushes
+AUDIT_MAX_QUEUE = 10_000            # events buffered per worker before new ones are dropped
+AUDIT_SPILL_DIR = BASE_DIR / "logs" / "audit-spill"   # batches kept here while Mongo is down
+AUDIT_COUNTER_MINUTES = 60          # per-minute counts kept for /debug/audit
+
+# === PERIODIC JOBS (loginapp/scheduler.py, jobs in loginapp/jobs.py) ===
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"   # started per worker by gunicorn.conf.py; off under test
+SCHEDULED_JOBS = {                  # job name -> interval in seconds; unlisted jobs never run
+    "prune_otps": 15 * 60,
+    "flush_expired_tokens": 6 * 60 * 60,
+    "ensure_indexes": 6 * 60 * 60,
+    "rebuild_retrieval_index": 10 * 60,
+    "warm_leaderboard": 60,
+    "warm_retrieval": 5 * 60,
+}
+SCHEDULER_TICK_SECONDS = 15         # lease renewal + due-job check
+SCHEDULER_LEASE_SECONDS = 60        # leader lease; another worker takes over this long after the leader died
+SCHEDULER_JITTER = 0.1              # runs are interval +/- 10% apart
+SCHEDULER_START_JITTER = 30         # first runs spread over this many seconds after the worker boots
+SCHEDULER_HOST_LOCK_DIR = BASE_DIR / "host_locks"   # per_host jobs: one lock file per job, shared by this host's workers
+OTP_RETENTION_SECONDS = 60 * 60     # OTPs expire after 5 minutes; prune_otps deletes them after this
+
+# === USER DOCUMENT CACHE (loginapp/user_cache.py) ===
+USER_CACHE_ENABLED = True
+USER_CACHE_TTL = 30                 # seconds a cached user is served without asking Mongo
+USER_CACHE_MAX_ENTRIES = 10_000     # per worker, LRU beyond that
+
+# === ON-DEMAND PROFILING (X-Profile header) ===
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")   # requests sending "X-Profile: <token>" are profiled
+PROFILE_DIR = BASE_DIR / "profiles"          # collapsed-stack files, see `manage.py profiles`
+PROFILE_MAX_FILES = 50                       # ring size; oldest profiles are deleted
+PROFILE_SAMPLE_INTERVAL = 0.001              # seconds between stack samples
+
+# === REQUEST TRACING (OTLP/JSON lines) ===
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))  # share of new traces recorded
+# REMOTE_ADDRs whose incoming traceparent (and its sampled flag) is followed; others get TRACE_SAMPLE_RATE
+TRACE_TRUSTED_UPSTREAMS = [addr for addr in os.getenv("TRACE_TRUSTED_UPSTREAMS", "").split(",") if addr]
+TRACE_DIR = BASE_DIR / "traces"          # spans-<pid>.jsonl, readable by the collector's otlpjsonfile receiver
+TRACE_BATCH_SIZE = 512                   # spans per written line
+TRACE_EXPORT_INTERVAL = 2.0              # seconds between background flushes
+TRACE_MAX_QUEUE = 10_000                 # spans buffered before new ones are dropped
+TRACE_MAX_BYTES = 50 * 1024 * 1024       # rotate spans-<pid>.jsonl at this size
+TRACE_BACKUP_COUNT = 5
+
+# === MEMORY TRACKING (/debug/memory) ===
+DIAGNOSTICS_TOKEN = os.getenv("DIAGNOSTICS_TOKEN")   # required by the /debug/* endpoints
+MEMORY_SAMPLE_EVERY = 500                 # requests between RSS / tracemalloc samples
+MEMORY_TRACEMALLOC_FRAMES = int(os.getenv("MEMORY_TRACEMALLOC_FRAMES", "0"))  # 0 = RSS only (tracemalloc costs ~2x)
+MEMORY_GROWTH_WARN_MB = 50                # warn when RSS grows more than this between samples
+
+# === TRAFFIC CAPTURE (for benchmarks.replay) ===
+TRAFFIC_CAPTURE_ENABLED = os.getenv("TRAFFIC_CAPTURE_ENABLED") == "1"   # writes logs/capture-<pid>.tsv, metadata only
+
+# === FAULT INJECTION (/debug/faults, see loginapp/faults.py) ===
+FAULT_INJECTION_ENABLED = os.getenv("FAULT_INJECTION_ENABLED") == "1"   # wraps collections + email; never in production
+FAULT_INJECTION = json.loads(os.getenv("FAULT_INJECTION", "{}"))        # e.g. {"mongo.Login": {"latency_ms": 500}}
+
+# === LOGGING (queued, JSON lines) ===
+LOG_DIR = BASE_DIR / "logs"
+LOG_MAX_BYTES = 20 * 1024 * 1024     # rotate each file at this size (files are per process: access-<pid>.jsonl, ...)
+LOG_BACKUP_COUNT = 5
+LOG_SAMPLING = {                     # share of sub-WARNING records kept per logger
+    "tclforge.access": float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "1.0")),
+}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "filters": {
+        "sampling": {"()": "loginapp.log_pipeline.SamplingFilter", "rates": LOG_SAMPLING},
+    },
+    "handlers": {
+        "access": {
+            "class": "loginapp.log_pipeline.QueuedFileHandler",
+            "filename": LOG_DIR / "access.jsonl",
+            "max_bytes": LOG_MAX_BYTES,
+            "backup_count": LOG_BACKUP_COUNT,
+            "filters": ["sampling"],
+        },
+        "app": {
+            "class": "loginapp.log_pipeline.QueuedFileHandler",
+            "filename": LOG_DIR / "app.jsonl",
+            "max_bytes": LOG_MAX_BYTES,
+            "backup_count": LOG_BACKUP_COUNT,
+            "filters": ["sampling"],
+        },
+        "capture": {
+            "class": "loginapp.log_pipeline.QueuedFileHandler",
+            "filename": LOG_DIR / "capture.tsv",
+            "max_bytes": LOG_MAX_BYTES,
+            "backup_count": LOG_BACKUP_COUNT,
+            "plain": True,
+        },
+        "console": {"class": "loginapp.log_pipeline.QueuedStreamHandler", "level": "WARNING"},
+    },
+    "loggers": {
+        "tclforge.access": {"handlers": ["access"], "level": "INFO", "propagate": False},
+        "tclforge.capture": {"handlers": ["capture"], "level": "INFO", "propagate": False},
+        "tclforge": {"handlers": ["app", "console"], "level": "INFO", "propagate": False},
+        "loginapp": {"handlers": ["app", "console"], "level": "INFO", "propagate": False},
+        "django": {"handlers": ["app", "console"], "level": "INFO", "propagate": False},
+    },
+}
@@ -0,0 +1,157 @@
+// =============================
+// 🔄 Progress Sync (pending changes go up in batched requests)
+// Shared by index.html and tcl_challenges.html; served at /progress_sync.js
+// =============================
+const ProgressSync = {
+  baseURL: (window.location.hostname === 'localhost' || window.location.hostname === '127.0.0.1')
+    ? 'http://127.0.0.1:8000'
+    : 'https://tclforge.onrender.com',
+  maxDeltas: 200,          // PROGRESS_MAX_DELTAS on the server
+  keepaliveBytes: 60000,   // browsers refuse keepalive bodies over 64 KB
+  timer: null,
+
+  clientId() {
+    let id = localStorage.getItem('progressClientId');
+    if (!id) {
+      id = Math.random().toString(36).slice(2) + Date.now().toString(36);
+      localStorage.setItem('progressClientId', id);
+    }
+    return id;
+  },
+
+  queue(delta) {
+    const outbox = JSON.parse(localStorage.getItem('progressOutbox') || '[]');
+    outbox.push(delta);
+    localStorage.setItem('progressOutbox', JSON.stringify(outbox));
+    this.schedule(2000);
+  },
+
+  schedule(delay) {
+    clearTimeout(this.timer);
+    this.timer = setTimeout(() => this.flush(), delay);
+  },
+
+  // Upload whatever this browser recorded before it ever synced
+  seedFromLocal() {
+    if (localStorage.getItem('progressVersion')) return;
+    Object.entries(JSON.parse(localStorage.getItem('quizScores') || '{}'))
+      .forEach(([key, value]) => this.queue({ field: 'quiz_scores', key, value }));
+    Object.entries(JSON.parse(localStorage.getItem('savedSnippets') || '{}'))
+      .forEach(([key, value]) => this.queue({ field: 'snippets', key, value }));
+    JSON.parse(localStorage.getItem('viewedConcepts') || '[]')
+      .forEach(value => this.queue({ field: 'viewed_concepts', value }));
+    Object.keys(localStorage).forEach(name => {
+      const m = name.match(/^(\w+)-(unlocked|score)-(\d+)$/);
+      if (!m) return;
+      if (m[2] === 'unlocked') this.queue({ field: 'unlocked', value: `${m[1]}-${m[3]}` });
+      else this.queue({ field: 'challenge_scores', key: `${m[1]}-${m[3]}`, value: Number(localStorage.getItem(name)) });
+    });
+  },
+
+  // Next batch from the outbox: at most maxDeltas, and small enough for a keepalive request when possible
+  take() {
+    const outbox = JSON.parse(localStorage.getItem('progressOutbox') || '[]');
+    let count = 0, bytes = 0;
+    while (count < outbox.length && count < this.maxDeltas) {
+      bytes += JSON.stringify(outbox[count]).length + 1;
+      if (count > 0 && bytes > this.keepaliveBytes) break;
+      count++;
+    }
+    localStorage.setItem('progressOutbox', JSON.stringify(outbox.slice(count)));
+    return outbox.slice(0, count);
+  },
+
+  // A 4xx means the server will never accept this batch: retry its halves, and drop a single bad change
+  reject(inflight, status) {
+    localStorage.removeItem('progressInflight');
+    if (!inflight.deltas.length) {
+      localStorage.removeItem('progressVersion');   // bad version: start over with a full sync
+      return;
+    }
+    if (inflight.deltas.length === 1) {
+      console.warn(`Progress change rejected (${status}), dropped:`, inflight.deltas[0]);
+      return;
+    }
+    const half = Math.ceil(inflight.deltas.length / 2);
+    const outbox = JSON.parse(localStorage.getItem('progressOutbox') || '[]');
+    localStorage.setItem('progressInflight', JSON.stringify({ seq: inflight.seq, deltas: inflight.deltas.slice(0, half) }));
+    localStorage.setItem('progressOutbox', JSON.stringify([...inflight.deltas.slice(half), ...outbox]));
+  },
+
+  async flush() {
+    const token = localStorage.getItem('access');
+    if (!token) return null;
+    clearTimeout(this.timer);
+
+    // A batch keeps its seq until the server answers for it, so retries are never applied twice
+    let inflight = JSON.parse(localStorage.getItem('progressInflight') || 'null');
+    if (!inflight) {
+      const deltas = this.take();
+      const seq = Number(localStorage.getItem('progressSeq') || 0) + 1;
+      inflight = deltas.length ? { seq, deltas } : { seq: 0, deltas: [] };
+      if (deltas.length) {
+        localStorage.setItem('progressSeq', seq);
+        localStorage.setItem('progressInflight', JSON.stringify(inflight));
+      }
+    }
+
+    const body = JSON.stringify({
+      client_id: this.clientId(),
+      seq: inflight.seq,
+      since: localStorage.getItem('progressVersion'),
+      deltas: inflight.deltas
+    });
+    let res;
+    try {
+      res = await fetch(`${this.baseURL}/progress/sync`, {
+        method: 'POST',
+        keepalive: body.length <= this.keepaliveBytes,
+        headers: { 'Content-Type': 'application/json', 'Authorization': 'Bearer ' + token },
+        body
+      });
+    } catch {
+      return null;   // network error: the batch stays in flight for the next flush
+    }
+    if (res.status >= 500 || res.status === 401 || res.status === 403 || res.status === 429) return null;
+    if (!res.ok) {
+      this.reject(inflight, res.status);
+      this.schedule(0);
+      return null;
+    }
+
+    const data = await res.json();
+    localStorage.removeItem('progressInflight');
+    if (data.version) localStorage.setItem('progressVersion', data.version);
+    this.apply(data);
+    if (localStorage.getItem('progressOutbox') !== '[]') return (await this.flush()) || data;
+    return data;
+  },
+
+  // Merge the server's changes into localStorage (server wins for replaced fields)
+  apply(data) {
+    const changes = data.changes || {};
+    const replace = data.replace || [];
+    const mergeMap = (storageKey, field) => {
+      if (!changes[field]) return;
+      const current = replace.includes(field) ? {} : JSON.parse(localStorage.getItem(storageKey) || '{}');
+      localStorage.setItem(storageKey, JSON.stringify({ ...current, ...changes[field] }));
+    };
+    mergeMap('quizScores', 'quiz_scores');
+    mergeMap('savedSnippets', 'snippets');
+    if (changes.viewed_concepts) {
+      const current = replace.includes('viewed_concepts') ? [] : JSON.parse(localStorage.getItem('viewedConcepts') || '[]');
+      localStorage.setItem('viewedConcepts', JSON.stringify([...new Set([...current, ...changes.viewed_concepts])]));
+    }
+    Object.entries(changes.challenge_scores || {}).forEach(([key, value]) => {
+      const [type, idx] = key.split('-');
+      localStorage.setItem(`${type}-score-${idx}`, value);
+    });
+    (changes.unlocked || []).forEach(key => {
+      const [type, idx] = key.split('-');
+      localStorage.setItem(`${type}-unlocked-${idx}`, 'true');
+    });
+  }
+};
+window.addEventListener('pagehide', () => {
+  if (localStorage.getItem('progressOutbox') !== '[]' && localStorage.getItem('progressOutbox')) ProgressSync.flush();
+});
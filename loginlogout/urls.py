@@ -3,7 +3,7 @@ URL configuration for TCL Forge (loginlogout project).
 
 Includes:
 - Frontend pages (HTML)
-- API endpoints (Auth, OTP, Reset, Profile)
+- API endpoints (Auth + token refresh, OTP, Reset, Profile, Tcl syntax check, Chatbot, Progress, Leaderboard, Batch, Metrics)
 - Static/Notes file serving (for PDFs, docs, etc.)
 - Health-check endpoint
 """
@@ -22,11 +22,22 @@ from loginapp.views import (
     SignUpAPIView,
     LoginAPIView,
     LogoutAPIView,
+    RefreshAPIView,
     SendOTPAPIView,
     ResetPasswordAPIView,
     AuthenticatedResetPasswordView,
     ProfileAPIView,
+    TclCheckAPIView,
+    ChatAPIView,
+    ProgressSyncAPIView,
+    LeaderboardAPIView,
+    LeaderboardRankAPIView,
+    BatchAPIView,
 )
+from loginapp.audit import audit_view
+from loginapp.faults import faults_view
+from loginapp.memory import memory_view
+from loginapp.metrics import metrics_view
 
 
 # ===========================================================
@@ -89,10 +100,16 @@ def serve_notes_file(request, filename):
     raise Http404("File not found")
 
 
+def progress_sync_script(request):
+    """Client-side progress sync shared by index.html and tcl_challenges.html"""
+    script_path = os.path.join(settings.BASE_DIR, "loginlogout", "templates", "progress_sync.js")
+    return FileResponse(open(script_path, "rb"), content_type="text/javascript")
+
+
 # ===========================================================
 # 🔹 URL PATTERNS
 # ===========================================================
-urlpatterns = [
+page_urlpatterns = [
     # Frontend Pages
     path("", home, name="frontend"),
     path("login.html", login_page, name="login_html"),
@@ -103,17 +120,22 @@ urlpatterns = [
     path("TCL_Interview_Pre.html", interview_prep_page, name="tcl_interview_pre"),
     path("notes.html", notes_page, name="notes"),
     path("test.html", test_page, name="test_page"),
+    path("progress_sync.js", progress_sync_script, name="progress_sync_js"),
 
     # 🔹 Serve PDFs inside /notes/
     path("notes/<str:filename>", serve_notes_file, name="serve_notes_file"),
 
     # Admin Panel
     path("admin/", admin.site.urls),
+]
 
+# JSON APIs: served with the lean API_MIDDLEWARE stack (loginapp.api_stack)
+api_urlpatterns = [
     # Auth APIs
     path("signup", SignUpAPIView.as_view(), name="signup"),
     path("login", LoginAPIView.as_view(), name="login"),
     path("logout", LogoutAPIView.as_view(), name="logout"),
+    path("refresh", RefreshAPIView.as_view(), name="refresh"),
 
     # OTP / Reset APIs
     path("send-otp", SendOTPAPIView.as_view(), name="send_otp"),
@@ -122,8 +144,30 @@ urlpatterns = [
 
     # User Profile
     path("me", ProfileAPIView.as_view(), name="profile"),
+
+    # Live Runner
+    path("check", TclCheckAPIView.as_view(), name="tcl_check"),
+
+    # Chatbot
+    path("chat", ChatAPIView.as_view(), name="chat"),
+
+    # Learner Progress
+    path("progress/sync", ProgressSyncAPIView.as_view(), name="progress_sync"),
+    path("leaderboard", LeaderboardAPIView.as_view(), name="leaderboard"),
+    path("leaderboard/me", LeaderboardRankAPIView.as_view(), name="leaderboard_rank"),
+
+    # Several API calls in one request
+    path("batch", BatchAPIView.as_view(), name="batch"),
+
+    # Observability
+    path("metrics", metrics_view, name="metrics"),
+    path("debug/memory", memory_view, name="debug_memory"),
+    path("debug/faults", faults_view, name="debug_faults"),
+    path("debug/audit", audit_view, name="debug_audit"),
 ]
 
+urlpatterns = page_urlpatterns + api_urlpatterns
+
 
 # ===========================================================
 # 🔹 MEDIA / STATIC SERVE (during development)
@@ -9,7 +9,7 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
 
 import os
 
-from django.core.wsgi import get_wsgi_application
+from loginapp.api_stack import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loginlogout.settings')
 
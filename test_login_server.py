@@ -6,7 +6,10 @@ import webbrowser
 import signal
 import time
 from datetime import datetime
+import atexit
+import logging
 import queue
+from logging.handlers import QueueHandler, QueueListener
 import psutil
 
 # PyQt6 imports
@@ -64,6 +67,26 @@ print(f"[INFO] Using project path: {project_path}")
 os.chdir(project_path)
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "loginlogout.settings")
 
+# === 3. CONSOLE LOG (queued, so the GUI thread never blocks on stdout) ===
+console_queue = queue.SimpleQueue()
+console_logger = logging.getLogger("tclforge.controller")
+console_logger.setLevel(logging.INFO)
+console_logger.propagate = False
+console_logger.addHandler(QueueHandler(console_queue))
+_console_handler = logging.StreamHandler(sys.stdout)
+_console_handler.setFormatter(logging.Formatter("\n%(message)s"))
+console_listener = QueueListener(console_queue, _console_handler)
+console_listener.start()
+atexit.register(console_listener.stop)
+
+LOG_LEVELS = {
+    "info": logging.INFO,
+    "success": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "system": logging.INFO
+}
+
 # === Custom Styled Button ===
 class EDAButton(QPushButton):
     """Professional EDA-style button with hover effects"""
@@ -625,10 +648,8 @@ class DjangoServerController(QMainWindow):
         self.log_text.moveCursor(QTextCursor.MoveOperation.End)
         self.log_text.ensureCursorVisible()
 
-        # === Console logging ===
-        console_line = f"\n[{timestamp}] {prefix} {safe_message}"
-        sys.stdout.write(console_line + "\n")  # guaranteed newline separation
-        sys.stdout.flush()
+        # === Console logging (written by the queue listener thread) ===
+        console_logger.log(LOG_LEVELS.get(log_type, logging.INFO), "[%s] %s %s", timestamp, prefix, safe_message)
 
     def update_stats(self):
         """Update statistics panel"""